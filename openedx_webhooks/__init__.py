@@ -69,6 +69,11 @@ def create_celery_app(app=None, config="worker"):
     if os.environ.get("SENTRY_DSN", ""):
         sentry_sdk.init(integrations=[CeleryIntegration(), FlaskIntegration()])
 
+    from . import settings
+    from .cassette import save_recording
+    from .metrics import push_metrics_if_due, task_metrics
+    from .retry import retry_budget
+
     app = app or create_app(config=config)
     celery.main = app.import_name
     celery.conf.update(app.config)
@@ -80,7 +85,7 @@ def create_celery_app(app=None, config="worker"):
             else:
                 wsgi_environ = None
             try:
-                with app.app_context():
+                with app.app_context(), retry_budget(settings.RETRY_TASK_BUDGET), task_metrics(self.name):
                     if wsgi_environ:
                         with app.request_context(wsgi_environ):
                             return self.run(*args, **kwargs)
@@ -90,6 +95,9 @@ def create_celery_app(app=None, config="worker"):
                 # By default, celery will store an exception if it occurs,
                 # but we don't want the exception object, we want a traceback.
                 return traceback.format_exc()
+            finally:
+                push_metrics_if_due()
+                save_recording()
 
     celery.Task = ContextTask
     return celery
@@ -2,45 +2,229 @@
 Create authenticated sessions for access to GitHub and Jira.
 """
 
+import contextlib
+import os
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional
+
 import requests
+from requests.adapters import HTTPAdapter
 from urlobject import URLObject
 
-from openedx_webhooks import settings
+from openedx_webhooks import cassette, metrics, settings
+from openedx_webhooks.http_cache import ConditionalRequestCache
+from openedx_webhooks.rate_limit import RateLimitGovernor, governor
+from openedx_webhooks.single_flight import SingleFlight, request_key
+from openedx_webhooks.throttle import Throttle, throttles
 
 
 class BaseUrlSession(requests.Session):
     """
     A requests Session class that applies a base URL to the requested URL.
+
+    If `http_cache` is set, GET requests are revalidated against it with
+    conditional requests.  If `rate_limit_governor` is set, it sees every
+    response, and can delay requests.  If `throttle` is set, requests wait
+    for it, and it sees every response.  If `single_flight` is set, identical
+    GET requests made at the same time by different threads are made once.
+    If `service` is set, metrics are recorded for every HTTP call.
     """
     def __init__(self, base_url):
         super().__init__()
         self.base_url = URLObject(base_url)
+        self.service: Optional[str] = None
+        self.http_cache: Optional[ConditionalRequestCache] = None
+        self.rate_limit_governor: Optional[RateLimitGovernor] = None
+        self.throttle: Optional[Throttle] = None
+        self.single_flight: Optional[SingleFlight] = None
 
     def request(self, method, url, data=None, headers=None, **kwargs):
-        return super().request(
-            method=method,
-            url=self.base_url.relative(url),
-            data=data,
-            headers=headers,
-            **kwargs
-        )
+        url = self.base_url.relative(url)
+        if self.single_flight is not None and data is None:
+            key = request_key(method, url, dict(kwargs, headers=headers))
+            if key is not None:
+                return self.single_flight.do(
+                    key,
+                    lambda: self._request(method, url, headers=headers, **kwargs),
+                )
+        return self._request(method, url, data=data, headers=headers, **kwargs)
+
+    def _request(self, method, url, data=None, headers=None, **kwargs):
+        throttle = self.throttle if settings.THROTTLE_ENABLED else None
+        # The throttle is applied here rather than in `send`, so that
+        # following a redirect doesn't need a second slot.
+        with throttle.request_slot(method, url) if throttle else contextlib.nullcontext():
+            response = super().request(
+                method=method,
+                url=url,
+                data=data,
+                headers=headers,
+                **kwargs
+            )
+        if throttle is not None:
+            throttle.observe(response)
+        return response
+
+    def send(self, request, **kwargs):
+        if self.rate_limit_governor is not None:
+            self.rate_limit_governor.wait_for_budget(request.url)
+        cache = self.http_cache
+        if cache is not None and (request.method != "GET" or kwargs.get("stream")):
+            cache = None
+        entry = cache.prepare(request) if cache is not None else None
+        start = time.monotonic()
+        response = super().send(request, **kwargs)
+        if self.service is not None:
+            metrics.record_request(
+                self.service, request, response, time.monotonic() - start, stream=kwargs.get("stream", False),
+            )
+        if self.rate_limit_governor is not None:
+            self.rate_limit_governor.observe(response)
+        if cache is not None:
+            response = cache.update(request, response, entry)
+        return response
+
+
+class SessionManager:
+    """
+    Keep one session per configuration for the life of the process.
+
+    Sessions hold keep-alive connection pools, so re-using them saves a TCP
+    and TLS handshake on every request.  Sessions are shared by all threads
+    in a process (urllib3's pools are thread-safe), but are never shared
+    across a fork: a forked child (a Celery prefork worker for example) makes
+    its own sessions rather than using sockets owned by its parent.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[Hashable, requests.Session] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def get(self, key: Hashable, make_session: Callable[[], requests.Session]) -> requests.Session:
+        """
+        Get the session for `key`, calling `make_session` to create it if needed.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                # We've been forked, the sessions belong to our parent.
+                self._sessions = {}
+                self._pid = os.getpid()
+            session = self._sessions.get(key)
+            if session is None:
+                session = make_session()
+                mount_pooled_adapters(session)
+                self._sessions[key] = session
+        return session
+
+    def reset(self) -> None:
+        """
+        Forget all the sessions, so that new ones will be created.
+        """
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+    def all(self) -> List[requests.Session]:
+        """All of the current sessions."""
+        with self._lock:
+            return list(self._sessions.values())
+
+    def after_fork(self) -> None:
+        """
+        Called in a forked child: drop the parent's sessions without closing them.
+
+        The lock is replaced too, since another thread could have been holding
+        it at the moment of the fork.
+        """
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._pid = os.getpid()
+
+
+def mount_pooled_adapters(session: requests.Session) -> None:
+    """
+    Mount HTTP adapters with our configured connection pool sizes.
+
+    If HTTP_CASSETTE_MODE is set, the adapters record to or replay from a
+    cassette.
+    """
+    adapter = cassette.wrap_adapter(HTTPAdapter(
+        pool_connections=settings.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+    ))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+sessions = SessionManager()
+
+
+def session_metrics():
+    """
+    A metrics collector for the conditional cache and single-flight counts.
+    """
+    cache_samples = []
+    flight_samples = []
+    for session in sessions.all():
+        service = getattr(session, "service", None)
+        if service is None:
+            continue
+        if session.http_cache is not None:
+            for result, count in session.http_cache.stats().items():
+                cache_samples.append(({"service": service, "result": result}, count))
+        if session.single_flight is not None:
+            for result, count in session.single_flight.stats().items():
+                flight_samples.append(({"service": service, "result": result}, count))
+    yield (
+        "openedx_webhooks_http_cache_total", "counter",
+        "Conditional request cache hits, misses and stores.", cache_samples,
+    )
+    yield (
+        "openedx_webhooks_single_flight_total", "counter",
+        "GET requests made, and shared with concurrent identical requests.", flight_samples,
+    )
+
+
+metrics.registry.register_collector(session_metrics)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=sessions.after_fork)
 
 
 def get_jira_session():
     """
     Get the Jira session to use, in an easily test-patchable way.
     """
-    session = BaseUrlSession(base_url=settings.JIRA_SERVER)
-    session.auth = (settings.JIRA_USER_EMAIL, settings.JIRA_USER_TOKEN)
-    session.trust_env = False   # prevent reading the local .netrc
-    return session
+    def make_session():
+        session = BaseUrlSession(base_url=settings.JIRA_SERVER)
+        session.auth = (settings.JIRA_USER_EMAIL, settings.JIRA_USER_TOKEN)
+        session.trust_env = False   # prevent reading the local .netrc
+        session.service = "jira"
+        session.throttle = throttles["jira"]
+        session.single_flight = SingleFlight()
+        return session
+
+    key = ("jira", settings.JIRA_SERVER, settings.JIRA_USER_EMAIL, settings.JIRA_USER_TOKEN)
+    return sessions.get(key, make_session)
 
 
 def get_github_session():
     """
     Get the GitHub session to use.
     """
-    session = BaseUrlSession(base_url="https://api.github.com")
-    session.headers["Authorization"] = f"token {settings.GITHUB_PERSONAL_TOKEN}"
-    session.trust_env = False   # prevent reading the local .netrc
-    return session
+    def make_session():
+        session = BaseUrlSession(base_url="https://api.github.com")
+        session.headers["Authorization"] = f"token {settings.GITHUB_PERSONAL_TOKEN}"
+        session.trust_env = False   # prevent reading the local .netrc
+        session.service = "github"
+        session.http_cache = ConditionalRequestCache.from_settings()
+        session.rate_limit_governor = governor
+        session.throttle = throttles["github"]
+        session.single_flight = SingleFlight()
+        return session
+
+    key = ("github", settings.GITHUB_PERSONAL_TOKEN)
+    return sessions.get(key, make_session)
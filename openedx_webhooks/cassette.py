@@ -0,0 +1,254 @@
+"""
+Record real GitHub and Jira traffic, and replay it later.
+
+With HTTP_CASSETTE_MODE set to "record", every request our sessions make is
+sent for real, and the request and its response (with how long it took) are
+written to the cassette file at HTTP_CASSETTE_PATH after each Celery task and
+when the process exits.  Forked processes (Celery's prefork pool) record to
+their own files, with their pid added to the name: http-cassette-1234.json.gz.
+With "replay", requests are answered from the cassette instead, after waiting
+as long as the real response took (scaled by HTTP_CASSETTE_LATENCY_SCALE).
+
+The cassette sits below the session's caching, throttling and metrics, so a
+replay exercises all of them.  That lets us run pull_request_changed or
+rescan_repository offline against production-shaped traffic, and measure the
+effect of caching or concurrency changes without spending any rate limit.
+
+Cassettes are gzipped JSON.  Request headers aren't recorded, so they don't
+hold our credentials, but response bodies can have private data: treat
+cassettes with care.
+"""
+
+from __future__ import annotations
+
+import atexit
+import base64
+import collections
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+from time import sleep as cassette_sleep   # so that we can patch it for tests.
+from typing import Deque, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from openedx_webhooks import settings
+
+RECORD = "record"
+REPLAY = "replay"
+
+Key = Tuple[str, str, str]
+
+
+class CassetteMiss(Exception):
+    """A request in replay mode that isn't in the cassette."""
+
+
+def request_key(request: requests.PreparedRequest) -> Key:
+    """How requests are matched: method, URL, and a digest of the body."""
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return (request.method or "GET", request.url or "", hashlib.sha1(body).hexdigest())
+
+
+class Cassette:
+    """
+    Recorded request/response pairs.
+
+    Requests that were made more than once are replayed in the order they
+    were recorded.  Once they run out, the last one is repeated.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.interactions: List[Dict] = []
+        self.saved = 0
+        self.queues: Dict[Key, Deque[Dict]] = collections.defaultdict(collections.deque)
+        self.last: Dict[Key, Dict] = {}
+
+    def load(self) -> Cassette:
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            self.interactions = json.load(f)["interactions"]
+        for interaction in self.interactions:
+            self.queues[tuple(interaction["request"])].append(interaction)
+        return self
+
+    def save(self) -> None:
+        """Write the cassette, if anything has been recorded since it was last written."""
+        with self.lock:
+            if self.saved == len(self.interactions):
+                return
+            data = {"version": 1, "interactions": list(self.interactions)}
+            self.saved = len(self.interactions)
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    def save_at_exit(self) -> None:
+        # A forked child could run its parent's exit handlers, but must not
+        # write its copy of the parent's cassette.
+        if self.pid == os.getpid():
+            self.save()
+
+    def record(self, request: requests.PreparedRequest, response: requests.Response, seconds: float) -> None:
+        content = response.content or b""
+        try:
+            body = {"text": content.decode("utf-8")}
+        except UnicodeDecodeError:
+            body = {"base64": base64.b64encode(content).decode("ascii")}
+        interaction = {
+            "request": list(request_key(request)),
+            "status": response.status_code,
+            "reason": response.reason,
+            # The body is stored decoded, so the transfer headers would be wrong.
+            "headers": {
+                name: value for name, value in response.headers.items()
+                if name.lower() not in {"content-encoding", "content-length", "transfer-encoding"}
+            },
+            "body": body,
+            "seconds": round(seconds, 4),
+        }
+        with self.lock:
+            self.interactions.append(interaction)
+
+    def play(self, request: requests.PreparedRequest) -> Dict:
+        key = request_key(request)
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue:
+                self.last[key] = queue.popleft()
+            interaction = self.last.get(key)
+        if interaction is None:
+            raise CassetteMiss(f"No recorded response for {request.method} {request.url}")
+        return interaction
+
+
+class CassetteAdapter(BaseAdapter):
+    """
+    A transport adapter that records to, or replays from, a cassette.
+
+    In record mode, requests are sent with `real_adapter`.
+    """
+    def __init__(self, cassette: Cassette, mode: str, real_adapter: BaseAdapter, latency_scale: float = 1.0):
+        super().__init__()
+        self.cassette = cassette
+        self.mode = mode
+        self.real_adapter = real_adapter
+        self.latency_scale = latency_scale
+
+    def send(self, request, **kwargs):     # pylint: disable=arguments-differ
+        if self.mode == RECORD:
+            response = self.real_adapter.send(request, **kwargs)
+            self.cassette.record(request, response, response.elapsed.total_seconds())
+            return response
+
+        interaction = self.cassette.play(request)
+        if self.latency_scale:
+            cassette_sleep(interaction["seconds"] * self.latency_scale)
+        return self.build_response(request, interaction)
+
+    def build_response(self, request, interaction: Dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        response.reason = interaction["reason"]
+        response.headers = CaseInsensitiveDict(interaction["headers"])
+        body = interaction["body"]
+        if "text" in body:
+            response._content = body["text"].encode("utf-8")
+        else:
+            response._content = base64.b64decode(body["base64"])
+        response._content_consumed = True   # pylint: disable=protected-access
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.elapsed = datetime.timedelta(seconds=interaction["seconds"])
+        return response
+
+    def close(self):
+        self.real_adapter.close()
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+_forked = False
+
+
+def cassette_path() -> str:
+    """
+    The cassette file for this process.
+
+    A forked process records to its own file, named with its pid, so that
+    processes don't overwrite each other's recordings.  Every process replays
+    from HTTP_CASSETTE_PATH.
+    """
+    path = settings.HTTP_CASSETTE_PATH
+    if _forked and settings.HTTP_CASSETTE_MODE == RECORD:
+        dirname, basename = os.path.split(path)
+        name, dot, extension = basename.partition(".")
+        path = os.path.join(dirname, f"{name}-{os.getpid()}{dot}{extension}")
+    return path
+
+
+def get_cassette() -> Cassette:
+    """
+    The cassette for this process, as configured in settings.
+    """
+    global _cassette    # pylint: disable=global-statement
+    with _cassette_lock:
+        path = cassette_path()
+        if _cassette is None or _cassette.path != path:
+            _cassette = Cassette(path)
+            if settings.HTTP_CASSETTE_MODE == REPLAY:
+                _cassette.load()
+            else:
+                atexit.register(_cassette.save_at_exit)
+        return _cassette
+
+
+def save_recording() -> None:
+    """
+    Write what this process has recorded so far, if it is recording.
+
+    Called after each Celery task: pool processes are ended with os._exit,
+    which doesn't run exit handlers.
+    """
+    cassette = _cassette
+    if cassette is not None and settings.HTTP_CASSETTE_MODE == RECORD:
+        cassette.save()
+
+
+def _after_fork() -> None:
+    """
+    Called in a forked child: start a cassette of our own.
+
+    The lock is replaced too, since another thread could have been holding
+    it at the moment of the fork.
+    """
+    global _cassette, _cassette_lock, _forked   # pylint: disable=global-statement
+    _cassette = None
+    _cassette_lock = threading.Lock()
+    _forked = True
+
+
+def wrap_adapter(adapter: BaseAdapter) -> BaseAdapter:
+    """
+    Put a cassette in front of `adapter`, if HTTP_CASSETTE_MODE is set.
+    """
+    mode = settings.HTTP_CASSETTE_MODE
+    if mode is None:
+        return adapter
+    if mode not in {RECORD, REPLAY}:
+        raise ValueError(f"HTTP_CASSETTE_MODE must be {RECORD!r} or {REPLAY!r}, not {mode!r}")
+    return CassetteAdapter(get_cassette(), mode, adapter, settings.HTTP_CASSETTE_LATENCY_SCALE)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
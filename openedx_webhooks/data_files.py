@@ -0,0 +1,678 @@
+"""
+The openedx-webhooks-data files, kept fresh in the background.
+
+Every pull request event needs the data files (people, orgs, labels).  Each
+file is downloaded the first time it's read, and after that a background
+thread revalidates them every DATA_FILE_REFRESH_SECONDS: first by asking
+for the data repo's HEAD commit sha, and if that has changed (or can't be
+found), by re-reading the files with conditional requests.  Only when a
+file's content has really changed is the data parsed again, and the new
+values replace the old ones all at once.  Tasks reading the data never wait
+for a download, except for the very first one.
+
+All of our processes need the same data, so the texts are also published to
+a shared store (the shared Redis, or files on this host), as JSON.  A process
+starting up loads them from the store instead of downloading the files again,
+and only one process at a time checks GitHub for changes: the others pick up
+what it published.  The values parsed from the texts aren't shared that way:
+they would have to be pickled, and we don't unpickle what others can write.
+
+Pushes to the data repo are announced to all of our processes through the
+shared Redis (see `announce_change`), so changes apply within seconds, and
+the regular checks only catch what the announcements miss.  The same
+listener hears when TimedCache values are to be forgotten.
+
+The Celery worker reads and parses everything before forking its pool
+processes (see `warm`), so they share one copy of the data.  The texts can
+also be kept in a snapshot file (as JSON, in a directory of our own), so that
+after a restart the last good data can be used at once while it's checked in
+the background.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import functools
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from time import sleep as refresh_sleep   # so that we can patch it for tests.
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cachetools
+import redis
+import requests
+
+from openedx_webhooks import settings
+from openedx_webhooks.auth import get_github_session
+from openedx_webhooks.metrics import task_metrics
+from openedx_webhooks.rate_limit import LOW, rate_limit_priority
+from openedx_webhooks.redis_client import get_redis
+from openedx_webhooks.utils import memoize, register_cache
+
+logger = logging.getLogger(__name__)
+
+DATA_REPO = "openedx/openedx-webhooks-data"
+
+# The Redis channel for announcing new commits in data repos.
+CHANGES_CHANNEL = "openedx-webhooks:data-files:changes"
+
+# The Redis channel for telling all of our processes to forget a TimedCache value.
+FORGET_CHANNEL = "openedx-webhooks:timed-cache:forget"
+
+# How long to wait for another process to publish the files of a new commit.
+ANNOUNCED_FETCH_WAIT = 30
+
+
+def github_file_url(repo_fullname: str, file_path: str, ref: str = "HEAD") -> str:
+    """Get the GitHub url to retrieve the text of a file."""
+    # HEAD is used by default to get the tip of the repo, regardless of
+    # whether it uses master or main.
+    return f"https://raw.githubusercontent.com/{repo_fullname}/{ref}/{file_path}"
+
+
+@dataclasses.dataclass(frozen=True)
+class DataFileText:
+    """
+    The text of a data file, and a digest to tell when it changes.
+
+    `sha` is the commit it was read from, if known.
+    """
+    text: str
+    digest: str
+    sha: Optional[str] = None
+
+    @classmethod
+    def from_text(cls, text: str, sha: Optional[str] = None) -> DataFileText:
+        return cls(text, hashlib.sha256(text.encode("utf-8")).hexdigest(), sha)
+
+    def to_json(self) -> bytes:
+        return json.dumps(dataclasses.asdict(self)).encode("utf-8")
+
+    @classmethod
+    def from_json(cls, data: bytes) -> DataFileText:
+        return cls(**json.loads(data))
+
+
+class RedisDataStore:
+    """
+    A shared store in the shared Redis, for all of our processes.
+    """
+    PREFIX = "openedx-webhooks:data-files:"
+    # Entries are only dropped to clean up after data that has changed.
+    TTL = 7 * 24 * 60 * 60
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.redis.get(self.PREFIX + key)
+
+    def set(self, key: str, data: bytes) -> None:
+        self.redis.set(self.PREFIX + key, data, ex=self.TTL)
+
+    def delete(self, key: str) -> None:
+        self.redis.delete(self.PREFIX + key)
+
+    def claim(self, key: str, seconds: float) -> bool:
+        """Claim `key` for `seconds`. Returns False if it's already claimed."""
+        return bool(self.redis.set(self.PREFIX + key, os.getpid(), nx=True, ex=max(1, int(seconds))))
+
+
+class FileDataStore:
+    """
+    A shared store in a directory, for all of our processes on this host.
+    """
+    def __init__(self, directory: Path):
+        self.directory = directory
+        # Only our own user should be able to change the data we use.
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        return self.directory / hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, data: bytes) -> None:
+        # Write a temporary file and rename it, so readers never see half of it.
+        fd, temp_name = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as temp:
+            temp.write(data)
+        os.replace(temp_name, self.path(key))
+
+    def delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+    def claim(self, key: str, seconds: float) -> bool:
+        """
+        Claim `key` for `seconds`. Returns False if it's already claimed.
+
+        Two processes could both claim it, which only costs an extra check.
+        """
+        path = self.path(key)
+        try:
+            if time.time() - path.stat().st_mtime < seconds:
+                return False
+        except FileNotFoundError:
+            pass
+        path.touch()
+        return True
+
+
+@memoize
+def get_data_store():
+    """
+    Get the shared store for the data files chosen by the settings, or None.
+    """
+    if settings.DATA_FILE_SHARED_CACHE == "redis":
+        redis_client = get_redis()
+        if redis_client is not None:
+            return RedisDataStore(redis_client)
+    elif settings.DATA_FILE_SHARED_CACHE == "file" and settings.DATA_FILE_CACHE_DIR:
+        return FileDataStore(Path(settings.DATA_FILE_CACHE_DIR))
+    return None
+
+
+class TimedCache:
+    """
+    Values kept for a while, in the shared store if there is one, or in
+    this process if not.
+
+    `ttl_setting` is the name of the setting with the seconds to keep
+    values.  Values are stored as JSON, so anything else in them (like the
+    dates YAML can have) comes back as a string.
+
+    Forgetting a value is announced to all of our processes through the
+    shared Redis, so that those keeping it themselves forget it too.
+    """
+    def __init__(self, name: str, ttl_setting: str, maxsize: int = 1000):
+        self.name = name
+        self.ttl_setting = ttl_setting
+        self.local: cachetools.LRUCache = cachetools.LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+        _timed_caches[name] = self
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get the value for `key`, or None if we don't have it (or it's too old)."""
+        store = get_data_store()
+        if store is not None:
+            data = store.get(f"{self.name}:{key}")
+            cached = json.loads(data) if data is not None else None
+        else:
+            with self.lock:
+                cached = self.local.get(key)
+        if cached is None:
+            return None
+        stored_at, value = cached
+        if time.time() - stored_at >= getattr(settings, self.ttl_setting):
+            return None
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        cached = (time.time(), value)
+        store = get_data_store()
+        if store is not None:
+            store.set(f"{self.name}:{key}", json.dumps(cached, default=str).encode("utf-8"))
+        else:
+            with self.lock:
+                self.local[key] = cached
+
+    def forget(self, key: str) -> None:
+        """Forget the value for `key`, in all of our processes."""
+        store = get_data_store()
+        if store is not None:
+            store.delete(f"{self.name}:{key}")
+        self.forget_locally(key)
+        redis_client = get_redis()
+        if redis_client is not None:
+            redis_client.publish(FORGET_CHANNEL, f"{self.name} {key}")
+
+    def forget_locally(self, key: str) -> None:
+        """Forget the value for `key` in this process."""
+        with self.lock:
+            self.local.pop(key, None)
+
+    def cache_clear(self) -> None:
+        with self.lock:
+            self.local.clear()
+
+
+# The TimedCaches by name, to forget values when other processes say to.
+_timed_caches: Dict[str, TimedCache] = {}
+
+
+class DataFiles:
+    """
+    The texts of the files in a data repo, refreshed in the background.
+
+    `version` goes up every time any of the texts change.
+    """
+    def __init__(self, repo: str):
+        self.repo = repo
+        self.lock = threading.Lock()
+        # Replaced as a whole, never changed, so readers need no lock.
+        self.texts: Dict[str, DataFileText] = {}
+        self.version = 0
+        self.head_sha: Optional[str] = None
+        self.derived: List[DerivedData] = []
+        self.refresher_pid: Optional[int] = None
+        self.warming = False
+        self.snapshot_read = False
+        # Check for changes without waiting, because the data is from the snapshot.
+        self.stale = False
+        # Set when a new commit is announced, with its sha in announced_sha.
+        self.announced = threading.Event()
+        self.announced_sha: Optional[str] = None
+
+    def read(self, filename: str) -> str:
+        """
+        Get the text of a data file.
+        """
+        return self.entry(filename).text
+
+    def entry(self, filename: str) -> DataFileText:
+        """
+        Get the text and digest of a data file.
+        """
+        self.check_snapshot()
+        entry = self.texts.get(filename)
+        if entry is None:
+            with self.lock:
+                entry = self.texts.get(filename)
+                if entry is None:
+                    entry = self.load(filename)
+                    self.texts = {**self.texts, filename: entry}
+        self.start_refresher()
+        return entry
+
+    def load(self, filename: str) -> DataFileText:
+        """
+        Get a data file from the shared store, or download it if it isn't there.
+        """
+        entry = self.shared_file(filename)
+        if entry is None:
+            entry = self.fetch(filename)
+            self.publish(filename, entry)
+        return entry
+
+    def shared_file(self, filename: str) -> Optional[DataFileText]:
+        store = get_data_store()
+        if store is None:
+            return None
+        data = store.get(f"file:{self.repo}:{filename}")
+        if data is None:
+            return None
+        try:
+            return DataFileText.from_json(data)
+        except (ValueError, TypeError) as exc:
+            logger.warning(f"Couldn't use the shared copy of {filename}: {exc}")
+            return None
+
+    def publish(self, filename: str, entry: DataFileText) -> None:
+        store = get_data_store()
+        if store is not None:
+            store.set(f"file:{self.repo}:{filename}", entry.to_json())
+
+    def fetch(self, filename: str, sha: Optional[str] = None) -> DataFileText:
+        """
+        Download a data file, from commit `sha` or the HEAD.  The session's
+        cache makes this a conditional request if we've read it before.
+        """
+        url = github_file_url(self.repo, filename, sha or "HEAD")
+        logger.debug(f"Grabbing data file from: {url}")
+        resp = get_github_session().get(url)
+        resp.raise_for_status()
+        return DataFileText.from_text(resp.text, sha)
+
+    def fetch_head_sha(self) -> Optional[str]:
+        """
+        Get the sha of the data repo's HEAD commit, or None if we can't.
+        """
+        try:
+            resp = get_github_session().get(
+                f"/repos/{self.repo}/commits/HEAD",
+                headers={"Accept": "application/vnd.github.sha"},
+            )
+            resp.raise_for_status()
+        except requests.RequestException as exc:
+            logger.debug(f"Couldn't get the HEAD of {self.repo}: {exc}")
+            return None
+        return resp.text.strip()
+
+    def refresh(self, sha: Optional[str] = None) -> bool:
+        """
+        Re-read the data files if the data repo has changed.
+
+        `sha` is the new HEAD commit of the data repo, if it was announced.
+        If another process has checked the data repo recently (or is reading
+        the announced commit), the files it published to the shared store
+        are used instead.
+
+        Returns True if any of the files changed.
+        """
+        store = get_data_store()
+        interval = settings.DATA_FILE_REFRESH_SECONDS
+        if sha is not None:
+            changed = self.changed_announced_files(sha)
+        elif store is not None and not store.claim(f"checked:{self.repo}", interval):
+            changed = self.changed_shared_files()
+        else:
+            changed = self.changed_repo_files()
+        if not changed:
+            return False
+
+        logger.info(f"Data files changed: {sorted(changed)}")
+        with self.lock:
+            self.texts = {**self.texts, **changed}
+            self.version += 1
+        # Parse the new data now, rather than in the next task to need it.
+        for derived in self.derived:
+            derived.recompute()
+        self.write_snapshot()
+        return True
+
+    def changed_repo_files(self) -> Dict[str, DataFileText]:
+        """
+        Get the files that have changed in the data repo, and publish them.
+        """
+        sha = self.fetch_head_sha()
+        if sha is not None and sha == self.head_sha:
+            return {}
+        return self.read_commit(self.texts, sha)
+
+    def changed_announced_files(self, sha: str) -> Dict[str, DataFileText]:
+        """
+        Get the files that have changed in an announced commit.
+
+        One process reads them from GitHub, and the rest wait for it to
+        publish them.
+        """
+        if sha == self.head_sha:
+            return {}
+        changed = {}
+        waiting = dict(self.texts)
+        store = get_data_store()
+        if store is not None and not store.claim(f"reading:{self.repo}:{sha}", ANNOUNCED_FETCH_WAIT):
+            for _ in range(ANNOUNCED_FETCH_WAIT):
+                for filename, entry in list(waiting.items()):
+                    shared = self.shared_file(filename)
+                    if shared is not None and shared.sha == sha:
+                        del waiting[filename]
+                        if shared.digest != entry.digest:
+                            changed[filename] = shared
+                if not waiting:
+                    break
+                refresh_sleep(1)
+            else:
+                logger.warning(f"Files for {self.repo} {sha} weren't published, reading them")
+        changed.update(self.read_commit(waiting, sha))
+        return changed
+
+    def read_commit(self, entries: Dict[str, DataFileText], sha: Optional[str]) -> Dict[str, DataFileText]:
+        """
+        Read the files in `entries` from commit `sha`, and publish them.
+
+        Returns the ones that are different.
+        """
+        changed = {}
+        for filename, entry in list(entries.items()):
+            new_entry = self.fetch(filename, sha)
+            self.publish(filename, new_entry)
+            if new_entry.digest != entry.digest:
+                changed[filename] = new_entry
+        self.head_sha = sha
+        return changed
+
+    def changed_shared_files(self) -> Dict[str, DataFileText]:
+        """
+        Get the files that another process has published since we read them.
+        """
+        changed = {}
+        for filename, entry in list(self.texts.items()):
+            shared = self.shared_file(filename)
+            if shared is not None and shared.digest != entry.digest:
+                changed[filename] = shared
+        return changed
+
+    def start_refresher(self) -> None:
+        """
+        Start the background refresher for this process, if it isn't running,
+        and the listener for announcements, if we can hear them.
+
+        The listener runs even if DATA_FILE_REFRESH_SECONDS is 0: the
+        refresher then only reads the commits that are announced.
+        """
+        interval = settings.DATA_FILE_REFRESH_SECONDS
+        listening = get_redis() is not None
+        if not (interval or listening) or self.warming or self.refresher_pid == os.getpid():
+            return
+        with self.lock:
+            if self.refresher_pid == os.getpid():
+                return
+            # Threads don't survive a fork, so each process needs its own.
+            self.refresher_pid = os.getpid()
+        thread = threading.Thread(
+            target=self.refresh_forever, args=(interval or None,), name="data-file-refresher", daemon=True,
+        )
+        thread.start()
+        if listening:
+            listener = threading.Thread(
+                target=self.listen_for_announcements, name="data-file-listener", daemon=True,
+            )
+            listener.start()
+
+    def refresh_forever(self, interval: Optional[float]) -> None:
+        """
+        Refresh every `interval` seconds, and whenever a commit is announced.
+        With no `interval`, only announced commits are read.
+        """
+        with rate_limit_priority(LOW), task_metrics("data_file_refresher"):
+            while True:
+                if self.stale:
+                    self.stale = False
+                else:
+                    self.wait_for_announcement(interval)
+                sha, self.announced_sha = self.announced_sha, None
+                if sha is None and interval is None:
+                    continue
+                try:
+                    self.refresh(sha)
+                except Exception as exc:    # pylint: disable=broad-except
+                    logger.exception(f"Couldn't refresh the data files: {exc}")
+
+    def wait_for_announcement(self, timeout: Optional[float]) -> None:
+        """Wait until a new commit is announced, or `timeout` seconds if not None."""
+        self.announced.wait(timeout)
+        self.announced.clear()
+
+    def announce_change(self, sha: str) -> None:
+        """
+        Tell all of our processes that `sha` is the new HEAD of the data repo.
+        """
+        self.changed_locally(sha)
+        redis_client = get_redis()
+        if redis_client is not None:
+            redis_client.publish(CHANGES_CHANNEL, f"{self.repo} {sha}")
+
+    def changed_locally(self, sha: str) -> None:
+        """Wake this process's refresher to read commit `sha`."""
+        self.announced_sha = sha
+        self.announced.set()
+
+    def listen_for_announcements(self) -> None:
+        """
+        Wake the refresher when other processes announce new commits, and
+        forget TimedCache values when they say to.
+        """
+        while True:
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANGES_CHANNEL, FORGET_CHANNEL)
+                for message in pubsub.listen():
+                    try:
+                        self.hear_announcement(message)
+                    except Exception as exc:    # pylint: disable=broad-except
+                        logger.exception(f"Couldn't handle the announcement {message!r}: {exc}")
+            except redis.RedisError as exc:
+                logger.warning(f"Lost the data file announcements, reconnecting: {exc}")
+                refresh_sleep(10)
+            except Exception as exc:    # pylint: disable=broad-except
+                logger.exception(f"The data file announcements failed, reconnecting: {exc}")
+                refresh_sleep(10)
+
+    def hear_announcement(self, message: Dict) -> None:
+        """Act on a message from CHANGES_CHANNEL or FORGET_CHANNEL."""
+        first, _, rest = message["data"].decode().partition(" ")
+        if message["channel"].decode() == FORGET_CHANNEL:
+            timed_cache = _timed_caches.get(first)
+            if timed_cache is not None:
+                timed_cache.forget_locally(rest)
+        elif first == self.repo:
+            self.changed_locally(rest)
+
+    def check_snapshot(self) -> None:
+        """Read the snapshot file, if it hasn't been read yet."""
+        if not self.snapshot_read:
+            with self.lock:
+                if not self.snapshot_read:
+                    self.read_snapshot()
+
+    def read_snapshot(self) -> None:
+        """
+        Use the data from the snapshot file, if there is one.
+
+        The snapshot is only used if the data will be refreshed, and the
+        first refresh happens right away.
+        """
+        self.snapshot_read = True
+        path = settings.DATA_FILE_SNAPSHOT
+        if not path or not settings.DATA_FILE_REFRESH_SECONDS:
+            return
+        try:
+            with open(path, "rb") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+            if snapshot["repo"] != self.repo:
+                return
+            texts = {
+                filename: DataFileText.from_text(text)
+                for filename, text in snapshot["texts"].items()
+            }
+        except FileNotFoundError:
+            return
+        except Exception as exc:    # pylint: disable=broad-except
+            logger.warning(f"Couldn't read the data file snapshot {path}: {exc}")
+            return
+        logger.info(f"Using data files from the snapshot {path}")
+        self.texts = {**texts, **self.texts}
+        self.stale = True
+
+    def write_snapshot(self) -> None:
+        """
+        Write the texts to the snapshot file.  Only the texts are kept: the
+        values are parsed from them again.
+        """
+        path = settings.DATA_FILE_SNAPSHOT
+        if not path:
+            return
+        snapshot = {
+            "repo": self.repo,
+            "texts": {filename: entry.text for filename, entry in self.texts.items()},
+        }
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            # Write a temporary file and rename it, so readers never see half of it.
+            fd, temp_name = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, "w", encoding="utf-8") as temp:
+                json.dump(snapshot, temp)
+            os.replace(temp_name, path)
+        except OSError as exc:
+            logger.warning(f"Couldn't write the data file snapshot {path}: {exc}")
+
+    def warm(self) -> None:
+        """
+        Read the data files, and compute all the values from them, now.
+
+        This is for a parent process about to fork: the children share its
+        copy.  No refresher is started here, since threads and fork don't
+        mix, but each child starts its own when it first reads the data.
+        """
+        self.warming = True
+        try:
+            for derived in self.derived:
+                derived()
+            self.write_snapshot()
+        finally:
+            self.warming = False
+
+    def cache_clear(self) -> None:
+        """Forget all the files, to ensure isolated tests."""
+        with self.lock:
+            self.texts = {}
+            self.version += 1
+            self.head_sha = None
+            self.snapshot_read = False
+            self.stale = False
+
+
+class DerivedData:
+    """
+    A value computed from data files, recomputed only when they change.
+
+    `filenames` are the files the value is computed from.
+    """
+    def __init__(self, files: DataFiles, filenames: Tuple[str, ...], func: Callable[[], Any]):
+        functools.update_wrapper(self, func)
+        self.files = files
+        self.filenames = filenames
+        self.func = func
+        self.name = f"{func.__module__}.{func.__qualname__}"
+        self.value: Optional[Tuple[int, Any]] = None
+
+    def __call__(self) -> Any:
+        current = self.value
+        if current is None or current[0] != self.files.version:
+            current = self.recompute()
+        return current[1]
+
+    def recompute(self) -> Tuple[int, Any]:
+        # If the files change while computing, the old version is stored,
+        # and the value will be computed again when next needed.
+        version = self.files.version
+        current = self.value = (version, self.func())
+        return current
+
+    def cache_clear(self) -> None:
+        self.value = None
+
+
+data_files = register_cache(DataFiles(DATA_REPO))
+
+
+def read_data_file(filename: str) -> str:
+    """
+    Read the text of an openedx-webhooks-data file.
+    """
+    return data_files.read(filename)
+
+
+def data_file_cache(*filenames: str) -> Callable[[Callable[[], Any]], DerivedData]:
+    """
+    Decorate a function computing a value from the data files `filenames`,
+    so that it is only computed again when they change, and only once by
+    all of our processes.
+    """
+    def _decorator(func: Callable[[], Any]) -> DerivedData:
+        derived = register_cache(DerivedData(data_files, filenames, func))
+        data_files.derived.append(derived)
+        return derived
+    return _decorator
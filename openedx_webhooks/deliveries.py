@@ -0,0 +1,75 @@
+"""
+Recognize GitHub webhook deliveries we've received before.
+
+GitHub redelivers webhooks when we're slow to respond, and people redeliver
+them by hand.  Every copy has the same id in the X-GitHub-Delivery header.
+The ids are recorded for WEBHOOK_DELIVERY_TTL seconds in the shared Redis
+(with SET NX EX, so checking and recording are one step), or in this
+process if there's no shared Redis, and copies are dropped before they're
+queued.
+"""
+
+import logging
+import threading
+from typing import Optional
+
+import cachetools
+import redis
+
+from openedx_webhooks import settings
+from openedx_webhooks.redis_client import get_redis
+from openedx_webhooks.utils import memoize
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "openedx-webhooks:delivery:"
+
+_local_lock = threading.Lock()
+
+
+@memoize
+def _local_deliveries() -> cachetools.TTLCache:
+    return cachetools.TTLCache(maxsize=10_000, ttl=settings.WEBHOOK_DELIVERY_TTL)
+
+
+def claim_delivery(delivery_id: Optional[str]) -> bool:
+    """
+    Record that we've received delivery `delivery_id`.
+
+    Returns False if it was received before.  Deliveries without an id are
+    always new.
+    """
+    if not delivery_id:
+        return True
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            return bool(redis_client.set(PREFIX + delivery_id, 1, nx=True, ex=settings.WEBHOOK_DELIVERY_TTL))
+        except redis.RedisError as exc:
+            # Better to handle a duplicate than to drop a delivery.
+            logger.warning(f"Couldn't record webhook delivery {delivery_id}: {exc}")
+            return True
+    with _local_lock:
+        seen = _local_deliveries()
+        if delivery_id in seen:
+            return False
+        seen[delivery_id] = True
+        return True
+
+
+def release_delivery(delivery_id: Optional[str]) -> None:
+    """
+    Forget delivery `delivery_id`, because we failed to handle it, so that
+    a redelivery will be handled.
+    """
+    if not delivery_id:
+        return
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            redis_client.delete(PREFIX + delivery_id)
+        except redis.RedisError as exc:
+            logger.warning(f"Couldn't forget webhook delivery {delivery_id}: {exc}")
+        return
+    with _local_lock:
+        _local_deliveries().pop(delivery_id, None)
@@ -2,14 +2,16 @@
 Functions for working with GitHub projects with the GraphQL API.
 """
 
-from typing import Set
+import contextlib
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Set, Tuple
 
 from glom import glom
 
 from openedx_webhooks.lib.github.models import PrId
 from openedx_webhooks.tasks import logger
 from openedx_webhooks.types import GhProject, PrDict
-from openedx_webhooks.utils import graphql_query
+from openedx_webhooks.utils import graphql_query, memoize
 
 # The name of the query is used by FakeGitHub while testing.
 
@@ -78,30 +80,95 @@ query OrgProjectId (
 }
 """
 
-ADD_PROJECT_ITEM = """\
-mutation AddProjectItem (
-  $projectId: ID!
-  $prNodeId: ID!
-) {
-  addProjectV2ItemById (input: {projectId: $projectId, contentId: $prNodeId}) {
-    item {
-      id
-    }
-  }
-}
-"""
+# Additions are sent as one mutation with an aliased addProjectV2ItemById
+# for each, up to this many at a time.
+MAX_ITEMS_PER_MUTATION = 50
+
+
+def add_project_items_mutation(count: int) -> str:
+    """
+    The text of a mutation adding `count` items to projects.
+
+    The variables are projectId0, prNodeId0, projectId1, prNodeId1, etc.
+    """
+    params = "".join(f"  $projectId{i}: ID!\n  $prNodeId{i}: ID!\n" for i in range(count))
+    adds = "".join(
+        f"  add{i}: addProjectV2ItemById (input: {{projectId: $projectId{i}, contentId: $prNodeId{i}}}) {{\n"
+        + "    item {\n      id\n    }\n  }\n"
+        for i in range(count)
+    )
+    return f"mutation AddProjectItems (\n{params}) {{\n{adds}}}\n"
+
+
+@memoize
+def org_project_id(project: GhProject) -> str:
+    """Get the node id of a project.  They never change, so it's memoized."""
+    variables = {"owner": project[0], "number": project[1]}
+    data = graphql_query(query=ORG_PROJECT_ID, variables=variables)
+    return glom(data, "organization.projectV2.id")
+
+
+# (project node id, PR node id) pairs waiting to be added, when batching.
+_pending_items: ContextVar[Optional[List[Tuple[str, str]]]] = ContextVar("pending_project_items", default=None)
+
+
+@contextlib.contextmanager
+def project_item_batch() -> Iterator[List[Tuple[str, str]]]:
+    """
+    Collect the additions to projects made in this block, and make them all
+    at the end with as few mutations as possible.
+
+    The block gets the list of (project node id, PR node id) pairs collected.
+    If the additions fail, the exception is raised from the end of the block.
+
+    Nested batches are part of the outermost one.
+    """
+    pending = _pending_items.get()
+    if pending is not None:
+        yield pending
+        return
+    items: List[Tuple[str, str]] = []
+    token = _pending_items.set(items)
+    try:
+        yield items
+    except BaseException:
+        # Make the additions collected so far, but the block's own exception
+        # is the one to raise.
+        _pending_items.reset(token)
+        try:
+            add_project_items(items)
+        except Exception as exc:    # pylint: disable=broad-except
+            logger.exception(f"Couldn't add PRs to projects: {exc}")
+        raise
+    _pending_items.reset(token)
+    add_project_items(items)
+
+
+def add_project_items(items: List[Tuple[str, str]]) -> None:
+    """
+    Add pull requests to projects, given (project node id, PR node id) pairs.
+    """
+    items = list(dict.fromkeys(items))
+    for start in range(0, len(items), MAX_ITEMS_PER_MUTATION):
+        chunk = items[start:start + MAX_ITEMS_PER_MUTATION]
+        variables = {}
+        for i, (proj_id, pr_node_id) in enumerate(chunk):
+            variables[f"projectId{i}"] = proj_id
+            variables[f"prNodeId{i}"] = pr_node_id
+        graphql_query(query=add_project_items_mutation(len(chunk)), variables=variables)
+
 
 def add_pull_request_to_project(prid: PrId, pr_node_id: str, project: GhProject) -> None:
     """Add a pull request to a project.
 
     The project is a tuple: (orgname, number)
+
+    Inside `project_item_batch`, the addition is made at the end of the batch.
     """
     logger.info(f"Adding PR {prid.full_name}#{prid.number} to project {project}")
-    # Find the project id.
-    variables = {"owner": project[0], "number": project[1]}
-    data = graphql_query(query=ORG_PROJECT_ID, variables=variables)
-    proj_id = glom(data, "organization.projectV2.id")
-
-    # Add the pull request.
-    variables = {"projectId": proj_id, "prNodeId": pr_node_id}
-    data = graphql_query(query=ADD_PROJECT_ITEM, variables=variables)
+    item = (org_project_id(project), pr_node_id)
+    pending = _pending_items.get()
+    if pending is not None:
+        pending.append(item)
+    else:
+        add_project_items([item])
@@ -3,6 +3,8 @@ These are the views that process webhook events coming from Github.
 """
 
 import logging
+import re
+from typing import Optional
 
 from flask import current_app as app
 from flask import (
@@ -10,9 +12,13 @@ from flask import (
 )
 
 from openedx_webhooks.auth import get_github_session
+from openedx_webhooks.data_files import DATA_REPO, data_files
 from openedx_webhooks.debug import is_debug, print_long_json
-from openedx_webhooks.info import get_bot_username
+from openedx_webhooks.deliveries import claim_delivery, release_delivery
+from openedx_webhooks.info import CATALOG_INFO_FILE, forget_catalog_info, get_bot_username
 from openedx_webhooks.lib.github.models import GithubWebHookRequestHeader
+from openedx_webhooks.metrics import webhook_duplicates
+from openedx_webhooks.rate_limit import LOW, rate_limit_priority
 from openedx_webhooks.tasks.github import (
     pull_request_changed_task, rescan_repository, rescan_repository_task,
     rescan_organization_task,
@@ -25,6 +31,27 @@ github_bp = Blueprint('github_views', __name__)
 logger = logging.getLogger(__name__)
 
 
+# The event types (in the X-GitHub-Event header) that we act on.
+EVENT_TYPES = {
+    "commit_comment",
+    "discussion_comment",
+    "issue_comment",
+    "ping",
+    "pull_request",
+    "pull_request_review_comment",
+    "push",
+}
+
+# GitHub sends the action first, so it can be found without parsing the rest.
+ACTION_SNIFF = re.compile(rb'\A\s*\{\s*"action"\s*:\s*"([a-z_]+)"')
+
+
+def sniff_action(payload: bytes) -> Optional[str]:
+    """The action of an event, if it's at the start of the payload."""
+    m = ACTION_SNIFF.match(payload)
+    return m[1].decode() if m else None
+
+
 @github_bp.route('/hook-receiver', methods=('POST',))
 def hook_receiver():
     """
@@ -32,8 +59,11 @@ def hook_receiver():
 
     1.  Make sure the payload hashes to the proper signature. If not,
         reject the request with http status of 403.
-    2.  Send a job to the queue with details of the event.
-    3.  Respond with http status 202.
+    2.  Acknowledge events we don't act on, judging by the event type header
+        and the action, without parsing them.
+    3.  Drop deliveries we've received before.
+    4.  Send a job to the queue with details of the event.
+    5.  Respond with http status 202.
 
     Returns:
         A response, or Tuple[str, int]: Message payload and HTTP status code
@@ -48,9 +78,34 @@ def hook_receiver():
         logging.info(msg)
         return msg, 403
 
-    event = request.get_json()
-
-    action = event["action"]
+    # Most deliveries are events we ignore: acknowledge them without parsing.
+    event_type = headers.event_type
+    if event_type is not None and event_type not in EVENT_TYPES:
+        logger.debug(f"Ignoring {event_type!r} event")
+        return "Thank you", 202
+    if event_type == "pull_request":
+        action = sniff_action(request.data)
+        if action is not None and action not in PR_ACTIONS:
+            logger.info(f"pull_request {action!r}, ignoring...")
+            return "Nothing for me to do", 200
+
+    # Redeliveries of deliveries we've already handled are dropped.  If we
+    # fail to queue the work, the delivery is released for the redelivery.
+    delivery_id = headers.delivery_id
+    if not claim_delivery(delivery_id):
+        logger.info(f"Delivery {delivery_id} of {event_type!r} was received before, dropping it")
+        webhook_duplicates.inc((event_type or "unknown",))
+        return "Already received", 200
+    try:
+        return handle_event(request.get_json())
+    except Exception:
+        release_delivery(delivery_id)
+        raise
+
+
+def handle_event(event):
+    """Handle a webhook event we might act on."""
+    action = event.get("action")
     repo = event.get("repository", {}).get("full_name")
     who = event.get("sender", {}).get("login", "someone")
     keys = set(event.keys()) - {"action", "sender", "repository", "organization", "installation"}
@@ -69,6 +124,7 @@ def hook_receiver():
     #   Editing a comment: action=edited, changes, comment, issue
     #   Commenting on an issue: action=created, comment, issue
     #       {"issue": { "html_url": "https://github.com/owner/repo/issue/101"}}
+    #   Pushing commits: no action, ref, commits, head_commit
 
     match event:
         case {"pull_request": _}:
@@ -77,6 +133,9 @@ def hook_receiver():
         case {"comment": _}:
             return handle_comment_event(event)
 
+        case {"ref": _, "commits": _}:
+            return handle_push_event(event)
+
         case {"zen": _, "hook": _}:
             # this is a ping
             logger.info(f"ping from {repo}")
@@ -134,6 +193,34 @@ def handle_pull_request_event(event):
     return resp
 
 
+# Push webhook payloads list at most this many commits.  A push of more has
+# its list cut short, so it might change files we can't see.
+PUSH_EVENT_MAX_COMMITS = 2048
+
+
+def handle_push_event(event):
+    """Handle a webhook event about commits pushed to a repo."""
+    repo = event["repository"]["full_name"]
+    default_ref = f"refs/heads/{event['repository'].get('default_branch')}"
+    if event["ref"] != default_ref:
+        return "Nothing for me to do", 200
+
+    if repo == DATA_REPO:
+        logger.info(f"{repo} pushed {event['after']}, announcing it")
+        data_files.announce_change(event["after"])
+
+    commits = event["commits"]
+    changed_files = set()
+    for commit in commits:
+        for change in ["added", "modified", "removed"]:
+            changed_files.update(commit.get(change, ()))
+    # If the event couldn't list all the commits, the file might have changed.
+    if CATALOG_INFO_FILE in changed_files or len(commits) >= PUSH_EVENT_MAX_COMMITS:
+        logger.info(f"{repo} pushed a change to {CATALOG_INFO_FILE}, forgetting it")
+        forget_catalog_info(repo)
+    return "Thank you", 200
+
+
 def handle_comment_event(event):
     """Handle a webhook event about a comment."""
 
@@ -187,7 +274,8 @@ def rescan():
         org = repo[4:]
         result = rescan_organization_task.delay(org, wsgi_environ=minimal_wsgi_environ(), **rescan_kwargs)
     elif inline:
-        return jsonify(rescan_repository(repo, **rescan_kwargs))
+        with rate_limit_priority(LOW):
+            return jsonify(rescan_repository(repo, **rescan_kwargs))
     else:
         result = rescan_repository_task.delay(repo, wsgi_environ=minimal_wsgi_environ(), **rescan_kwargs)
 
@@ -0,0 +1,215 @@
+"""
+A cache of GitHub responses, revalidated with conditional requests.
+
+GitHub sends an ETag (and often Last-Modified) with its responses.  If we
+send them back as If-None-Match and If-Modified-Since, GitHub replies with a
+bodiless 304 when nothing has changed, and a 304 doesn't count against our
+rate limit.  The cached body is then used as the response.
+"""
+
+from __future__ import annotations
+
+import base64
+import collections
+import dataclasses
+import hashlib
+import json
+import logging
+import threading
+from typing import Dict, Optional
+
+import cachetools
+import requests
+
+from openedx_webhooks import settings
+from openedx_webhooks.redis_client import get_redis
+
+# Headers that describe how a body was transferred.  These aren't stored,
+# since the cached content is already decoded, and aren't taken from a 304,
+# since they describe its empty body.
+TRANSFER_HEADERS = {"content-length", "content-encoding", "transfer-encoding"}
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class CachedResponse:
+    """
+    The parts of a response we need to rebuild it from the cache.
+    """
+    etag: Optional[str]
+    last_modified: Optional[str]
+    status_code: int
+    reason: str
+    headers: Dict[str, str]
+    content: bytes
+    encoding: Optional[str]
+
+    def size(self) -> int:
+        """Approximate size in bytes, for bounding the memory used."""
+        return len(self.content) + sum(len(k) + len(v) for k, v in self.headers.items())
+
+    def to_json(self) -> bytes:
+        data = dataclasses.asdict(self)
+        data["content"] = base64.b64encode(self.content).decode("ascii")
+        return json.dumps(data).encode("utf-8")
+
+    @classmethod
+    def from_json(cls, data: bytes) -> CachedResponse:
+        fields = json.loads(data)
+        fields["content"] = base64.b64decode(fields["content"])
+        return cls(**fields)
+
+
+class MemoryCacheBackend:
+    """
+    An LRU cache in process memory, bounded by the total size of the entries.
+    """
+    def __init__(self, max_bytes: int):
+        self.entries: cachetools.LRUCache = cachetools.LRUCache(
+            maxsize=max_bytes, getsizeof=CachedResponse.size,
+        )
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self.lock:
+            return self.entries.get(key)
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        with self.lock:
+            try:
+                self.entries[key] = entry
+            except ValueError:
+                # Too large to cache at all.
+                self.entries.pop(key, None)
+
+
+class RedisCacheBackend:
+    """
+    A cache in the shared Redis, so that all of our processes can revalidate
+    the same entries.  Entries are stored as JSON: we don't unpickle what
+    others can write.
+    """
+    PREFIX = "openedx-webhooks:http-cache:"
+
+    def __init__(self, redis_client, ttl: int):
+        self.redis = redis_client
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        data = self.redis.get(self.PREFIX + key)
+        if data is None:
+            return None
+        try:
+            return CachedResponse.from_json(data)
+        except (ValueError, TypeError, KeyError) as exc:
+            # Not an entry we can use: treat it as missing.
+            logger.warning(f"Couldn't read the cached response {key}: {exc}")
+            return None
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        self.redis.set(self.PREFIX + key, entry.to_json(), ex=self.ttl)
+
+
+class ConditionalRequestCache:
+    """
+    Revalidate GET requests with ETag and Last-Modified.
+
+    Counts the hits (304s served from the cache), misses (full responses),
+    and stores (full responses we could revalidate next time).
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.counts: collections.Counter = collections.Counter()
+        self.counts_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> ConditionalRequestCache:
+        """Make a cache with the backend chosen by the settings."""
+        redis_client = get_redis()
+        if settings.HTTP_CACHE_BACKEND == "redis" and redis_client is not None:
+            backend = RedisCacheBackend(redis_client, ttl=settings.HTTP_CACHE_REDIS_TTL)
+        else:
+            backend = MemoryCacheBackend(max_bytes=settings.HTTP_CACHE_MAX_BYTES)
+        return cls(backend)
+
+    def _count(self, what: str) -> None:
+        with self.counts_lock:
+            self.counts[what] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """The hit, miss, and store counts."""
+        with self.counts_lock:
+            return {what: self.counts[what] for what in ["hits", "misses", "stores"]}
+
+    @staticmethod
+    def cache_key(request: requests.PreparedRequest) -> str:
+        """
+        The key for a request: its URL and the headers that change the response.
+        """
+        parts = [request.url or ""]
+        for header in ["Accept", "Authorization"]:
+            parts.append(request.headers.get(header, ""))
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    def prepare(self, request: requests.PreparedRequest) -> Optional[CachedResponse]:
+        """
+        Add conditional headers to `request` if we have a cached response.
+
+        Returns the cached entry, to be passed to `update`.
+        """
+        entry = self.backend.get(self.cache_key(request))
+        if entry is not None:
+            if entry.etag:
+                request.headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                request.headers["If-Modified-Since"] = entry.last_modified
+        return entry
+
+    def update(
+        self,
+        request: requests.PreparedRequest,
+        response: requests.Response,
+        entry: Optional[CachedResponse],
+    ) -> requests.Response:
+        """
+        Use the cached entry for a 304 response, or store a new response.
+
+        Returns the response to give to the caller.
+        """
+        if response.status_code == 304 and entry is not None:
+            self._count("hits")
+            # Keep the fresh headers (rate limits, for example), but fill in
+            # the rest from the cached response.
+            headers = requests.structures.CaseInsensitiveDict(entry.headers)
+            for name, value in response.headers.items():
+                if name.lower() not in TRANSFER_HEADERS | {"content-type"}:
+                    headers[name] = value
+            response.headers = headers
+            response.status_code = entry.status_code
+            response.reason = entry.reason
+            response._content = entry.content
+            response.encoding = entry.encoding
+            response.from_conditional_cache = True  # type: ignore[attr-defined]
+            return response
+
+        self._count("misses")
+        if response.status_code == 200:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if etag or last_modified:
+                new_entry = CachedResponse(
+                    etag=etag,
+                    last_modified=last_modified,
+                    status_code=response.status_code,
+                    reason=response.reason,
+                    headers={
+                        name: value for name, value in response.headers.items()
+                        if name.lower() not in TRANSFER_HEADERS
+                    },
+                    content=response.content,
+                    encoding=response.encoding,
+                )
+                self.backend.set(self.cache_key(request), new_entry)
+                self._count("stores")
+        return response
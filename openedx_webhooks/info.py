@@ -13,27 +13,27 @@ from iso8601 import parse_date
 
 from openedx_webhooks import settings
 from openedx_webhooks.lib.github.models import PrId
+from openedx_webhooks.orgs import OrgsIndex
+from openedx_webhooks.people import PeopleIndex, PersonState
 from openedx_webhooks.auth import get_github_session
+from openedx_webhooks.data_files import (
+    TimedCache, data_file_cache, data_files, github_file_url, read_data_file,
+)
 from openedx_webhooks.types import GhProject, PrDict, PrCommentDict
 from openedx_webhooks.utils import (
+    get_jira_custom_fields,
     memoize,
-    memoize_timed,
     paginated_get,
+    register_cache,
     retry_get,
 )
 
 logger = logging.getLogger(__name__)
 
 
-def _github_file_url(repo_fullname: str, file_path: str) -> str:
-    """Get the GitHub url to retrieve the text of a file."""
-    # HEAD is used here to get the tip of the repo, regardless of whether it
-    # uses master or main.
-    return f"https://raw.githubusercontent.com/{repo_fullname}/HEAD/{file_path}"
-
 def _read_yaml_data_file(filename):
     """Read a YAML file from openedx-webhooks-data."""
-    return yaml.safe_load(_read_data_file(filename))
+    return yaml.safe_load(read_data_file(filename))
 
 def _read_csv_data_file(filename):
     """
@@ -41,15 +41,7 @@ def _read_csv_data_file(filename):
     object of dicts. The first row of the csv is assumed to be a header, and is
     used to assign dictionary keys.
     """
-    return csv.DictReader(_read_data_file(filename).splitlines())
-
-# Cache the webhooks data files, because every PR change reads them.
-@memoize_timed(minutes=15)
-def _read_data_file(filename):
-    """
-    Read the text of an openedx-webhooks-data file.
-    """
-    return _read_github_file("openedx/openedx-webhooks-data", filename)
+    return csv.DictReader(read_data_file(filename).splitlines())
 
 
 def _read_github_file(repo_fullname: str, file_path: str, not_there: Optional[str] = None) -> str:
@@ -68,7 +60,7 @@ def _read_github_file(repo_fullname: str, file_path: str, not_there: Optional[st
         The text of the file, or `not_there` if provided.
     """
     github = get_github_session()
-    data_file_url = _github_file_url(repo_fullname, file_path)
+    data_file_url = github_file_url(repo_fullname, file_path)
     logger.debug(f"Grabbing data file from: {data_file_url}")
     resp = github.get(data_file_url)
     if resp.status_code == 404 and not_there is not None:
@@ -76,7 +68,9 @@ def _read_github_file(repo_fullname: str, file_path: str, not_there: Optional[st
     resp.raise_for_status()
     return resp.text
 
-@memoize_timed(minutes=15)
+# The data files are refreshed in the background, and these values are
+# computed again only when the files they name change.
+@data_file_cache("salesforce-export.csv", "people.yaml")
 def get_people_file():
     """
     Returns data formatted as a dictionary of people containing this information:
@@ -121,6 +115,15 @@ def get_people_file():
             people[p].update(people_data_yaml[p])
     return people
 
+@data_file_cache("salesforce-export.csv", "people.yaml")
+def get_people_index() -> PeopleIndex:
+    """
+    Returns the people from `get_people_file`, compiled for lookups of
+    people as they were at particular times.
+    """
+    return PeopleIndex(get_people_file())
+
+@data_file_cache("orgs.yaml")
 def get_orgs_file():
     orgs = _read_yaml_data_file("orgs.yaml")
     for org_data in list(orgs.values()):
@@ -128,6 +131,14 @@ def get_orgs_file():
             orgs[org_data["name"]] = org_data
     return orgs
 
+@data_file_cache("orgs.yaml")
+def get_orgs_index() -> OrgsIndex:
+    """
+    Returns the orgs from `get_orgs_file`, compiled for internal checks.
+    """
+    return OrgsIndex(get_orgs_file())
+
+@data_file_cache("labels.yaml")
 def get_labels_file():
     return _read_yaml_data_file("labels.yaml")
 
@@ -157,25 +168,12 @@ def is_internal_pull_request(pull_request: PrDict) -> bool:
     if person is None:
         return False
 
-    org_name = person.get("institution")
+    org_name = person.institution
     if org_name is None:
         return False
 
-    org_data = get_orgs_file().get(org_name)
-    if org_data is None:
-        return False
-    if org_data.get("internal", False):
-        # This is an temporary stop-gap: the old data will work with the new
-        # code so we can deploy new code and then update the data files.
-        # Once the data files are updated to remove "internal", we can get rid
-        # of this code.
-        return True
-
     gh_org = pull_request["base"]["repo"]["owner"]["login"]
-    if gh_org in org_data.get("internal-ghorgs", []):
-        return True
-
-    return False
+    return get_orgs_index().is_internal(org_name, gh_org)
 
 
 # During the decoupling, it became clear that we needed to ignore pull
@@ -208,23 +206,22 @@ def is_draft_pull_request(pull_request: PrDict) -> bool:
     return pull_request.get("draft", False) or bool(re.search(r"\b(WIP|wip)\b", pull_request["title"]))
 
 
-def _pr_author_data(pull_request: PrDict) -> Optional[Dict]:
+def _pr_author_data(pull_request: PrDict) -> Optional[PersonState]:
     """
     Get data about the author of the pull request, as of the
     creation of the pull request.
 
-    Returns None if the author had no CLA.
+    Returns None if we don't know the author.
     """
-    people = get_people_file()
-    author = pull_request["user"]["login"]
-    if author not in people:
-        # We don't know this person!
-        return None
+    return get_people_index().person_at(pull_request["user"]["login"], _created_date(pull_request["created_at"]))
+
 
-    person = people[author]
-    created_at = parse_date(pull_request["created_at"]).replace(tzinfo=None)
-    person = get_person_certain_time(people[author], created_at)
-    return person
+def _created_date(created_at: str) -> datetime.date:
+    """The date part of a GitHub timestamp, as parse_date would find it."""
+    try:
+        return datetime.date.fromisoformat(created_at[:10])
+    except ValueError:
+        return parse_date(created_at).date()
 
 
 def is_committer_pull_request(pull_request: PrDict) -> bool:
@@ -233,30 +230,9 @@ def is_committer_pull_request(pull_request: PrDict) -> bool:
     or branch?
     """
     person = _pr_author_data(pull_request)
-    if person is None:
-        return False
-    if "committer" not in person:
+    if person is None or person.committer is None:
         return False
-
-    repo = pull_request["base"]["repo"]["full_name"]
-    org = repo.partition("/")[0]
-    branch = pull_request["base"]["ref"]
-    commit_rights = person["committer"]
-    if not commit_rights:
-        return False
-    if "orgs" in commit_rights:
-        if org in commit_rights["orgs"]:
-            return True
-    if "repos" in commit_rights:
-        if repo in commit_rights["repos"]:
-            return True
-    if "branches" in commit_rights:
-        for access_branch in commit_rights["branches"]:
-            if access_branch.endswith("*") and branch.startswith(access_branch[:-1]):
-                return True
-            elif branch == access_branch:
-                return True
-    return False
+    return person.committer.allows(pull_request["base"]["repo"]["full_name"], pull_request["base"]["ref"])
 
 
 NO_CONTRIBUTION_ORGS = {"edx"}
@@ -276,8 +252,7 @@ def pull_request_has_cla(pull_request: PrDict) -> bool:
     person = _pr_author_data(pull_request)
     if person is None:
         return False
-    agreement = person.get("agreement", "none")
-    return agreement != "none"
+    return person.agreement != "none"
 
 
 def get_blended_project_id(pull_request: PrDict) -> Optional[int]:
@@ -307,6 +282,21 @@ def get_bot_username() -> str:
     return me["login"]
 
 
+def warm_caches() -> None:
+    """
+    Get the information every task needs, in a Celery worker before it
+    forks its pool processes, so that they all start with it.
+    """
+    try:
+        data_files.warm()
+        get_people_index()
+        github_whoami()
+        get_jira_custom_fields()
+    except Exception as exc:    # pylint: disable=broad-except
+        # The pool processes will get whatever is missing themselves.
+        logger.exception(f"Couldn't warm the caches: {exc}")
+
+
 def get_bot_comments(prid: PrId) -> Iterable[PrCommentDict]:
     """Find all the comments the bot has made on a pull request."""
     my_username = get_bot_username()
@@ -330,7 +320,16 @@ def get_jira_issue_key(pr: Union[PrId, PrDict]) -> Tuple[bool, Optional[str]]:
         prid = PrId.from_pr_dict(pr)
     else:
         prid = pr
-    for comment in get_bot_comments(prid):
+    return jira_issue_key_from_comments(get_bot_comments(prid))
+
+
+def jira_issue_key_from_comments(bot_comments: Iterable[PrCommentDict]) -> Tuple[bool, Optional[str]]:
+    """
+    Find mention of a Jira issue number in `bot_comments`.
+
+    Returns the same as `get_jira_issue_key`.
+    """
+    for comment in bot_comments:
         # search for the first occurrence of a JIRA ticket key in the comment body
         match = re.search(r"(https://.*?)/browse/([A-Z]{2,}-\d+)\b", comment["body"])
         if match:
@@ -364,10 +363,28 @@ def jira_project_for_blended(_pr: PrDict) -> Optional[str]:
     return "BLENDED"
 
 
+CATALOG_INFO_FILE = "catalog-info.yaml"
+
+_catalog_infos = register_cache(TimedCache("catalog-info", "CATALOG_INFO_TTL"))
+
 def get_catalog_info(repo_fullname: str) -> Dict:
-    """Get the parsed catalog-info.yaml data from a repo, or {} if missing."""
-    yml = _read_github_file(repo_fullname, "catalog-info.yaml", not_there="{}")
-    return yaml.safe_load(yml)
+    """
+    Get the parsed catalog-info.yaml data from a repo, or {} if missing.
+
+    The data (even {}) is cached for CATALOG_INFO_TTL seconds, or until
+    `forget_catalog_info` is called when the file changes.
+    """
+    catalog_info = _catalog_infos.get(repo_fullname)
+    if catalog_info is None:
+        yml = _read_github_file(repo_fullname, CATALOG_INFO_FILE, not_there="{}")
+        catalog_info = yaml.safe_load(yml) or {}
+        _catalog_infos.set(repo_fullname, catalog_info)
+    return catalog_info
+
+
+def forget_catalog_info(repo_fullname: str) -> None:
+    """Drop the cached catalog-info.yaml data for a repo."""
+    _catalog_infos.forget(repo_fullname)
 
 
 def projects_for_pr(pull_request: PrDict) -> Iterable[GhProject]:
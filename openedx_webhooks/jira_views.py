@@ -47,7 +47,7 @@ def rescan_issues():
     jql = request.form.get("jql") or 'status = "Needs Triage" ORDER BY key'
     sentry_extra_context({"jql": jql})
     issues = jira_paginated_get(
-        "/rest/api/2/search", jql=jql, obj_name="issues", session=get_jira_session(),
+        "/rest/api/2/search", jql=jql, obj_name="issues", session=get_jira_session(), stream=True,
     )
     results = {}
 
@@ -0,0 +1,140 @@
+"""
+Decode large JSON responses incrementally.
+
+A page of 100 full pull requests, or a Jira search with every field expanded,
+is megabytes of JSON.  Decoding it all with `resp.json()` holds the text and
+all of the objects in memory at once.  JsonStream reads a streamed response a
+chunk at a time and produces the items of an array one by one, so only one
+item needs to be in memory at a time.
+"""
+
+from __future__ import annotations
+
+import codecs
+import json
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+# Read streamed responses this many bytes at a time.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = " \t\n\r"
+
+
+class JsonStream:
+    """
+    Decode JSON text arriving in chunks.
+
+    Use `array_items` for a top-level array, or `object_items` for an array
+    inside a top-level object.
+    """
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        # The other members of the top-level object, for `object_items`.
+        self.fields: Dict[str, Any] = {}
+
+    @classmethod
+    def from_response(cls, resp) -> JsonStream:
+        """Decode a requests response, which should have been made with stream=True."""
+        return cls(resp.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+
+    def array_items(self) -> Iterator[Any]:
+        """Produce the items of a top-level array."""
+        yield from self._array()
+        self._expect_end()
+
+    def object_items(self, name: str) -> Iterator[Any]:
+        """
+        Produce the items of the array `name` in a top-level object.
+
+        The other members of the object are collected in `fields`, which is
+        complete once the items are exhausted.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+        else:
+            while True:
+                key = self._value()
+                if not isinstance(key, str):
+                    raise ValueError(f"Expected an object key, got {key!r}")
+                self._expect(":")
+                if key == name and self._peek() == "[":
+                    yield from self._array()
+                else:
+                    self.fields[key] = self._value()
+                if self._next_of(",}") == "}":
+                    break
+        self._expect_end()
+
+    def _fill(self) -> bool:
+        """Read another chunk into the buffer.  Returns False at the end of the text."""
+        if self.eof:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            text = self.text_decoder.decode(b"", final=True)
+        else:
+            text = self.text_decoder.decode(chunk)
+        # Drop what we've already decoded.
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def _peek(self) -> Optional[str]:
+        """Skip whitespace, and return the next character, or None at the end."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return None
+
+    def _expect(self, char: str) -> None:
+        self._next_of(char)
+
+    def _next_of(self, chars: str) -> str:
+        """Consume the next character, which must be one of `chars`."""
+        char = self._peek()
+        if char is None or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in JSON stream, got {char!r}")
+        self.pos += 1
+        return char
+
+    def _expect_end(self) -> None:
+        if self._peek() is not None:
+            raise ValueError("Extra data after JSON value")
+
+    def _value(self) -> Any:
+        """Decode one complete value, reading more text as needed."""
+        char = self._peek()
+        if char is not None and char not in '{["':
+            # A number or literal can be decoded from a prefix of itself, so
+            # read until we can see where it ends.
+            while not any(c in self.buf[self.pos:] for c in ",]}" + WHITESPACE) and self._fill():
+                pass
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            self.pos = end
+            return value
+
+    def _array(self) -> Iterator[Any]:
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._next_of(",]") == "]":
+                return
@@ -41,6 +41,13 @@ class GithubWebHookRequestHeader:
         """
         return self.headers.get('X-Hub-Signature')
 
+    @property
+    def delivery_id(self):
+        """
+        str: The unique id of the delivery, the same for every redelivery.
+        """
+        return self.headers.get('X-Github-Delivery')
+
 
 class GithubWebHookEvent:
     """
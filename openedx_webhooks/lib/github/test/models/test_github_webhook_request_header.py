@@ -8,6 +8,7 @@ def headers():
     headers = {
         'X-Github-Event': 'event',
         'X-Hub-Signature': 'signature',
+        'X-Github-Delivery': 'delivery',
     }
     return GithubWebHookRequestHeader(headers)
 
@@ -18,3 +19,7 @@ def test_event_type(headers):
 
 def test_signature(headers):
     assert headers.signature == 'signature'
+
+
+def test_delivery_id(headers):
+    assert headers.delivery_id == 'delivery'
@@ -0,0 +1,382 @@
+"""
+Metrics about our traffic to GitHub and Jira, in Prometheus text format.
+
+Every HTTP call made by our sessions is counted and timed, labelled with the
+service, the method, a normalized endpoint template (so that
+/repos/openedx/edx-platform/issues/123/comments is counted as
+/repos/{repo}/issues/{n}/comments), and the Celery task that made it.
+
+GraphQL queries are also accounted in points, GitHub's separate budget for
+GraphQL: the cost of each query is counted by query name, and the points
+remaining are kept as a gauge.  Webhook redeliveries we drop are counted too.
+
+The metrics are kept per process.  The web process serves them at /metrics,
+and Celery workers push them to a Prometheus Pushgateway if
+METRICS_PUSHGATEWAY_URL is set.
+"""
+
+from __future__ import annotations
+
+import bisect
+import collections
+import contextlib
+import contextvars
+import logging
+import math
+import re
+import socket
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+from billiard.process import current_process
+from iso8601 import parse_date
+from urlobject import URLObject
+
+from openedx_webhooks import settings
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[str, ...]
+
+# The task making requests now, for labelling metrics.
+_task_name: contextvars.ContextVar[str] = contextvars.ContextVar("metrics_task", default="none")
+
+
+@contextlib.contextmanager
+def task_metrics(task_name: str) -> Iterator[None]:
+    """
+    Label the metrics recorded in this block with `task_name`.
+    """
+    token = _task_name.set(task_name)
+    try:
+        yield
+    finally:
+        _task_name.reset(token)
+
+
+def current_task_name() -> str:
+    return _task_name.get()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """
+    A monotonically increasing count, by labels.
+    """
+    TYPE = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        self.values: Dict[Labels, float] = collections.defaultdict(float)
+
+    def inc(self, labels: Labels, amount: float = 1) -> None:
+        with self.lock:
+            self.values[labels] += amount
+
+    def get(self, labels: Labels) -> float:
+        with self.lock:
+            return self.values.get(labels, 0)
+
+    def samples(self) -> Iterable[str]:
+        with self.lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+
+    def reset(self) -> None:
+        with self.lock:
+            self.values.clear()
+
+
+class Gauge:
+    """
+    A value that can go up and down, by labels.
+    """
+    TYPE = "gauge"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        self.values: Dict[Labels, float] = {}
+
+    def set(self, labels: Labels, value: float) -> None:
+        with self.lock:
+            self.values[labels] = value
+
+    def get(self, labels: Labels) -> Optional[float]:
+        with self.lock:
+            return self.values.get(labels)
+
+    def samples(self) -> Iterable[str]:
+        with self.lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+
+    def reset(self) -> None:
+        with self.lock:
+            self.values.clear()
+
+
+class Histogram:
+    """
+    Observations counted in cumulative buckets, by labels.
+    """
+    TYPE = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = list(buckets) + [math.inf]
+        self.lock = threading.Lock()
+        # Map from labels to (bucket counts, sum).
+        self.values: Dict[Labels, Tuple[List[int], float]] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        with self.lock:
+            counts, total = self.values.get(labels) or ([0] * len(self.buckets), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[labels] = (counts, total + value)
+
+    def count(self, labels: Labels) -> int:
+        with self.lock:
+            counts, _ = self.values.get(labels) or ([0], 0.0)
+            return sum(counts)
+
+    def samples(self) -> Iterable[str]:
+        with self.lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self.values.items())
+        names = self.label_names + ("le",)
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _format_value(bound)
+                yield f"{self.name}_bucket{_format_labels(names, labels + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}"
+
+    def reset(self) -> None:
+        with self.lock:
+            self.values.clear()
+
+
+class Registry:
+    """
+    A collection of metrics to render together.
+
+    Collectors are functions called at render time to report values kept
+    elsewhere.  They return (name, type, help, [(labels dict, value)]) tuples.
+    """
+    def __init__(self):
+        self.metrics: List = []
+        self.collectors: List[Callable[[], Iterable[Tuple]]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple]]) -> None:
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """The metrics in Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines.extend(metric.samples())
+        for collector in self.collectors:
+            for name, metric_type, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        for metric in self.metrics:
+            metric.reset()
+
+
+registry = Registry()
+
+HTTP_LABELS = ("service", "method", "endpoint", "task")
+
+http_requests = registry.register(Counter(
+    "openedx_webhooks_http_requests_total",
+    "HTTP requests made to GitHub and Jira.",
+    HTTP_LABELS + ("status",),
+))
+http_duration = registry.register(Histogram(
+    "openedx_webhooks_http_request_duration_seconds",
+    "Time spent waiting for HTTP responses from GitHub and Jira.",
+    HTTP_LABELS,
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30),
+))
+http_bytes = registry.register(Counter(
+    "openedx_webhooks_http_response_bytes_total",
+    "Bytes received in HTTP responses from GitHub and Jira.",
+    HTTP_LABELS,
+))
+
+GRAPHQL_LABELS = ("query", "task")
+
+graphql_queries = registry.register(Counter(
+    "openedx_webhooks_graphql_queries_total",
+    "GraphQL queries and mutations made to GitHub, by query name.",
+    GRAPHQL_LABELS,
+))
+graphql_cost = registry.register(Counter(
+    "openedx_webhooks_graphql_cost_points_total",
+    "GitHub GraphQL rate limit points spent, by query name.",
+    GRAPHQL_LABELS,
+))
+graphql_remaining = registry.register(Gauge(
+    "openedx_webhooks_graphql_points_remaining",
+    "GitHub GraphQL rate limit points remaining, as last reported.",
+    [],
+))
+graphql_reset = registry.register(Gauge(
+    "openedx_webhooks_graphql_points_reset_timestamp_seconds",
+    "When the GitHub GraphQL rate limit points will be reset.",
+    [],
+))
+
+webhook_duplicates = registry.register(Counter(
+    "openedx_webhooks_webhook_duplicates_total",
+    "GitHub webhook deliveries dropped because they had been received before.",
+    ("event",),
+))
+
+
+# Rewrites of URL paths into endpoint templates, applied in order.
+ENDPOINT_RULES = [
+    (re.compile(r"^/repos/[^/]+/[^/]+"), "/repos/{repo}"),
+    (re.compile(r"^/(orgs|users)/[^/]+"), r"/\1/{name}"),
+    (re.compile(r"/contents/.*$"), "/contents/{path}"),
+    (re.compile(r"/labels/[^/]+"), "/labels/{label}"),
+    (re.compile(r"/(branches|commits|status|statuses)/[^/]+"), r"/\1/{ref}"),
+    (re.compile(r"/[A-Z][A-Z0-9]+-\d+(?=/|$)"), "/{issue}"),
+    (re.compile(r"(?<!/api)/\d+(?=/|$)"), "/{n}"),
+]
+
+
+def endpoint_template(url: str) -> str:
+    """
+    Normalize a URL to an endpoint template, so similar requests are grouped.
+    """
+    url = URLObject(url)
+    path = url.path or "/"
+    if url.hostname == "raw.githubusercontent.com":
+        # /{owner}/{repo}/{ref}/{file}: the files are few enough to keep.
+        parts = path.split("/", 4)
+        if len(parts) == 5:
+            return f"/{{repo}}/{{ref}}/{parts[4]}"
+        return path
+    for pattern, replacement in ENDPOINT_RULES:
+        path = pattern.sub(replacement, path)
+    return path
+
+
+def record_request(service: str, request, response, seconds: float, stream: bool = False) -> None:
+    """
+    Record the metrics for one HTTP call.
+    """
+    labels = (service, request.method, endpoint_template(request.url), current_task_name())
+    http_requests.inc(labels + (str(response.status_code),))
+    http_duration.observe(labels, seconds)
+    size = response.headers.get("Content-Length")
+    if size is not None and size.isdigit():
+        http_bytes.inc(labels, int(size))
+    elif not stream:
+        http_bytes.inc(labels, len(response.content))
+
+
+def record_graphql(query_name: str, rate_limit: Optional[Dict]) -> None:
+    """
+    Record the metrics for one GraphQL query.
+
+    `rate_limit` is the query's `rateLimit` result, if it asked for one.
+    Mutations can't, so only their number is counted.
+    """
+    labels = (query_name, current_task_name())
+    graphql_queries.inc(labels)
+    if rate_limit:
+        graphql_cost.inc(labels, rate_limit["cost"])
+        graphql_remaining.set((), rate_limit["remaining"])
+        reset_at = rate_limit.get("resetAt")
+        if reset_at:
+            graphql_reset.set((), parse_date(reset_at).timestamp())
+
+
+_last_push = 0.0
+_push_lock = threading.Lock()
+
+
+def push_metrics_if_due() -> None:
+    """
+    Push our metrics to the Pushgateway, if it's configured and it's time to.
+    """
+    global _last_push   # pylint: disable=global-statement
+    if not settings.METRICS_PUSHGATEWAY_URL:
+        return
+    with _push_lock:
+        now = time.time()
+        if now - _last_push < settings.METRICS_PUSH_INTERVAL:
+            return
+        _last_push = now
+    push_metrics()
+
+
+def push_instance() -> str:
+    """
+    The Pushgateway instance label for this process.
+
+    Pool processes are labelled by their index in the pool rather than their
+    pid, so that a process replacing a recycled one takes over its group
+    instead of leaving the old group behind forever.
+    """
+    index = getattr(current_process(), "index", None)
+    worker = "main" if index is None else str(index)
+    return f"{socket.gethostname()}-{worker}"
+
+
+def push_metrics() -> None:
+    """
+    Push our metrics to the Pushgateway, replacing what this process pushed before.
+    """
+    instance = push_instance()
+    url = f"{settings.METRICS_PUSHGATEWAY_URL.rstrip('/')}/metrics/job/openedx-webhooks-worker/instance/{instance}"
+    try:
+        # A plain request, so that pushing metrics isn't itself measured.
+        resp = requests.put(url, data=registry.render().encode("utf-8"), timeout=5)
+        resp.raise_for_status()
+    except requests.RequestException as exc:
+        logger.warning(f"Couldn't push metrics to {url}: {exc}")
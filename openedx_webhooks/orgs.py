@@ -0,0 +1,42 @@
+"""
+An index of orgs.yaml, for deciding whether pull requests are internal.
+
+Institutions are named in people's data by their key in orgs.yaml, or by
+their "name".  Every pull request by someone with an institution asks
+whether that institution is internal to the pull request's GitHub org, so
+the answers are precomputed as a set of GitHub orgs for each name.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, FrozenSet, Optional
+
+
+class OrgsIndex:
+    """
+    The orgs from `get_orgs_file`, compiled for internal checks.
+    """
+    def __init__(self, orgs: Dict[str, Dict]):
+        self.orgs = orgs
+        # Institutions internal to every GitHub org (the old "internal" flag).
+        self.internal_everywhere: FrozenSet[str] = frozenset(
+            name for name, org_data in orgs.items() if org_data.get("internal", False)
+        )
+        self.internal_ghorgs: Dict[str, FrozenSet[str]] = {
+            name: frozenset(org_data.get("internal-ghorgs", ()))
+            for name, org_data in orgs.items()
+        }
+
+    def org(self, name: str) -> Optional[Dict]:
+        """The orgs.yaml record for an institution name or alias, if any."""
+        return self.orgs.get(name)
+
+    def is_internal(self, institution: str, gh_org: str) -> bool:
+        """Is `institution` internal to the GitHub org `gh_org`?"""
+        if institution in self.internal_everywhere:
+            # This is an temporary stop-gap: the old data will work with the new
+            # code so we can deploy new code and then update the data files.
+            # Once the data files are updated to remove "internal", we can get rid
+            # of this code.
+            return True
+        return gh_org in self.internal_ghorgs.get(institution, ())
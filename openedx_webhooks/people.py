@@ -0,0 +1,100 @@
+"""
+A precompiled index of people.yaml, for looking up pull request authors.
+
+People's data can change over time: the "before" clauses in people.yaml say
+what was true before a date.  Rescans classify thousands of pull requests,
+asking about each author at the time their pull request was made, so each
+person's history is compiled once into a sorted list of dates and the
+state that applies up to each one.
+"""
+
+from __future__ import annotations
+
+import bisect
+import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+class CommitRights:
+    """
+    Where someone can commit: whole orgs, repos, or branches.
+
+    Branches ending with "*" are prefixes.
+    """
+    __slots__ = ("orgs", "repos", "branches", "branch_prefixes")
+
+    def __init__(self, rights: Dict):
+        self.orgs = frozenset(rights.get("orgs", ()))
+        self.repos = frozenset(rights.get("repos", ()))
+        branches = rights.get("branches", ())
+        self.branches = frozenset(b for b in branches if not b.endswith("*"))
+        self.branch_prefixes = tuple(b[:-1] for b in branches if b.endswith("*"))
+
+    def allows(self, repo: str, branch: str) -> bool:
+        """Can these rights commit to `branch` in `repo` ("owner/name")?"""
+        if repo.partition("/")[0] in self.orgs:
+            return True
+        if repo in self.repos:
+            return True
+        if branch in self.branches:
+            return True
+        return branch.startswith(self.branch_prefixes)
+
+
+class PersonState:
+    """
+    What we need to know about a person at a particular time.
+    """
+    __slots__ = ("agreement", "institution", "committer")
+
+    def __init__(self, person: Dict):
+        self.agreement: str = person.get("agreement", "none")
+        self.institution: Optional[str] = person.get("institution")
+        rights = person.get("committer")
+        self.committer: Optional[CommitRights] = CommitRights(rights) if isinstance(rights, dict) else None
+
+
+class PersonHistory:
+    """
+    A person's states over time.
+
+    `dates` are the "before" dates in ascending order. The state at a time
+    on or before dates[i] (but after dates[i-1]) is states[i], and after all
+    the dates it's states[-1].
+    """
+    __slots__ = ("dates", "states")
+
+    def __init__(self, person: Dict):
+        before = person.get("before") or {}
+        self.dates: List[datetime.date] = sorted(before)
+        # Layer the "before" clauses from the latest to the earliest, so
+        # that each state includes all the clauses that apply to it.
+        layered = dict(person)
+        states = [PersonState(layered)]
+        for before_date in reversed(self.dates):
+            layered.update(before[before_date])
+            states.append(PersonState(layered))
+        states.reverse()
+        self.states: Tuple[PersonState, ...] = tuple(states)
+
+    def at(self, date: datetime.date) -> PersonState:
+        return self.states[bisect.bisect_left(self.dates, date)]
+
+
+class PeopleIndex:
+    """
+    The people from `get_people_file`, compiled for lookups by time.
+    """
+    def __init__(self, people: Dict[str, Dict]):
+        # The people these were compiled from, to know when to recompile.
+        self.people = people
+        self.histories = {login: PersonHistory(person) for login, person in people.items()}
+
+    def person_at(self, login: str, when: datetime.date) -> Optional[PersonState]:
+        """
+        The state of person `login` on date `when`, or None if we don't know them.
+        """
+        history = self.histories.get(login)
+        if history is None:
+            return None
+        return history.at(when)
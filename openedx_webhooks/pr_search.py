@@ -0,0 +1,140 @@
+"""
+Find the pull requests in an entire GitHub organization.
+
+Listing every repo in an org, then every pull request in each repo, costs
+thousands of requests for an org with hundreds of mostly-idle repos.  One
+GraphQL search finds the candidates across the whole org, a hundred at a
+time, with the fields we need to decide whether to look at them closely.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from openedx_webhooks.tasks import logger
+from openedx_webhooks.types import PrDict
+from openedx_webhooks.utils import graphql_query
+
+# The name of the query is used by FakeGitHub while testing.
+
+ORG_PULL_REQUESTS = """\
+query OrgPullRequests (
+  $query: String!
+  $cursor: String
+) {
+  search (type: ISSUE, query: $query, first: 100, after: $cursor) {
+    issueCount
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+    nodes {
+      ... on PullRequest {
+        number
+        state
+        createdAt
+        author {
+          login
+        }
+        repository {
+          name
+          nameWithOwner
+          owner {
+            login
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+# GitHub search never returns more than this many results for one query.
+SEARCH_RESULT_LIMIT = 1000
+
+
+def search_query(org: str, allpr: bool, since: str, latest: str = "") -> str:
+    """
+    The search string for pull requests in `org` created since `since`.
+    """
+    terms = [f"org:{org}", "is:pr"]
+    if not allpr:
+        terms.append("is:open")
+    terms.append(f"created:>={since}")
+    if latest:
+        terms.append(f"created:<={latest}")
+    terms.append("sort:created-asc")
+    return " ".join(terms)
+
+
+def _pr_from_node(node: Dict) -> PrDict:
+    """
+    Make a partial pull request dict from a search result node.
+
+    It has only the fields used to choose pull requests to rescan, in the
+    same form as the REST API's, including the URL to get the rest.
+    """
+    repo = node["repository"]
+    author = node["author"] or {"login": "ghost"}
+    return {
+        "number": node["number"],
+        "url": f"https://api.github.com/repos/{repo['nameWithOwner']}/pulls/{node['number']}",
+        "state": "open" if node["state"] == "OPEN" else "closed",
+        "created_at": node["createdAt"],
+        "user": {"login": author["login"]},
+        "base": {
+            "repo": {
+                "name": repo["name"],
+                "full_name": repo["nameWithOwner"],
+                "owner": {"login": repo["owner"]["login"]},
+            },
+        },
+    }
+
+
+def _search_pages(query: str) -> Iterator[Tuple[int, List[Dict]]]:
+    """
+    Run a search, producing (issueCount, nodes) for each page.
+    """
+    cursor: Optional[str] = None
+    while True:
+        data = graphql_query(query=ORG_PULL_REQUESTS, variables={"query": query, "cursor": cursor})
+        search = data["search"]
+        yield search["issueCount"], search["nodes"]
+        if not search["pageInfo"]["hasNextPage"]:
+            break
+        cursor = search["pageInfo"]["endCursor"]
+
+
+def org_pull_requests(org: str, allpr: bool, earliest: str, latest: str = "") -> Iterator[PrDict]:
+    """
+    Find the pull requests in `org` created between `earliest` and `latest`.
+
+    If `allpr` is False, only open pull requests are found.  The pull
+    requests are partial: see `_pr_from_node`.
+
+    Searches are limited to SEARCH_RESULT_LIMIT results, so if there are
+    more, the search is repeated from the creation time of the last one
+    found.
+    """
+    since = earliest
+    seen: Set[Tuple[str, int]] = set()
+    while True:
+        found = 0
+        last_created = since
+        total = 0
+        for total, nodes in _search_pages(search_query(org, allpr, since, latest)):
+            for node in nodes:
+                found += 1
+                pr = _pr_from_node(node)
+                last_created = pr["created_at"]
+                key = (pr["base"]["repo"]["full_name"], pr["number"])
+                if key not in seen:
+                    seen.add(key)
+                    yield pr
+        if total <= found:
+            break
+        if last_created == since:
+            logger.warning(f"Too many pull requests in {org} created at {since} to search for them all")
+            break
+        since = last_created
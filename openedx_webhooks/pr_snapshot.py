@@ -0,0 +1,267 @@
+"""
+Get everything we need to know about a pull request's current state at once.
+
+Examining a pull request used to take a handful of requests: the comments
+(twice), the projects, the commits and the commit statuses.  One GraphQL
+query gets them all, plus the labels and draft state.  When rescanning, one
+query gets them for a batch of pull requests.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from glom import glom
+
+from openedx_webhooks.cla_check import CLA_CONTEXT
+from openedx_webhooks.info import get_bot_username, is_draft_pull_request
+from openedx_webhooks.lib.github.models import PrId
+from openedx_webhooks.types import GhProject, PrCommentDict, PrDict
+from openedx_webhooks.utils import graphql_query
+
+# The name of the query is used by FakeGitHub while testing.
+
+COMMENT_FIELDS = """\
+      totalCount
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        databaseId
+        body
+        author {
+          login
+        }
+      }
+"""
+
+# The fields of a pull request we need, indented to go in a query.
+PR_FIELDS = """\
+      title
+      isDraft
+      merged
+      additions
+      deletions
+      labels (first: 100) {
+        nodes {
+          name
+        }
+      }
+      projectItems (first: 100) {
+        nodes {
+          project {
+            number
+            owner {
+              ... on Organization {
+                login
+              }
+            }
+          }
+        }
+      }
+      commits (last: 1) {
+        nodes {
+          commit {
+            oid
+            status {
+              contexts {
+                context
+                state
+                description
+                targetUrl
+              }
+            }
+          }
+        }
+      }
+      comments (first: 100) {
+""" + COMMENT_FIELDS + """\
+      }
+"""
+
+PR_SNAPSHOT = """\
+query PrSnapshot (
+  $owner: String!
+  $name: String!
+  $number: Int!
+) {
+  repository (owner: $owner, name: $name) {
+    pullRequest (number: $number) {
+""" + PR_FIELDS + """\
+    }
+  }
+}
+"""
+
+# Snapshots of many pull requests are fetched this many at a time.
+SNAPSHOT_BATCH_SIZE = 20
+
+
+def pr_snapshots_query(count: int) -> str:
+    """
+    The text of a query for snapshots of `count` pull requests in a repo.
+
+    The variables are owner, name, number0, number1, etc.
+    """
+    params = "".join(f"  $number{i}: Int!\n" for i in range(count))
+    prs = "".join(
+        f"    pr{i}: pullRequest (number: $number{i}) {{\n" + PR_FIELDS + "    }\n"
+        for i in range(count)
+    )
+    return (
+        "query PrSnapshots (\n  $owner: String!\n  $name: String!\n" + params + ") {\n"
+        + "  repository (owner: $owner, name: $name) {\n" + prs + "  }\n}\n"
+    )
+
+
+PR_COMMENTS = """\
+query PrComments (
+  $owner: String!
+  $name: String!
+  $number: Int!
+  $cursor: String!
+) {
+  repository (owner: $owner, name: $name) {
+    pullRequest (number: $number) {
+      comments (first: 100, after: $cursor) {
+""" + COMMENT_FIELDS + """\
+      }
+    }
+  }
+}
+"""
+
+
+@dataclasses.dataclass
+class PrSnapshot:
+    """
+    The state of a pull request on GitHub.
+    """
+    title: str
+    draft: bool
+    merged: bool
+    additions: Optional[int]
+    deletions: Optional[int]
+    labels: Set[str]
+    projects: Set[GhProject]
+    # The statuses on the head commit, keyed by context, in the same form
+    # as the REST API's statuses.
+    statuses: Dict[str, Dict[str, str]]
+    # All the comments, in the same form as the REST API's comments.
+    comments: List[PrCommentDict]
+
+    def bot_comments(self) -> List[PrCommentDict]:
+        """The comments the bot has made."""
+        my_username = get_bot_username()
+        return [com for com in self.comments if com["user"]["login"] == my_username]
+
+    def is_draft(self) -> bool:
+        return is_draft_pull_request({"draft": self.draft, "title": self.title})  # type: ignore[arg-type]
+
+    def cla_status(self) -> Optional[Dict[str, str]]:
+        return self.statuses.get(CLA_CONTEXT)
+
+    def complete_pull_request(self, listed_pr: PrDict) -> PrDict:
+        """
+        Add the fields missing from a pull request as listed by the REST API.
+        """
+        pr = {**listed_pr, "merged": self.merged}
+        if self.additions is not None:
+            pr["additions"] = self.additions
+        if self.deletions is not None:
+            pr["deletions"] = self.deletions
+        return pr    # type: ignore[return-value]
+
+
+def _rest_comment(node: Dict) -> PrCommentDict:
+    author = node["author"] or {"login": "ghost"}
+    return {"id": node["databaseId"], "body": node["body"], "user": {"login": author["login"]}}
+
+
+def _rest_status(context: Dict) -> Dict[str, str]:
+    status = {
+        "context": context["context"],
+        "state": context["state"].lower(),
+        "description": context["description"],
+        "target_url": context["targetUrl"],
+    }
+    # Our own statuses don't always have all of the fields.
+    return {k: v for k, v in status.items() if v is not None}
+
+
+def _snapshot_from_data(pr: Dict, owner: str, name: str, number: int) -> PrSnapshot:
+    """
+    Make a PrSnapshot from the PR_FIELDS of a pull request, getting the rest
+    of the comments if there are more.
+    """
+    comments_data = pr["comments"]
+    comments = [_rest_comment(node) for node in comments_data["nodes"]]
+    while comments_data["pageInfo"]["hasNextPage"]:
+        more = graphql_query(
+            query=PR_COMMENTS,
+            variables={
+                "owner": owner,
+                "name": name,
+                "number": number,
+                "cursor": comments_data["pageInfo"]["endCursor"],
+            },
+        )
+        comments_data = more["repository"]["pullRequest"]["comments"]
+        comments.extend(_rest_comment(node) for node in comments_data["nodes"])
+
+    statuses = {}
+    for commit in glom(pr, "commits.nodes"):
+        for context in glom(commit, "commit.status.contexts", default=None) or []:
+            statuses[context["context"]] = _rest_status(context)
+
+    return PrSnapshot(
+        title=pr["title"],
+        draft=pr["isDraft"],
+        merged=pr["merged"],
+        additions=pr["additions"],
+        deletions=pr["deletions"],
+        labels={lbl["name"] for lbl in pr["labels"]["nodes"]},
+        projects={
+            (glom(item, "project.owner.login"), glom(item, "project.number"))
+            for item in pr["projectItems"]["nodes"]
+        },
+        statuses=statuses,
+        comments=comments,
+    )
+
+
+def get_pr_snapshot(prid: PrId) -> PrSnapshot:
+    """
+    Get the current state of a pull request with one query (or more, if it
+    has more than 100 comments).
+    """
+    owner, _, name = prid.full_name.partition("/")
+    variables = {"owner": owner, "name": name, "number": prid.number}
+    data = graphql_query(query=PR_SNAPSHOT, variables=variables)
+    return _snapshot_from_data(data["repository"]["pullRequest"], owner, name, prid.number)
+
+
+def get_pr_snapshots(repo: str, numbers: Iterable[int]) -> Dict[int, PrSnapshot]:
+    """
+    Get the current state of many pull requests in `repo`.
+
+    The pull requests are fetched SNAPSHOT_BATCH_SIZE at a time with one
+    query each (plus more for pull requests with over 100 comments).
+
+    Returns a dict mapping pull request numbers to snapshots.
+    """
+    owner, _, name = repo.partition("/")
+    numbers = list(numbers)
+    snapshots = {}
+    for start in range(0, len(numbers), SNAPSHOT_BATCH_SIZE):
+        batch = numbers[start:start + SNAPSHOT_BATCH_SIZE]
+        variables: Dict[str, Any] = {"owner": owner, "name": name}
+        for i, number in enumerate(batch):
+            variables[f"number{i}"] = number
+        data = graphql_query(query=pr_snapshots_query(len(batch)), variables=variables)
+        for i, number in enumerate(batch):
+            pr = data["repository"][f"pr{i}"]
+            snapshots[number] = _snapshot_from_data(pr, owner, name, number)
+    return snapshots
@@ -0,0 +1,251 @@
+"""
+Keep track of the GitHub rate limit, and slow down before we run out.
+
+Every GitHub response tells us the state of the rate limit in its
+X-RateLimit-* headers.  We record the latest state (in the shared Redis if
+there is one, so all processes see the same budget), and check it before
+making requests.
+
+Work has a priority.  Live work (handling webhook events) can use the whole
+budget.  Low-priority work (rescans) leaves GITHUB_RATE_LIMIT_RESERVE of the
+budget for live work: as the budget gets close to the reserve, low-priority
+requests are spread out until the reset time, and once the budget is down to
+the reserve, they pause until the reset.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import dataclasses
+import logging
+import threading
+import time
+from time import sleep as throttle_sleep   # so that we can patch it for tests.
+from typing import Dict, Iterator, Optional
+
+import redis
+from urlobject import URLObject
+
+from openedx_webhooks import settings
+from openedx_webhooks.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Priorities of work.
+LIVE = "live"
+LOW = "low"
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("github_priority", default=LIVE)
+
+
+@contextlib.contextmanager
+def rate_limit_priority(priority: str) -> Iterator[None]:
+    """
+    Make GitHub requests in this block at `priority`.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    """The priority of GitHub requests made now."""
+    return _priority.get()
+
+
+@dataclasses.dataclass
+class RateLimitState:
+    """
+    The state of one GitHub rate limit resource ("core", "graphql", etc).
+    """
+    resource: str
+    limit: int
+    remaining: int
+    used: int
+    reset: int      # The time the budget is reset, in epoch seconds.
+
+    @classmethod
+    def from_headers(cls, headers) -> Optional[RateLimitState]:
+        """Read the state from response headers, or None if they aren't there."""
+        try:
+            return cls(
+                resource=headers.get("X-RateLimit-Resource", "core"),
+                limit=int(headers["X-RateLimit-Limit"]),
+                remaining=int(headers["X-RateLimit-Remaining"]),
+                used=int(headers.get("X-RateLimit-Used", 0)),
+                reset=int(headers["X-RateLimit-Reset"]),
+            )
+        except (KeyError, ValueError):
+            return None
+
+    def supersedes(self, other: RateLimitState) -> bool:
+        """
+        Is this state more current than `other`?
+
+        Responses can arrive out of order, so within one reset period the
+        lowest remaining count is the right one.
+        """
+        if self.reset != other.reset:
+            return self.reset > other.reset
+        return self.remaining < other.remaining
+
+
+class LocalRateLimitStore:
+    """
+    Rate limit states kept in this process.
+    """
+    def __init__(self):
+        self.states: Dict[str, RateLimitState] = {}
+        self.lock = threading.Lock()
+
+    def get(self, resource: str) -> Optional[RateLimitState]:
+        with self.lock:
+            return self.states.get(resource)
+
+    def update(self, state: RateLimitState) -> None:
+        with self.lock:
+            current = self.states.get(state.resource)
+            if current is None or state.supersedes(current):
+                self.states[state.resource] = state
+
+
+class RedisRateLimitStore:
+    """
+    Rate limit states kept in the shared Redis, as one hash per resource.
+    """
+    PREFIX = "openedx-webhooks:github-rate-limit:"
+
+    # Only replace the stored state with a more current one.  This has to be
+    # atomic, so it's a Lua script.
+    UPDATE_SCRIPT = """\
+        local cur = redis.call('HMGET', KEYS[1], 'reset', 'remaining')
+        local reset = tonumber(ARGV[1])
+        local remaining = tonumber(ARGV[2])
+        if (not cur[1]) or reset > tonumber(cur[1])
+            or (reset == tonumber(cur[1]) and remaining < tonumber(cur[2])) then
+            redis.call('HSET', KEYS[1], 'reset', ARGV[1], 'remaining', ARGV[2],
+                'limit', ARGV[3], 'used', ARGV[4])
+            redis.call('EXPIREAT', KEYS[1], reset + 60)
+        end
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.update_script = redis_client.register_script(self.UPDATE_SCRIPT)
+
+    def get(self, resource: str) -> Optional[RateLimitState]:
+        data = self.redis.hgetall(self.PREFIX + resource)
+        if not data:
+            return None
+        return RateLimitState(
+            resource=resource,
+            limit=int(data[b"limit"]),
+            remaining=int(data[b"remaining"]),
+            used=int(data[b"used"]),
+            reset=int(data[b"reset"]),
+        )
+
+    def update(self, state: RateLimitState) -> None:
+        self.update_script(
+            keys=[self.PREFIX + state.resource],
+            args=[state.reset, state.remaining, state.limit, state.used],
+        )
+
+
+def resource_for_url(url: str) -> Optional[str]:
+    """
+    Which rate limit resource does a request to `url` use?
+
+    Returns None for URLs that aren't rate-limited, like raw file contents.
+    """
+    url = URLObject(url)
+    if url.hostname != "api.github.com":
+        return None
+    if url.path == "/graphql":
+        return "graphql"
+    if url.path.startswith("/search/"):
+        return "search"
+    return "core"
+
+
+class RateLimitGovernor:
+    """
+    Record the GitHub rate limit from responses, and throttle requests.
+
+    If the shared Redis can't be reached, we have no rate limit information,
+    and requests go ahead rather than fail.
+    """
+    def __init__(self):
+        self.local_store = LocalRateLimitStore()
+        self.redis_store: Optional[RedisRateLimitStore] = None
+
+    @property
+    def store(self):
+        redis_client = get_redis()
+        if redis_client is None:
+            return self.local_store
+        # Made once per client, so that the script is only registered once.
+        redis_store = self.redis_store
+        if redis_store is None or redis_store.redis is not redis_client:
+            redis_store = self.redis_store = RedisRateLimitStore(redis_client)
+        return redis_store
+
+    def observe(self, response, *args, **kwargs) -> None:
+        """
+        A requests response hook to record the rate limit headers.
+        """
+        state = RateLimitState.from_headers(response.headers)
+        if state is not None:
+            try:
+                self.store.update(state)
+            except redis.RedisError as exc:
+                logger.warning(f"Couldn't record the GitHub rate limit: {exc}")
+
+    def state(self, resource: str = "core") -> Optional[RateLimitState]:
+        """The last-seen state of the `resource` rate limit, or None if we don't know it."""
+        try:
+            return self.store.get(resource)
+        except redis.RedisError as exc:
+            logger.warning(f"Couldn't read the GitHub rate limit: {exc}")
+            return None
+
+    def delay_needed(self, resource: str, priority: str) -> float:
+        """
+        How many seconds should a request for `resource` at `priority` wait?
+        """
+        state = self.state(resource)
+        if state is None:
+            return 0
+        until_reset = state.reset - time.time() + 1
+        if until_reset <= 0:
+            # The budget has been reset since we last heard.
+            return 0
+        reserved = state.limit * settings.GITHUB_RATE_LIMIT_RESERVE if priority == LOW else 0
+        available = state.remaining - reserved
+        if available <= 0:
+            return until_reset
+        if available < reserved:
+            # Getting close: spread the rest of the budget until the reset.
+            return until_reset / available
+        return 0
+
+    def wait_for_budget(self, url: str, priority: Optional[str] = None) -> None:
+        """
+        Wait as needed before making a request to `url`.
+        """
+        resource = resource_for_url(url)
+        if resource is None:
+            return
+        priority = priority or current_priority()
+        delay = self.delay_needed(resource, priority)
+        if delay > 0:
+            if delay > 10:
+                state = self.state(resource)
+                logger.warning(f"Pausing {priority} GitHub work for {delay:.0f}s, rate limit is low: {state}")
+            throttle_sleep(delay)
+
+
+governor = RateLimitGovernor()
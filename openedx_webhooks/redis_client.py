@@ -0,0 +1,31 @@
+"""
+Access to the Redis server shared by all of our processes.
+"""
+
+import functools
+from typing import Optional
+
+import redis
+
+from openedx_webhooks import settings
+
+
+@functools.lru_cache()
+def _redis_for_url(url: str) -> redis.Redis:
+    kwargs = {}
+    if url.startswith("rediss"):
+        # Heroku redis uses self-signed certs.  See config.py.
+        kwargs["ssl_cert_reqs"] = None
+    return redis.Redis.from_url(url, **kwargs)
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """
+    Get the shared Redis client, or None if no shared Redis is configured.
+
+    redis-py makes new connections in forked processes, so the client can
+    be kept for the life of the process.
+    """
+    if not settings.SHARED_REDIS_URL:
+        return None
+    return _redis_for_url(settings.SHARED_REDIS_URL)
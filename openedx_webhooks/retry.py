@@ -0,0 +1,250 @@
+"""
+Retry flaky requests, with exponential backoff and a retry budget.
+
+A RetryPolicy decides which outcomes are worth retrying (a 404 from GitHub
+replication lag, an empty body from Jira, a dropped connection) and which are
+final, and how long to wait between attempts.  The waits grow exponentially,
+with full jitter so that retries from many workers don't arrive together.
+
+Each Celery task gets a retry budget: a limit on the total time it will spend
+waiting to retry.  Once the budget is used up, outcomes are taken as final,
+so one bad stretch of responses can't stall a task for minutes.
+
+Retries are counted, so we can see how much latency they add.
+"""
+
+from __future__ import annotations
+
+import collections
+import contextlib
+import contextvars
+import dataclasses
+import logging
+import random
+import threading
+from time import sleep as retry_sleep   # so that we can patch it for tests.
+from typing import Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+import requests
+
+from openedx_webhooks import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Responses that mean the server had a passing problem.
+RETRYABLE_STATUSES = {502, 503, 504}
+
+
+def connection_problem(exc: Exception) -> Optional[str]:
+    """
+    Classify exceptions: dropped connections and timeouts are worth retrying.
+    """
+    if isinstance(exc, requests.ConnectionError):
+        return "connection error"
+    if isinstance(exc, requests.Timeout):
+        return "timeout"
+    return None
+
+
+@dataclasses.dataclass(frozen=True)
+class RetryPolicy:
+    """
+    How to retry one kind of operation.
+
+    `classify` looks at a result and returns the reason to retry it, or None
+    if the result is final.  `classify_exception` does the same for an
+    exception: exceptions it doesn't name a reason for are raised at once.
+    """
+    name: str
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+    classify: Callable[[object], Optional[str]]
+    classify_exception: Callable[[Exception], Optional[str]] = connection_problem
+
+    def delay(self, attempt: int) -> float:
+        """
+        How long to wait after failed attempt number `attempt` (starting at 1).
+        """
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, cap)
+
+
+class RetryBudget:
+    """
+    A limit on the total seconds a unit of work can spend waiting to retry.
+    """
+    def __init__(self, seconds: float):
+        self.remaining = seconds
+        self.lock = threading.Lock()
+
+    def spend(self, seconds: float) -> bool:
+        """
+        Take `seconds` from the budget, or return False if there isn't enough.
+        """
+        with self.lock:
+            if seconds > self.remaining:
+                return False
+            self.remaining -= seconds
+            return True
+
+
+_budget: contextvars.ContextVar[Optional[RetryBudget]] = contextvars.ContextVar("retry_budget", default=None)
+
+
+@contextlib.contextmanager
+def retry_budget(seconds: float) -> Iterator[RetryBudget]:
+    """
+    Limit the time spent waiting to retry in this block to `seconds`.
+    """
+    budget = RetryBudget(seconds)
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+
+class RetryStats:
+    """
+    Counts of retries, by policy and reason.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.retries: Dict[Tuple[str, str], int] = collections.Counter()
+        self.seconds: Dict[str, float] = collections.Counter()
+        self.given_up: Dict[str, int] = collections.Counter()
+
+    def record_retry(self, policy: str, reason: str, delay: float) -> None:
+        with self.lock:
+            self.retries[policy, reason] += 1
+            self.seconds[policy] += delay
+
+    def record_give_up(self, policy: str) -> None:
+        with self.lock:
+            self.given_up[policy] += 1
+
+    def stats(self) -> Dict[str, Dict]:
+        with self.lock:
+            return {
+                "retries": {f"{policy}.{reason}": n for (policy, reason), n in self.retries.items()},
+                "seconds": dict(self.seconds),
+                "given_up": dict(self.given_up),
+            }
+
+    def reset(self) -> None:
+        with self.lock:
+            self.retries.clear()
+            self.seconds.clear()
+            self.given_up.clear()
+
+
+retry_stats = RetryStats()
+
+
+def retry_metrics():
+    """A metrics collector for the retry counts."""
+    with retry_stats.lock:
+        retries = [({"policy": policy, "reason": reason}, n) for (policy, reason), n in retry_stats.retries.items()]
+        seconds = [({"policy": policy}, n) for policy, n in retry_stats.seconds.items()]
+        given_up = [({"policy": policy}, n) for policy, n in retry_stats.given_up.items()]
+    yield ("openedx_webhooks_retries_total", "counter", "Requests retried, by policy and reason.", retries)
+    yield ("openedx_webhooks_retry_seconds_total", "counter", "Time spent waiting to retry.", seconds)
+    yield ("openedx_webhooks_retries_given_up_total", "counter", "Retryable results taken as final.", given_up)
+
+
+metrics.registry.register_collector(retry_metrics)
+
+
+def with_retries(policy: RetryPolicy, attempt: Callable[[], T]) -> T:
+    """
+    Call `attempt` until it produces a final result, according to `policy`.
+
+    Returns the last result, even if it was retryable, once the attempts or the
+    budget are used up.  A retryable exception on the last attempt is raised.
+    """
+    for attempt_num in range(1, policy.max_attempts + 1):
+        try:
+            result = attempt()
+        except Exception as exc:    # pylint: disable=broad-except
+            reason = policy.classify_exception(exc)
+            if reason is None or not _pause(policy, reason, attempt_num):
+                raise
+            continue
+        reason = policy.classify(result)
+        if reason is None or not _pause(policy, reason, attempt_num):
+            return result
+        if isinstance(result, requests.Response):
+            # Release the connection of a streamed response we won't read.
+            result.close()
+    raise AssertionError("unreachable")     # pragma: no cover
+
+
+def _pause(policy: RetryPolicy, reason: str, attempt_num: int) -> bool:
+    """
+    Wait before trying again, or return False if we shouldn't try again.
+    """
+    if attempt_num >= policy.max_attempts:
+        retry_stats.record_give_up(policy.name)
+        logger.info(f"Giving up on {policy.name} after {attempt_num} attempts: {reason}")
+        return False
+    delay = policy.delay(attempt_num)
+    budget = _budget.get()
+    if budget is not None and not budget.spend(delay):
+        retry_stats.record_give_up(policy.name)
+        logger.info(f"Giving up on {policy.name}, the retry budget is used up: {reason}")
+        return False
+    retry_stats.record_retry(policy.name, reason, delay)
+    retry_sleep(delay)
+    return True
+
+
+def _github_lag(resp) -> Optional[str]:
+    if resp.status_code == 404:
+        return "404"
+    if resp.status_code in RETRYABLE_STATUSES:
+        return str(resp.status_code)
+    return None
+
+
+def _jira_empty(resp) -> Optional[str]:
+    if resp.status_code in RETRYABLE_STATUSES:
+        return str(resp.status_code)
+    if not resp.content:
+        return "empty"
+    return None
+
+
+# GitHub has been known to send us an event, and then return a 404 when we
+# ask about the thing the event was about.
+GITHUB_REPLICATION_LAG = RetryPolicy(
+    name="github_replication_lag",
+    max_attempts=8,
+    base_delay=0.25,
+    max_delay=2,
+    classify=_github_lag,
+)
+
+# Jira sometimes returns an empty response to a perfectly valid GET request.
+JIRA_EMPTY_RESPONSE = RetryPolicy(
+    name="jira_empty_response",
+    max_attempts=4,
+    base_delay=0.1,
+    max_delay=1,
+    classify=_jira_empty,
+)
+
+# Jira sometimes returns a page of results that isn't valid JSON.  Attempts
+# return (response, decoded) pairs, with BAD_JSON for the decoded value if it
+# couldn't be decoded.
+BAD_JSON = object()
+
+JIRA_BAD_JSON = RetryPolicy(
+    name="jira_bad_json",
+    max_attempts=3,
+    base_delay=0.1,
+    max_delay=1,
+    classify=lambda page: "bad json" if page[1] is BAD_JSON else None,
+)
@@ -1,7 +1,7 @@
 """Settings for how the webhook should behave."""
 
 import os
-from typing import Optional
+from typing import Dict, Optional
 
 from openedx_webhooks.types import GhProject
 
@@ -14,6 +14,102 @@ JIRA_USER_TOKEN = os.environ.get("JIRA_USER_TOKEN", None)
 
 GITHUB_PERSONAL_TOKEN = os.environ.get("GITHUB_PERSONAL_TOKEN", None)
 
+# HTTP sessions are re-used for the life of a process.  These are the number
+# of hosts to keep connection pools for, and the number of keep-alive
+# connections to keep for each host.
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", 10))
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", 10))
+
+# A Redis server for sharing state among all of our processes.  Missing or ""
+# will become None, meaning each process keeps its own state.
+SHARED_REDIS_URL = os.environ.get("REDIS_TLS_URL") or os.environ.get("REDIS_URL") or None
+
+# GitHub GET responses are cached and revalidated with conditional requests.
+# The cache is kept in "memory" (up to HTTP_CACHE_MAX_BYTES per process), or
+# in the shared "redis" (entries expire after HTTP_CACHE_REDIS_TTL seconds).
+HTTP_CACHE_BACKEND = os.environ.get("HTTP_CACHE_BACKEND", "memory")
+HTTP_CACHE_MAX_BYTES = int(os.environ.get("HTTP_CACHE_MAX_BYTES", 20_000_000))
+HTTP_CACHE_REDIS_TTL = int(os.environ.get("HTTP_CACHE_REDIS_TTL", 24 * 60 * 60))
+
+# The openedx-webhooks-data files are revalidated in the background this
+# often.  0 means never: they are read once per process, and only change when
+# a push to the data repo is announced.  Pushes are announced through
+# SHARED_REDIS_URL, so this only catches what the announcements miss.
+DATA_FILE_REFRESH_SECONDS = int(os.environ.get("DATA_FILE_REFRESH_SECONDS", 2 * 60 * 60))
+
+# The data files are shared among our processes through the shared "redis",
+# or "file"s in DATA_FILE_CACHE_DIR on each host.  Anything else (or "file"
+# with no DATA_FILE_CACHE_DIR) means each process reads them itself.  The
+# directory should be one only we can write to, never a shared one like /tmp.
+DATA_FILE_SHARED_CACHE = os.environ.get("DATA_FILE_SHARED_CACHE", "redis")
+DATA_FILE_CACHE_DIR = os.environ.get("DATA_FILE_CACHE_DIR", "")
+
+# The texts of the last good data can be kept in this snapshot file, to use
+# while checking for changes after a restart.  "" means no snapshot.  Like
+# DATA_FILE_CACHE_DIR, it should be somewhere only we can write to.
+DATA_FILE_SNAPSHOT = os.environ.get("DATA_FILE_SNAPSHOT", "")
+
+# Repos' catalog-info.yaml files (or their absence) are cached this long.
+# Pushes changing them on the default branch clear the cache sooner, in all
+# of our processes if SHARED_REDIS_URL is set.  Without a shared Redis, only
+# the web process forgets them, and the workers' copies last this long.
+CATALOG_INFO_TTL = int(os.environ.get("CATALOG_INFO_TTL", 24 * 60 * 60))
+
+# GitHub webhook delivery ids are remembered this long, to drop redeliveries.
+WEBHOOK_DELIVERY_TTL = int(os.environ.get("WEBHOOK_DELIVERY_TTL", 24 * 60 * 60))
+
+# The fraction of the GitHub rate limit reserved for handling live webhook
+# events.  Low-priority work like rescanning slows down and then pauses
+# rather than use it.
+GITHUB_RATE_LIMIT_RESERVE = float(os.environ.get("GITHUB_RATE_LIMIT_RESERVE", 0.2))
+
+
+def read_throttle_settings(defaults: Dict[str, str]) -> Dict[str, str]:
+    """Read throttle rates, letting the environment override the defaults.
+
+    The rate for "github.write" is overridden by THROTTLE_GITHUB_WRITE.
+    """
+    return {
+        name: os.environ.get("THROTTLE_" + name.replace(".", "_").upper(), spec)
+        for name, spec in defaults.items()
+    }
+
+
+# Requests to GitHub and Jira are throttled to avoid their abuse limits. Rates
+# are "rate:burst:concurrency": sustained requests per second, requests
+# allowed at once after a quiet period, and requests allowed in flight.
+THROTTLE_ENABLED = bool(int(os.environ.get("THROTTLE_ENABLED", 1)))
+THROTTLE_RATES = read_throttle_settings({
+    "github.read": "15:50:20",
+    # GitHub allows about 80 content-creating requests a minute.
+    "github.write": "1:10:5",
+    "github.graphql": "5:20:10",
+    "jira.read": "10:30:10",
+    "jira.write": "3:10:5",
+})
+# How long to back off when told to slow down without a Retry-After header.
+THROTTLE_DEFAULT_BACK_OFF = float(os.environ.get("THROTTLE_DEFAULT_BACK_OFF", 60))
+
+# The most time a task will spend waiting to retry flaky requests.  After
+# that, requests aren't retried.
+RETRY_TASK_BUDGET = float(os.environ.get("RETRY_TASK_BUDGET", 60))
+
+# Record GitHub and Jira traffic to a cassette file, or replay it from one.
+# HTTP_CASSETTE_MODE is "record" or "replay", missing or "" means neither.
+# Replayed responses take as long as the recorded ones, times
+# HTTP_CASSETTE_LATENCY_SCALE (0 for no delay).
+HTTP_CASSETTE_MODE = os.environ.get("HTTP_CASSETTE_MODE") or None
+HTTP_CASSETTE_PATH = os.environ.get("HTTP_CASSETTE_PATH", "http-cassette.json.gz")
+HTTP_CASSETTE_LATENCY_SCALE = float(os.environ.get("HTTP_CASSETTE_LATENCY_SCALE", 1))
+
+# Celery workers push their metrics to this Prometheus Pushgateway, at most
+# once every METRICS_PUSH_INTERVAL seconds.  Missing or "" means don't push.
+METRICS_PUSHGATEWAY_URL = os.environ.get("METRICS_PUSHGATEWAY_URL") or None
+METRICS_PUSH_INTERVAL = float(os.environ.get("METRICS_PUSH_INTERVAL", 30))
+
+# How many pages of a long GitHub listing to fetch at once during rescans.
+GITHUB_PAGE_CONCURRENCY = int(os.environ.get("GITHUB_PAGE_CONCURRENCY", 4))
+
 
 def read_project_setting(setting_name: str) -> Optional[GhProject]:
     """Read a project spec from a setting.
@@ -41,9 +137,16 @@ GITHUB_BLENDED_PROJECT = read_project_setting("GITHUB_BLENDED_PROJECT")
 
 # Made-up values to use while testing.
 class TestSettings:
+    DATA_FILE_REFRESH_SECONDS = 0
+    DATA_FILE_SHARED_CACHE = None
+    DATA_FILE_SNAPSHOT = None
     GITHUB_BLENDED_PROJECT = ("blendorg", 42)
     GITHUB_OSPR_PROJECT = ("testorg", 17)
     GITHUB_PERSONAL_TOKEN = "github_pat_FooBarBaz"
+    HTTP_CASSETTE_MODE = None
     JIRA_SERVER = "https://test.atlassian.net"
     JIRA_USER_EMAIL = "someone@megacorp.com"
     JIRA_USER_TOKEN = "xyzzy-123-plugh"
+    METRICS_PUSHGATEWAY_URL = None
+    SHARED_REDIS_URL = None
+    THROTTLE_ENABLED = False
@@ -0,0 +1,102 @@
+"""
+Share one outstanding GET among concurrent callers asking for the same thing.
+
+When a cache expires, every thread in a worker that needs the value misses at
+the same moment, and each makes the same request.  With single-flight, the
+first caller makes the request, and the others wait for it and get copies of
+its response.
+"""
+
+from __future__ import annotations
+
+import collections
+import threading
+from typing import Callable, Dict, Hashable, Optional
+
+import requests
+
+
+class _Call:
+    """One request in flight, and what came of it."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.response: Optional[requests.Response] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent requests.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Dict[Hashable, _Call] = {}
+        # How many requests were made, and how many were shared instead.
+        self.counts: Dict[str, int] = collections.Counter()
+
+    def do(self, key: Hashable, make_request: Callable[[], requests.Response]) -> requests.Response:
+        """
+        Make a request with `make_request`, unless one for `key` is already in flight.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            self.counts["made" if leader else "shared"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            assert call.response is not None
+            return copy_response(call.response)
+
+        try:
+            call.response = make_request()
+            return call.response
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"made": self.counts["made"], "shared": self.counts["shared"]}
+
+
+def copy_response(response: requests.Response) -> requests.Response:
+    """
+    Make a copy of a response whose content has been read, so each caller has its own.
+    """
+    new = requests.Response.__new__(requests.Response)
+    new.__dict__.update(response.__dict__)
+    new.headers = response.headers.copy()
+    new.history = list(response.history)
+    return new
+
+
+def request_key(method, url, kwargs) -> Optional[Hashable]:
+    """
+    The single-flight key for a request, or None if it shouldn't be shared.
+
+    Only plain GETs are shared: streamed responses can only be read once, and
+    anything more exotic than params and headers might not be idempotent.
+    """
+    if method.upper() != "GET" or set(kwargs) - {"params", "headers", "timeout", "allow_redirects"}:
+        return None
+    params = kwargs.get("params") or {}
+    headers = kwargs.get("headers") or {}
+    try:
+        return (
+            str(url),
+            tuple(sorted(dict(params).items())),
+            tuple(sorted((k.lower(), v) for k, v in headers.items())),
+            kwargs.get("allow_redirects", True),
+        )
+    except (TypeError, ValueError):
+        # Params as a list of tuples with unhashable values, or a string.
+        return None
@@ -2,15 +2,20 @@
 Queuable background tasks to do large work.
 """
 
+import itertools
 import traceback
 
-from typing import Dict, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 from urlobject import URLObject
 
-from openedx_webhooks import celery
+from openedx_webhooks import celery, settings
 from openedx_webhooks.auth import get_github_session
-from openedx_webhooks.info import is_internal_pull_request
+from openedx_webhooks.gh_projects import project_item_batch
+from openedx_webhooks.info import is_internal_pull_request, jira_issue_key_from_comments
+from openedx_webhooks.pr_search import org_pull_requests
+from openedx_webhooks.pr_snapshot import SNAPSHOT_BATCH_SIZE, PrSnapshot, get_pr_snapshots
+from openedx_webhooks.rate_limit import LOW, rate_limit_priority
 from openedx_webhooks.tasks import logger
 from openedx_webhooks.tasks.pr_tracking import (
     current_support_state,
@@ -18,14 +23,21 @@ from openedx_webhooks.tasks.pr_tracking import (
     DryRunFixingActions,
     PrTrackingFixer,
 )
-from openedx_webhooks.types import PrDict
+from openedx_webhooks.types import JiraDict, PrDict
 from openedx_webhooks.utils import (
+    get_jira_issues,
     log_rate_limit,
     paginated_get,
     retry_get,
     sentry_extra_context,
 )
 
+# Pull requests before this will not be rescanned. Contractor messages
+# are hard to rescan, and in other ways the early pull requests are
+# different enough that it's hard to do it right.  Our last contractor
+# message was in December 2017.
+EARLIEST_RESCAN = "2018-01-01"
+
 
 @celery.task(bind=True)
 def pull_request_changed_task(_, pull_request):
@@ -38,7 +50,7 @@ def pull_request_changed_task(_, pull_request):
         raise
 
 
-def pull_request_changed(pr: PrDict, actions=None) -> Tuple[Optional[str], bool]:
+def pull_request_changed(pr: PrDict, actions=None, snapshot=None, jira_issues=None) -> Tuple[Optional[str], bool]:
     """
     Process a pull request.
 
@@ -56,6 +68,9 @@ def pull_request_changed(pr: PrDict, actions=None) -> Tuple[Optional[str], bool]
     issue associated with the pull request, if any, as a string. The second
     element in the tuple is a boolean indicating if this function did any
     work, such as making a JIRA issue or commenting on the pull request.
+
+    `snapshot` and `jira_issues` are the current state of the pull request,
+    if it's already known.  See `current_support_state`.
     """
 
     user = pr["user"]["login"]
@@ -66,7 +81,7 @@ def pull_request_changed(pr: PrDict, actions=None) -> Tuple[Optional[str], bool]
 
     desired = desired_support_state(pr)
     if desired is not None:
-        current = current_support_state(pr)
+        current = current_support_state(pr, snapshot=snapshot, jira_issues=jira_issues)
         fixer = PrTrackingFixer(pr, current, desired, actions=actions)
         fixer.fix()
         return fixer.result()
@@ -106,7 +121,8 @@ def rescan_repository_task(task, repo, allpr, dry_run, earliest, latest):
     meta = {"repo": repo}
     task.update_state(state="STARTED", meta=meta)
     callback = PaginateCallback(task, meta=meta)
-    return rescan_repository(repo, allpr, dry_run, earliest, latest, page_callback=callback)
+    with rate_limit_priority(LOW):
+        return rescan_repository(repo, allpr, dry_run, earliest, latest, page_callback=callback)
 
 
 def rescan_repository(
@@ -137,45 +153,80 @@ def rescan_repository(
     state = "all" if allpr else "open"
     url = f"/repos/{repo}/pulls?state={state}"
 
-    changed: Dict[int, Optional[str]] = {}
-    dry_run_actions = {}
+    pull_requests = paginated_get(
+        url,
+        session=get_github_session(),
+        callback=page_callback,
+        concurrency=settings.GITHUB_PAGE_CONCURRENCY,
+        stream=True,
+    )
+    return rescan_pull_requests(repo, pull_requests, dry_run, earliest, latest)
 
-    # Pull requests before this will not be rescanned. Contractor messages
-    # are hard to rescan, and in other ways the early pull requests are
-    # different enough that it's hard to do it right.  Our last contractor
-    # message was in December 2017.
-    earliest = max("2018-01-01", earliest)
 
-    pull_request: PrDict
-    for pull_request in paginated_get(url, session=get_github_session(), callback=page_callback):
-        sentry_extra_context({"pull_request": pull_request})
-        if is_internal_pull_request(pull_request):
-            # Never rescan internal pull requests.
-            continue
+def rescan_pull_requests(
+        repo: str,
+        pull_requests: Iterable[PrDict],
+        dry_run: bool = False,
+        earliest: str = "",
+        latest: str = "",
+        listed: bool = True,
+    ) -> Dict:
+    """
+    Re-scan some of the pull requests in a repo.
 
-        if pull_request["created_at"] < earliest:
-            continue
+    The current state of the pull requests on GitHub and Jira is fetched in
+    batches, rather than one pull request at a time.
 
-        if latest and pull_request["created_at"] > latest:
-            continue
+    `pull_requests` are as listed by the REST API if `listed` is True.
+    Otherwise, they need only have the fields needed to choose which to
+    rescan, and the full pull request is fetched for the ones that are.
 
-        actions = DryRunFixingActions() if dry_run else None
-        try:
-            # Listed pull requests don't have all the information we need,
-            # so get the full description.
-            resp = retry_get(get_github_session(), pull_request["url"])
-            resp.raise_for_status()
-            pull_request = resp.json()
+    See rescan_repository for details of the other arguments, and the
+    return value.
+    """
+    changed: Dict[int, Optional[str]] = {}
+    dry_run_actions = {}
 
-            issue_key, anything_happened = pull_request_changed(pull_request, actions=actions)
+    earliest = max(EARLIEST_RESCAN, earliest)
+
+    for batch in _batches_to_rescan(pull_requests, earliest, latest):
+        snapshots, jira_issues = _current_state_of_batch(repo, batch)
+        # The numbers of the pull requests, by their node ids.
+        numbers: Dict[str, int] = {}
+        try:
+            # Additions to projects are made together at the end of each batch.
+            with project_item_batch() as project_items:
+                for pull_request in batch:
+                    sentry_extra_context({"pull_request": pull_request})
+                    snapshot = snapshots.get(pull_request["number"])
+                    actions = DryRunFixingActions() if dry_run else None
+                    try:
+                        if listed and snapshot is not None:
+                            # Listed pull requests don't have all the information
+                            # we need, but the snapshot has the rest.
+                            pull_request = snapshot.complete_pull_request(pull_request)
+                        else:
+                            resp = retry_get(get_github_session(), pull_request["url"])
+                            resp.raise_for_status()
+                            pull_request = resp.json()
+                        numbers[pull_request["node_id"]] = pull_request["number"]
+
+                        issue_key, anything_happened = pull_request_changed(
+                            pull_request, actions=actions, snapshot=snapshot, jira_issues=jira_issues,
+                        )
+                    except Exception:       # pylint: disable=broad-except
+                        changed[pull_request["number"]] = traceback.format_exc()
+                    else:
+                        if anything_happened:
+                            changed[pull_request["number"]] = issue_key
+                            if dry_run:
+                                assert actions is not None
+                                dry_run_actions[pull_request["number"]] = actions.action_calls
         except Exception:       # pylint: disable=broad-except
-            changed[pull_request["number"]] = traceback.format_exc()
-        else:
-            if anything_happened:
-                changed[pull_request["number"]] = issue_key
-                if dry_run:
-                    assert actions is not None
-                    dry_run_actions[pull_request["number"]] = actions.action_calls
+            # The pull requests weren't added to their projects.
+            failure = traceback.format_exc()
+            for _, pr_node_id in project_items:
+                changed[numbers[pr_node_id]] = failure
 
     if not dry_run:
         logger.info(
@@ -192,13 +243,65 @@ def rescan_repository(
     return info
 
 
+def _batches_to_rescan(pull_requests: Iterable[PrDict], earliest: str, latest: str) -> Iterator[List[PrDict]]:
+    """
+    Choose which pull requests to rescan, in batches for fetching their state.
+
+    Each batch is yielded as soon as it is full, so that a long listing of pull
+    requests is never all in memory at once.
+    """
+    batch: List[PrDict] = []
+    for pull_request in pull_requests:
+        sentry_extra_context({"pull_request": pull_request})
+        if is_internal_pull_request(pull_request):
+            # Never rescan internal pull requests.
+            continue
+
+        if pull_request["created_at"] < earliest:
+            continue
+
+        if latest and pull_request["created_at"] > latest:
+            continue
+
+        batch.append(pull_request)
+        if len(batch) == SNAPSHOT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _current_state_of_batch(
+        repo: str,
+        pull_requests: List[PrDict],
+    ) -> Tuple[Dict[int, PrSnapshot], Optional[Dict[str, Optional[JiraDict]]]]:
+    """
+    Get the GitHub snapshots of `pull_requests`, and the Jira issues they
+    mention, with as few requests as possible.
+
+    If that fails, the state will be found one pull request at a time.
+    """
+    try:
+        snapshots = get_pr_snapshots(repo, [pr["number"] for pr in pull_requests])
+        jira_keys = []
+        for snapshot in snapshots.values():
+            on_our_jira, jira_key = jira_issue_key_from_comments(snapshot.bot_comments())
+            if on_our_jira and jira_key:
+                jira_keys.append(jira_key)
+        return snapshots, get_jira_issues(jira_keys)
+    except Exception as exc:     # pylint: disable=broad-except
+        logger.exception(f"Couldn't get the state of pull requests in {repo}: {exc}")
+        return {}, None
+
+
 @celery.task(bind=True)
 def rescan_organization_task(task, org, allpr, dry_run, earliest, latest):
     """A bound Celery task to call rescan_organization."""
     meta = {"org": org}
     task.update_state(state="STARTED", meta=meta)
     callback = PaginateCallback(task, meta)
-    return rescan_organization(org, allpr, dry_run, earliest, latest, page_callback=callback)
+    with rate_limit_priority(LOW):
+        return rescan_organization(org, allpr, dry_run, earliest, latest, page_callback=callback)
 
 def rescan_organization(
         org: str,
@@ -207,15 +310,28 @@ def rescan_organization(
         earliest: str = "",
         latest: str = "",
         page_callback=None,
+        search: bool = True,
     ) -> Dict:
     """
     Re-scan an entire organization.
 
-    See rescan_repository for details of the arguments.
+    If `search` is True, the pull requests to rescan are found with one
+    GraphQL search of the whole organization.  Otherwise, each repo's pull
+    requests are listed, which takes many more requests.
+
+    See rescan_repository for details of the other arguments.
     """
+    if search:
+        return _rescan_organization_by_search(org, allpr, dry_run, earliest, latest, page_callback)
+
     infos = {}
     org_url = f"https://api.github.com/orgs/{org}/repos"
-    repos = list(paginated_get(org_url, callback=page_callback))
+    repos = list(paginated_get(
+        org_url,
+        session=get_github_session(),
+        callback=page_callback,
+        concurrency=settings.GITHUB_PAGE_CONCURRENCY,
+    ))
     for irepo, repo in enumerate(repos):
         repo_name = repo["full_name"]
         if page_callback is not None:
@@ -224,3 +340,23 @@ def rescan_organization(
         if list(info) != ["repo"]:
             infos[repo_name] = info
     return infos
+
+
+def _rescan_organization_by_search(org, allpr, dry_run, earliest, latest, page_callback) -> Dict:
+    """
+    Re-scan the pull requests found by searching an entire organization.
+    """
+    pull_requests = sorted(
+        org_pull_requests(org, allpr, max(EARLIEST_RESCAN, earliest), latest),
+        key=lambda pr: (pr["base"]["repo"]["full_name"], pr["number"]),
+    )
+    by_repo = itertools.groupby(pull_requests, key=lambda pr: pr["base"]["repo"]["full_name"])
+    infos = {}
+    for repo_name, repo_pull_requests in by_repo:
+        sentry_extra_context({"repo": repo_name})
+        if page_callback is not None:
+            page_callback.task.update_state(state="STARTED", meta={"org": org, "repo": repo_name})
+        info = rescan_pull_requests(repo_name, repo_pull_requests, dry_run, earliest, latest, listed=False)
+        if list(info) != ["repo"]:
+            infos[repo_name] = info
+    return infos
@@ -30,23 +30,19 @@ from openedx_webhooks.cla_check import (
     CLA_STATUS_GOOD,
     CLA_STATUS_NO_CONTRIBUTIONS,
     CLA_STATUS_PRIVATE,
-    cla_status_on_pr,
     set_cla_status_on_pr,
 )
-from openedx_webhooks.gh_projects import (
-    add_pull_request_to_project,
-    pull_request_projects,
-)
+from openedx_webhooks.gh_projects import add_pull_request_to_project, project_item_batch
 from openedx_webhooks.info import (
     get_blended_project_id,
     get_bot_comments,
-    get_jira_issue_key,
     get_people_file,
     is_bot_pull_request,
     is_committer_pull_request,
     is_draft_pull_request,
     is_internal_pull_request,
     is_private_repo_no_cla_pull_request,
+    jira_issue_key_from_comments,
     jira_project_for_blended,
     jira_project_for_ospr,
     projects_for_pr,
@@ -60,6 +56,7 @@ from openedx_webhooks.labels import (
 )
 from openedx_webhooks.auth import get_github_session, get_jira_session
 from openedx_webhooks.lib.github.models import PrId
+from openedx_webhooks.pr_snapshot import PrSnapshot, get_pr_snapshot
 from openedx_webhooks.tasks import logger
 from openedx_webhooks.tasks import github_work
 from openedx_webhooks.tasks.jira_work import (
@@ -179,14 +176,24 @@ class PrDesiredInfo:
     cla_check: Optional[Dict[str, str]] = None
 
 
-def current_support_state(pr: PrDict) -> PrCurrentInfo:
+def current_support_state(
+    pr: PrDict,
+    snapshot: Optional[PrSnapshot] = None,
+    jira_issues: Optional[Dict[str, Optional[JiraDict]]] = None,
+) -> PrCurrentInfo:
     """
     Examine the world to determine what the current support state is.
+
+    When rescanning, the GitHub `snapshot` of the pull request and the
+    `jira_issues` (mapping keys to issues, or None if missing) may have been
+    fetched already for many pull requests at once.
     """
     prid = PrId.from_pr_dict(pr)
     current = PrCurrentInfo()
 
-    full_bot_comments = list(get_bot_comments(prid))
+    if snapshot is None:
+        snapshot = get_pr_snapshot(prid)
+    full_bot_comments = snapshot.bot_comments()
     if full_bot_comments:
         current.bot_comment0_text = cast(str, full_bot_comments[0]["body"])
         current.last_seen_state = extract_data_from_comment(current.bot_comment0_text)
@@ -199,11 +206,14 @@ def current_support_state(pr: PrDict) -> PrCurrentInfo:
                     current.bot_survey_comment_id = comment["id"]
         current.all_bot_state.update(extract_data_from_comment(body))
 
-    on_our_jira, jira_id = get_jira_issue_key(prid)
+    on_our_jira, jira_id = jira_issue_key_from_comments(full_bot_comments)
     current.jira_id = current.jira_mentioned_id = jira_id
     current.on_our_jira = on_our_jira
     if current.jira_id and current.on_our_jira:
-        issue = get_jira_issue(current.jira_id, missing_ok=True)
+        if jira_issues is not None and current.jira_id in jira_issues:
+            issue = jira_issues[current.jira_id]
+        else:
+            issue = get_jira_issue(current.jira_id, missing_ok=True)
         if issue is None:
             # Issue has been deleted. Forget about it, and we'll make a new one.
             current.jira_id = None
@@ -221,11 +231,11 @@ def current_support_state(pr: PrDict) -> PrCurrentInfo:
                 for name in JIRA_EXTRA_FIELDS
                 if (value := issue["fields"][custom_fields[name]]) is not None
             }
-    current.github_labels = set(lbl["name"] for lbl in pr["labels"])
-    current.github_projects = set(pull_request_projects(pr))
-    current.cla_check = cla_status_on_pr(pr)
+    current.github_labels = snapshot.labels
+    current.github_projects = snapshot.projects
+    current.cla_check = snapshot.cla_status()
 
-    if current.last_seen_state.get("draft", False) and not is_draft_pull_request(pr):
+    if current.last_seen_state.get("draft", False) and not snapshot.is_draft():
         # It was a draft, but now isn't.  The author acted.
         current.author_acted = True
 
@@ -486,12 +496,13 @@ class PrTrackingFixer:
         # Check the bot comments.
         self.fix_comments(comment_kwargs)
 
-        # Check the GitHub projects.
-        for project in (self.desired.github_projects - self.current.github_projects):
-            self.actions.add_pull_request_to_project(
-                pr_node_id=self.pr["node_id"], project=project
-            )
-            self.happened = True
+        # Check the GitHub projects.  The additions are made together.
+        with project_item_batch():
+            for project in sorted(self.desired.github_projects - self.current.github_projects):
+                self.actions.add_pull_request_to_project(
+                    pr_node_id=self.pr["node_id"], project=project
+                )
+                self.happened = True
 
     def _make_jira_issue(self) -> None:
         """
@@ -0,0 +1,335 @@
+"""
+Throttle our requests to GitHub and Jira so we don't trip their abuse limits.
+
+GitHub has "secondary" rate limits on bursts of requests and on concurrent
+requests, and Jira Cloud answers bursts with 429s.  Each service has classes
+of endpoints ("read", "write", "graphql"), and each class has a token bucket
+(a sustained rate with some burst allowance) and a limit on concurrent
+requests.  With a shared Redis, the buckets and limits are shared by all of
+our processes.
+
+When a service tells us to back off (a 429, or a secondary rate limit 403),
+its Retry-After header blocks that class of requests until the time is up.
+"""
+
+from __future__ import annotations
+
+import collections
+import contextlib
+import dataclasses
+import logging
+import threading
+import time
+import uuid
+from time import sleep as throttle_sleep   # so that we can patch it for tests.
+from typing import Dict, Iterator, Optional, Tuple
+
+import redis
+from urlobject import URLObject
+
+from openedx_webhooks import settings
+from openedx_webhooks.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class ThrottleRate:
+    """
+    The limits for one class of requests.
+    """
+    rate: float             # Sustained requests per second.
+    burst: float            # How many requests can be made at once after a quiet period.
+    concurrency: int        # How many requests can be in flight at once.
+
+    @classmethod
+    def parse(cls, spec: str) -> ThrottleRate:
+        """Parse a "rate:burst:concurrency" spec, like "1.5:10:5"."""
+        rate, burst, concurrency = spec.split(":")
+        return cls(float(rate), float(burst), int(concurrency))
+
+
+def throttle_rate(service: str, endpoint_cls: str) -> ThrottleRate:
+    """
+    Get the rate for a class of endpoints on a service.
+    """
+    return ThrottleRate.parse(settings.THROTTLE_RATES[f"{service}.{endpoint_cls}"])
+
+
+def endpoint_class(service: str, method: str, url: str) -> str:
+    """
+    Which class of endpoint is this request for?
+    """
+    if service == "github" and URLObject(url).path == "/graphql":
+        return "graphql"
+    if method in {"GET", "HEAD", "OPTIONS"}:
+        return "read"
+    return "write"
+
+
+class LocalBuckets:
+    """
+    Token buckets and concurrency slots kept in this process.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Map from bucket key to (tokens, timestamp).
+        self.tokens: Dict[str, Tuple[float, float]] = {}
+        self.blocked_until: Dict[str, float] = {}
+        self.in_flight: Dict[str, int] = collections.Counter()
+        self.slot_freed = threading.Condition(self.lock)
+
+    def reserve(self, key: str, rate: ThrottleRate) -> float:
+        """
+        Take a token from the bucket, returning how long to wait before using it.
+
+        The bucket can go negative, so waiting callers queue up behind each
+        other rather than all retrying at once.
+        """
+        with self.lock:
+            now = time.time()
+            tokens, then = self.tokens.get(key, (rate.burst, now))
+            tokens = min(rate.burst, tokens + (now - then) * rate.rate) - 1
+            self.tokens[key] = (tokens, now)
+            wait = -tokens / rate.rate if tokens < 0 else 0
+            return max(wait, self.blocked_until.get(key, 0) - now)
+
+    def block(self, key: str, seconds: float) -> None:
+        with self.lock:
+            until = time.time() + seconds
+            self.blocked_until[key] = max(until, self.blocked_until.get(key, 0))
+
+    def acquire_slot(self, key: str, rate: ThrottleRate) -> Optional[str]:
+        with self.slot_freed:
+            while self.in_flight[key] >= rate.concurrency:
+                self.slot_freed.wait()
+            self.in_flight[key] += 1
+        return None
+
+    def release_slot(self, key: str, _slot: Optional[str]) -> None:
+        with self.slot_freed:
+            self.in_flight[key] -= 1
+            self.slot_freed.notify()
+
+    def state(self, key: str, rate: ThrottleRate) -> Dict:
+        with self.lock:
+            now = time.time()
+            tokens, then = self.tokens.get(key, (rate.burst, now))
+            return {
+                "tokens": min(rate.burst, tokens + (now - then) * rate.rate),
+                "blocked_for": max(0, self.blocked_until.get(key, 0) - now),
+                "in_flight": self.in_flight[key],
+            }
+
+
+class RedisBuckets:
+    """
+    Token buckets and concurrency slots kept in the shared Redis.
+
+    The bucket math is done in Lua so it's atomic, with Redis's clock so that
+    all of our machines agree on the time.
+    """
+    PREFIX = "openedx-webhooks:throttle:"
+
+    # KEYS: bucket hash.  ARGV: rate, burst.  Returns the wait as a string,
+    # since Lua numbers returned to Redis are truncated to integers.
+    RESERVE_SCRIPT = """\
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'blocked_until')
+        local tokens = tonumber(data[1]) or burst
+        local ts = tonumber(data[2]) or now
+        local blocked_until = tonumber(data[3]) or 0
+        tokens = math.min(burst, tokens + (now - ts) * rate) - 1
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+        redis.call('EXPIRE', KEYS[1], 3600)
+        local wait = 0
+        if tokens < 0 then wait = -tokens / rate end
+        return tostring(math.max(wait, blocked_until - now))
+    """
+
+    # KEYS: bucket hash.  ARGV: seconds.
+    BLOCK_SCRIPT = """\
+        local t = redis.call('TIME')
+        local until_ = tonumber(t[1]) + tonumber(ARGV[1])
+        local cur = tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0
+        if until_ > cur then
+            redis.call('HSET', KEYS[1], 'blocked_until', tostring(until_))
+        end
+        redis.call('EXPIRE', KEYS[1], 3600)
+    """
+
+    # KEYS: slots sorted set.  ARGV: slot id, limit, lease seconds.
+    # Slots are leases that expire, so a crashed process can't hold one forever.
+    ACQUIRE_SCRIPT = """\
+        local t = redis.call('TIME')
+        local now = tonumber(t[1])
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+        if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+            redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+            redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+            return 1
+        end
+        return 0
+    """
+
+    SLOT_LEASE = 120
+    SLOT_POLL = 0.05
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.reserve_script = redis_client.register_script(self.RESERVE_SCRIPT)
+        self.block_script = redis_client.register_script(self.BLOCK_SCRIPT)
+        self.acquire_script = redis_client.register_script(self.ACQUIRE_SCRIPT)
+
+    def reserve(self, key: str, rate: ThrottleRate) -> float:
+        return float(self.reserve_script(keys=[self.PREFIX + key], args=[rate.rate, rate.burst]))
+
+    def block(self, key: str, seconds: float) -> None:
+        self.block_script(keys=[self.PREFIX + key], args=[seconds])
+
+    def acquire_slot(self, key: str, rate: ThrottleRate) -> Optional[str]:
+        slot = uuid.uuid4().hex
+        slots_key = self.PREFIX + key + ":slots"
+        while not self.acquire_script(keys=[slots_key], args=[slot, rate.concurrency, self.SLOT_LEASE]):
+            throttle_sleep(self.SLOT_POLL)
+        return slot
+
+    def release_slot(self, key: str, slot: Optional[str]) -> None:
+        self.redis.zrem(self.PREFIX + key + ":slots", slot)
+
+    def state(self, key: str, rate: ThrottleRate) -> Dict:
+        now = time.time()
+        data = self.redis.hgetall(self.PREFIX + key)
+        tokens = float(data.get(b"tokens", rate.burst))
+        then = float(data.get(b"ts", now))
+        return {
+            "tokens": min(rate.burst, tokens + (now - then) * rate.rate),
+            "blocked_for": max(0, float(data.get(b"blocked_until", 0)) - now),
+            "in_flight": self.redis.zcount(self.PREFIX + key + ":slots", now, "+inf"),
+        }
+
+
+class Throttle:
+    """
+    Throttle the requests to one service.
+
+    If the shared Redis can't be reached, requests go ahead unthrottled
+    rather than fail.
+    """
+    def __init__(self, service: str):
+        self.service = service
+        self.local_buckets = LocalBuckets()
+        self.redis_buckets: Optional[RedisBuckets] = None
+        # How many times, and for how long, we've held back requests.
+        self.throttled_count: Dict[str, int] = collections.Counter()
+        self.throttled_seconds: Dict[str, float] = collections.Counter()
+
+    @property
+    def buckets(self):
+        redis_client = get_redis()
+        if redis_client is None:
+            return self.local_buckets
+        # Made once per client, so that the scripts are only registered once.
+        redis_buckets = self.redis_buckets
+        if redis_buckets is None or redis_buckets.redis is not redis_client:
+            redis_buckets = self.redis_buckets = RedisBuckets(redis_client)
+        return redis_buckets
+
+    def _key(self, endpoint_cls: str) -> str:
+        return f"{self.service}.{endpoint_cls}"
+
+    @contextlib.contextmanager
+    def request_slot(self, method: str, url: str) -> Iterator[None]:
+        """
+        Wait as needed to make a request, and hold a concurrency slot while making it.
+        """
+        endpoint_cls = endpoint_class(self.service, method, url)
+        key = self._key(endpoint_cls)
+        rate = throttle_rate(self.service, endpoint_cls)
+        buckets = self.buckets
+        start = time.time()
+        try:
+            wait = buckets.reserve(key, rate)
+            if wait > 0:
+                if wait > 5:
+                    logger.info(f"Throttling {key} requests for {wait:.1f}s")
+                throttle_sleep(wait)
+            slot = buckets.acquire_slot(key, rate)
+        except redis.RedisError as exc:
+            logger.warning(f"Couldn't throttle {key} requests: {exc}")
+            yield
+            return
+        waited = time.time() - start
+        if wait > 0 or waited > 0.1:
+            self.throttled_count[key] += 1
+            self.throttled_seconds[key] += max(wait, waited)
+        try:
+            yield
+        finally:
+            try:
+                buckets.release_slot(key, slot)
+            except redis.RedisError as exc:
+                logger.warning(f"Couldn't release a {key} request slot: {exc}")
+
+    def observe(self, response) -> None:
+        """
+        Look at a response to see if the service wants us to back off.
+        """
+        retry_after = back_off_seconds(response)
+        if retry_after is not None:
+            request = response.request
+            key = self._key(endpoint_class(self.service, request.method, request.url))
+            logger.warning(f"{self.service} asked us to back off {key} requests for {retry_after}s")
+            try:
+                self.buckets.block(key, retry_after)
+            except redis.RedisError as exc:
+                logger.warning(f"Couldn't record the back-off for {key} requests: {exc}")
+
+    def state(self) -> Dict[str, Dict]:
+        """
+        The current state of all the endpoint classes, for reporting.
+        """
+        states = {}
+        for name in settings.THROTTLE_RATES:
+            service, _, endpoint_cls = name.partition(".")
+            if service != self.service:
+                continue
+            rate = throttle_rate(service, endpoint_cls)
+            state = self.buckets.state(name, rate)
+            state.update(dataclasses.asdict(rate))
+            state["throttled_count"] = self.throttled_count[name]
+            state["throttled_seconds"] = self.throttled_seconds[name]
+            states[name] = state
+        return states
+
+
+def back_off_seconds(response) -> Optional[float]:
+    """
+    How long does this response tell us to back off, or None if it doesn't.
+
+    GitHub signals secondary rate limits with a 403 (or 429) and usually a
+    Retry-After header.  Jira uses 429 and Retry-After.
+    """
+    if response.status_code not in {403, 429}:
+        return None
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    if response.status_code == 429:
+        return settings.THROTTLE_DEFAULT_BACK_OFF
+    if b"secondary rate limit" in response.content:
+        return settings.THROTTLE_DEFAULT_BACK_OFF
+    return None
+
+
+# One throttle per service, shared by all sessions in the process.
+throttles = {
+    "github": Throttle("github"),
+    "jira": Throttle("jira"),
+}
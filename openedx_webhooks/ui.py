@@ -1,9 +1,11 @@
 import logging
 
-from flask import Blueprint, render_template
+from flask import Blueprint, jsonify, render_template, Response
 
 from openedx_webhooks import settings
 from openedx_webhooks.auth import get_github_session, get_jira_session
+from openedx_webhooks.metrics import registry as metrics_registry
+from openedx_webhooks.throttle import throttles
 from openedx_webhooks.utils import requires_auth
 
 ui = Blueprint('ui', __name__)
@@ -38,3 +40,28 @@ def index():
     return render_template("main.html",
         github_username=github_username, jira_username=jira_username,
     )
+
+
+@ui.route("/throttle")
+@requires_auth
+def throttle_state():
+    """
+    Show the state of the request throttles, to see if the bot is holding
+    itself back.  This is for the process handling the request, though the
+    buckets themselves are shared if there's a shared Redis.
+    """
+    return jsonify({
+        service: throttle.state() for service, throttle in throttles.items()
+    })
+
+
+@ui.route("/metrics")
+@requires_auth
+def metrics():
+    """
+    Metrics about our requests to GitHub and Jira, for Prometheus to scrape.
+
+    These are for the process handling the request.  Celery workers push their
+    metrics to the Pushgateway instead.
+    """
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
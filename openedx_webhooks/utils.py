@@ -2,15 +2,22 @@
 Generic utilities.
 """
 
+import collections
+import concurrent.futures
+import contextvars
+import dataclasses
 import functools
 import hmac
+import itertools
+import logging
+import math
 import os
+import re
 import sys
 import time
 from functools import wraps
 from hashlib import sha1
-from time import sleep as retry_sleep   # so that we can patch it for tests.
-from typing import Dict, Optional
+from typing import Dict, Iterable, List, Optional
 
 import cachetools.func
 import requests
@@ -19,6 +26,12 @@ from urlobject import URLObject
 
 from openedx_webhooks import logger, settings
 from openedx_webhooks.auth import get_github_session, get_jira_session
+from openedx_webhooks.json_stream import JsonStream
+from openedx_webhooks.metrics import record_graphql
+from openedx_webhooks.rate_limit import governor as rate_limit_governor
+from openedx_webhooks.retry import (
+    BAD_JSON, GITHUB_REPLICATION_LAG, JIRA_BAD_JSON, JIRA_EMPTY_RESPONSE, with_retries,
+)
 from openedx_webhooks.types import JiraDict
 
 
@@ -70,10 +83,13 @@ def log_check_response(response, raise_for_status=True):
         raise_for_status (bool): if True, call raise_for_status on the response
             also.
     """
-    msg = "Request: {0.method} {0.url}: {0.body!r}".format(response.request)
-    logger.debug(msg)
-    msg = "Response: {0.status_code} {0.reason!r} for {0.url}: {0.content!r}".format(response)
-    logger.debug(msg)
+    if logger.isEnabledFor(logging.DEBUG):
+        # Only format the message if it will be logged, so we don't read
+        # a streamed response body into memory.
+        msg = "Request: {0.method} {0.url}: {0.body!r}".format(response.request)
+        logger.debug(msg)
+        msg = "Response: {0.status_code} {0.reason!r} for {0.url}: {0.content!r}".format(response)
+        logger.debug(msg)
     if raise_for_status:
         try:
             response.raise_for_status()
@@ -84,10 +100,18 @@ def log_check_response(response, raise_for_status=True):
 
 
 def log_rate_limit():
-    """Get stats from GitHub about the current rate limit, and log them."""
-    rate = get_github_session().get("/rate_limit").json()['rate']
-    reset = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(rate['reset']))
-    logger.info(f"Rate limit: {rate['limit']}, used {rate['used']}, remaining {rate['remaining']}. Reset is at {reset}")
+    """
+    Log the current GitHub rate limit.
+
+    This uses the rate limit headers on the responses we've already gotten,
+    so it doesn't cost a request.
+    """
+    for resource, label in [("core", "Rate limit"), ("graphql", "GraphQL rate limit")]:
+        rate = rate_limit_governor.state(resource)
+        if rate is None:
+            continue
+        reset = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(rate.reset))
+        logger.info(f"{label}: {rate.limit}, used {rate.used}, remaining {rate.remaining}. Reset is at {reset}")
 
 
 def is_valid_payload(secret: str, signature: str, payload: bytes) -> bool:
@@ -131,24 +155,13 @@ def retry_get(session, url, **kwargs):
 
     GitHub has been known to send us a pull request event, and then return a
     404 when we ask for the comments on the pull request.  This will retry
-    with a pause to get the real answer.
+    with increasing pauses to get the real answer.
 
     """
-    tries = 10
-    while True:
-        resp = session.get(url, **kwargs)
-        if resp.status_code == 404:
-            tries -= 1
-            if tries == 0:
-                break
-            retry_sleep(.5)
-            continue
-        else:
-            break
-    return resp
+    return with_retries(GITHUB_REPLICATION_LAG, lambda: session.get(url, **kwargs))
 
 
-def paginated_get(url, session=None, limit=None, per_page=100, callback=None, **kwargs):
+def paginated_get(url, session=None, limit=None, per_page=100, callback=None, concurrency=1, stream=False, **kwargs):
     """
     Retrieve all objects from a paginated API.
 
@@ -160,30 +173,139 @@ def paginated_get(url, session=None, limit=None, per_page=100, callback=None, **
     limit has been exceeded.  For example, paginating by 100, if you set a
     limit of 250, three requests will be made, and you'll get 300 objects.
 
+    If `concurrency` is more than 1, and the first response has a "last" link,
+    then the rest of the pages are known up front, and are fetched with up to
+    `concurrency` requests at once.  Objects are still returned in order, and
+    `callback` is still called with each response in order.
+
+    If `stream` is true, each page is decoded incrementally as the objects
+    are consumed, so that a large page doesn't have to be in memory all at
+    once.  (requests already asks for compressed responses, and they are
+    decompressed as they are read.)  Streamed responses aren't cached.
+
     """
+    if stream:
+        kwargs["stream"] = True
     url = URLObject(url).set_query_param('per_page', str(per_page))
     limit = limit or 999999999
     session = session or requests.Session()
     returned = 0
-    while url:
-        resp = retry_get(session, url, **kwargs)
-        log_check_response(resp)
-        if callable(callback):
-            callback(resp)
-        for item in resp.json():
-            yield item
-            returned += 1
-        url = None
-        if resp.links and returned < limit:
-            url = resp.links.get("next", {}).get("url", "")
+    resp = _get_page(session, url, **kwargs)
+    page_urls = _remaining_page_urls(resp, limit, per_page) if concurrency > 1 else None
+    if page_urls is None:
+        while True:
+            if callable(callback):
+                callback(resp)
+            for item in _page_items(resp, stream):
+                yield item
+                returned += 1
+            url = None
+            if resp.links and returned < limit:
+                url = resp.links.get("next", {}).get("url", "")
+            if not url:
+                break
+            resp = _get_page(session, url, **kwargs)
+    else:
+        yield from _concurrent_pages(session, resp, page_urls, concurrency, callback, **kwargs)
+
+
+def _get_page(session, url, **kwargs):
+    """Get one page for paginated_get."""
+    resp = retry_get(session, url, **kwargs)
+    log_check_response(resp)
+    return resp
+
+
+def _page_items(resp, stream=False):
+    """The objects in one page for paginated_get, decoded incrementally if `stream`."""
+    if stream:
+        return JsonStream.from_response(resp).array_items()
+    return resp.json()
+
+
+def _remaining_page_urls(resp, limit, per_page) -> Optional[List[URLObject]]:
+    """
+    Get the URLs of the pages after `resp`, or None if we can't tell what they are.
+
+    Only the pages needed to reach `limit` are included.
+    """
+    last_link = resp.links.get("last")
+    if last_link is None:
+        return None
+    last_url = URLObject(last_link["url"])
+    try:
+        this_page = int(URLObject(resp.url).query_dict.get("page", 1))
+        last_page = int(last_url.query_dict["page"])
+    except (KeyError, ValueError):
+        return None
+    last_page = min(last_page, this_page + math.ceil(limit / per_page) - 1)
+    return [last_url.set_query_param("page", str(page)) for page in range(this_page + 1, last_page + 1)]
+
+
+def _concurrent_pages(session, first_resp, page_urls, concurrency, callback, **kwargs):
+    """
+    Yield the items from `first_resp` and then from `page_urls` fetched concurrently.
+    """
+    def _submit(executor, page_url):
+        # Each page gets a copy of our context, so context variables (like the
+        # rate limit priority) apply to the requests in the threads.
+        ctx = contextvars.copy_context()
+        return executor.submit(ctx.run, _get_page, session, page_url, **kwargs)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    pending: collections.deque = collections.deque()
+    resp = first_resp
+    try:
+        page_urls = iter(page_urls)
+        # Keep a bounded window of pages in flight, so a huge listing doesn't
+        # pile up in memory.
+        pending.extend(
+            _submit(executor, page_url) for page_url in itertools.islice(page_urls, concurrency)
+        )
+        while resp is not None:
+            if callable(callback):
+                callback(resp)
+            yield from _page_items(resp, kwargs.get("stream", False))
+            resp = None
+            if pending:
+                resp = pending.popleft().result()
+                next_url = next(page_urls, None)
+                if next_url is not None:
+                    pending.append(_submit(executor, next_url))
+    finally:
+        # If we're abandoned part way, don't leave requests running behind us:
+        # cancel the pages not started, wait for the rest, and close them all.
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        if resp is not None:
+            resp.close()
+        for future in pending:
+            if not future.cancelled() and future.exception() is None:
+                future.result().close()
+
+
+def _get_json(session, url):
+    """
+    Get a URL, returning the response and its decoded JSON, or BAD_JSON.
+    """
+    resp = session.get(url)
+    try:
+        return resp, resp.json()
+    except ValueError:
+        return resp, BAD_JSON
 
 
 def jira_paginated_get(url, session=None,
                        start=0, start_param="startAt", obj_name=None,
-                       retries=3, debug=False, **fields):
+                       retries=3, debug=False, stream=False, **fields):
     """
     Like ``paginated_get``, but uses JIRA's conventions for a paginated API, which
     are different from Github's conventions.
+
+    If `stream` is true, pages are decoded incrementally, as in
+    ``paginated_get``.  Streamed pages can't be retried if their JSON is bad,
+    since some of their objects have already been produced.
     """
     session = session or requests.Session()
     url = URLObject(url)
@@ -193,44 +315,110 @@ def jira_paginated_get(url, session=None,
             url.set_query_param(start_param, str(start))
                .set_query_params(**fields)
         )
-        for _ in range(retries):
-            try:
-                if debug:
-                    print(result_url, file=sys.stderr)
-                result_resp = session.get(result_url)
+        if debug:
+            print(result_url, file=sys.stderr)
+        if stream:
+            result_resp = session.get(result_url, stream=True)
+            result_resp.raise_for_status()
+            page = JsonStream.from_response(result_resp)
+            objs = page.object_items(obj_name) if obj_name else page.array_items()
+        else:
+            result_resp, result = with_retries(
+                dataclasses.replace(JIRA_BAD_JSON, max_attempts=retries),
+                functools.partial(_get_json, session, result_url),
+            )
+            result_resp.raise_for_status()
+            if result is BAD_JSON:
                 result = result_resp.json()
+            if not result:
                 break
-            except ValueError:
-                continue
-        result_resp.raise_for_status()
-        result = result_resp.json()
-        if not result:
-            break
-        if obj_name:
-            objs = result[obj_name]
-        else:
-            objs = result
+            objs = result[obj_name] if obj_name else result
+        returned = 0
         for obj in objs:
             yield obj
+            returned += 1
         # are we done yet?
-        if isinstance(result, dict):
-            returned = len(objs)
-            total = result["total"]
+        if stream:
+            total = page.fields.get("total") if obj_name else None
+        else:
+            total = result["total"] if isinstance(result, dict) else None
+        if total is not None:
             if start + returned < total:
                 start += returned
             else:
                 more_results = False
         else:
-            # `result` is a list
-            start += len(result)
-            more_results = True  # just keep going until there are no more results.
+            # The result is a list: keep going until there are no more results.
+            start += returned
+            more_results = returned > 0
+
+
+# Asked for by every GraphQL query, so that we know what the queries cost.
+# GraphQL has its own rate limit, counted in points rather than requests.
+GRAPHQL_RATE_LIMIT = """\
+  rateLimit {
+    cost
+    remaining
+    resetAt
+  }
+"""
+
+
+def graphql_query_name(query: str) -> str:
+    """
+    The operation name of a GraphQL query, like "ProjectsForPr".
+    """
+    match = re.match(r"\s*(?:query|mutation)\s+(\w+)", query)
+    return match[1] if match else "anonymous"
+
+
+def graphql_selection_end(query: str) -> int:
+    """
+    The index of the brace closing the first operation's selection set.
+
+    Fragments defined after the operation are skipped, and braces in strings,
+    comments, or variable defaults don't count.
+    """
+    depth = parens = 0
+    pos = 0
+    while pos < len(query):
+        char = query[pos]
+        if char == "#":
+            pos = query.find("\n", pos)
+            if pos == -1:
+                break
+        elif char == '"':
+            # Skip the string, and any escaped quotes in it.
+            pos += 1
+            while pos < len(query) and query[pos] != '"':
+                pos += 2 if query[pos] == "\\" else 1
+        elif char == "(":
+            parens += 1
+        elif char == ")":
+            parens -= 1
+        elif parens == 0 and char == "{":
+            depth += 1
+        elif parens == 0 and char == "}":
+            depth -= 1
+            if depth == 0:
+                return pos
+        pos += 1
+    raise ValueError(f"Couldn't find the selection set of GraphQL query {graphql_query_name(query)}")
 
 
 def graphql_query(query: str, variables: Dict = {}) -> Dict:    # pylint: disable=dangerous-default-value
     """
     Make a GraphQL query against GitHub.
+
+    Queries (but not mutations) also ask for their rate limit cost, which is
+    recorded in the metrics and not returned.
     """
     url = "https://api.github.com/graphql"
+    name = graphql_query_name(query)
+    add_rate_limit = query.lstrip().startswith("query") and "rateLimit" not in query
+    if add_rate_limit:
+        end = graphql_selection_end(query)
+        query = query[:end] + GRAPHQL_RATE_LIMIT + query[end:]
     body = {
         "query": query,
         "variables": variables,
@@ -240,18 +428,26 @@ def graphql_query(query: str, variables: Dict = {}) -> Dict:    # pylint: disabl
     returned = response.json()
     if "errors" in returned and returned["errors"]:
         raise Exception(f"GraphQL error: {returned!r}")
-    return returned["data"]
+    data = returned["data"]
+    rate_limit = data.pop("rateLimit", None) if add_rate_limit else None
+    record_graphql(name, rate_limit)
+    if rate_limit:
+        logger.debug(f"GraphQL {name} cost {rate_limit['cost']}, {rate_limit['remaining']} points remaining")
+    return data
 
 
 # A list of all the memoized functions, so that `clear_memoized_values` can
 # clear them all.
 _memoized_functions = []
 
+def register_cache(cache):
+    """Have `clear_memoized_values` clear `cache`, which has a `cache_clear` method."""
+    _memoized_functions.append(cache)
+    return cache
+
 def memoize(func):
     """Cache the value returned by a function call forever."""
-    func = functools.lru_cache()(func)
-    _memoized_functions.append(func)
-    return func
+    return register_cache(functools.lru_cache()(func))
 
 def memoize_timed(minutes):
     """Cache the value of a function for `minutes` minutes."""
@@ -261,9 +457,7 @@ def memoize_timed(minutes):
         # patch time.monotonic, and we aren't that picky about the time anyway.
         def patchable_timer():
             return time.time()
-        func = cachetools.func.ttl_cache(ttl=60 * minutes, timer=patchable_timer)(func)
-        _memoized_functions.append(func)
-        return func
+        return register_cache(cachetools.func.ttl_cache(ttl=60 * minutes, timer=patchable_timer)(func))
     return _timed
 
 def clear_memoized_values():
@@ -324,16 +518,42 @@ def get_jira_issue(key: str, missing_ok: bool = False) -> Optional[JiraDict]:
     return resp.json()
 
 
+# Jira issues are searched for this many at a time by `get_jira_issues`.
+JIRA_KEYS_PER_SEARCH = 50
+
+
+def get_jira_issues(keys: Iterable[str]) -> Dict[str, Optional[JiraDict]]:
+    """
+    Get the dictionaries for many Jira issues, from their keys.
+
+    The issues are found with JQL searches, `JIRA_KEYS_PER_SEARCH` at a time.
+    Issues that have been moved are found with a search under their new
+    keys, so those (and missing issues) are fetched one by one.
+
+    Returns:
+        A dict mapping each key to its issue, or to None if it is missing.
+
+    """
+    keys = list(dict.fromkeys(keys))
+    found: Dict[str, Optional[JiraDict]] = {}
+    for start in range(0, len(keys), JIRA_KEYS_PER_SEARCH):
+        jql = "key in ({})".format(", ".join(keys[start:start + JIRA_KEYS_PER_SEARCH]))
+        issues = jira_paginated_get(
+            "/rest/api/2/search", session=get_jira_session(), obj_name="issues",
+            # Missing keys are warnings instead of errors.
+            jql=jql, fields="*all", validateQuery="warn",
+        )
+        for issue in issues:
+            found[issue["key"]] = issue
+    return {key: found[key] if key in found else get_jira_issue(key, missing_ok=True) for key in keys}
+
+
 def jira_get(*args, **kwargs):
     """
     JIRA sometimes returns an empty response to a perfectly valid GET request,
     so this will retry it a few times if that happens.
     """
-    for _ in range(3):
-        resp = get_jira_session().get(*args, **kwargs)
-        if resp.content:
-            return resp
-    return get_jira_session().get(*args, **kwargs)
+    return with_retries(JIRA_EMPTY_RESPONSE, lambda: get_jira_session().get(*args, **kwargs))
 
 
 def github_pr_repo(issue):
@@ -7,6 +7,15 @@ being passed as the application instance, like this:
 If celery ever gets this capability, this file can be deleted.
 """
 
+from celery.signals import worker_init
+
 from openedx_webhooks import create_celery_app
+from openedx_webhooks.info import warm_caches
 
 application = create_celery_app(config="worker")
+
+
+@worker_init.connect
+def warm_worker(**kwargs):      # pylint: disable=unused-argument
+    """Before the pool processes are forked, get what they all need."""
+    warm_caches()
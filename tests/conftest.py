@@ -8,6 +8,7 @@ import pytest
 import requests_mock
 
 import openedx_webhooks
+import openedx_webhooks.auth
 import openedx_webhooks.utils
 import openedx_webhooks.info
 from openedx_webhooks import settings
@@ -89,7 +90,7 @@ def fake_github(pytestconfig, mocker, requests_mocker, fake_repo_data):
     the_fake_github.install_mocks(requests_mocker)
     if fraction_404:
         # Make the retry sleep a no-op so it won't slow the tests.
-        mocker.patch("openedx_webhooks.utils.retry_sleep", lambda x: None)
+        mocker.patch("openedx_webhooks.retry.retry_sleep", lambda x: None)
     return the_fake_github
 
 
@@ -115,6 +116,7 @@ def configure_flask_app():
 def reset_all_memoized_functions():
     """Clears the values cached by @memoize before each test. Applied automatically."""
     openedx_webhooks.utils.clear_memoized_values()
+    openedx_webhooks.auth.sessions.reset()
 
 
 @pytest.fixture(params=[
@@ -346,6 +346,9 @@ class FakeGitHub(faker.Faker):
 
         self.cla_statuses: Dict[str, Dict[str, str]] = {}
 
+        # GraphQL rate limit points left.
+        self.graphql_points = 5000
+
     def make_user(self, login: str, **kwargs) -> User:
         u = self.users[login] = User(login, **kwargs)
         return u
@@ -525,7 +528,16 @@ class FakeGitHub(faker.Faker):
         method = getattr(self, f"_graphql_{slug}")
         if method is None:
             raise Exception(f"Unknown GraphQL slug in FakeGitHub: {slug = }")
-        return method(**kwargs)
+        result = method(**kwargs)
+        if "rateLimit" in query:
+            # Every query costs one point here.
+            self.graphql_points -= 1
+            result["data"]["rateLimit"] = {
+                "cost": 1,
+                "remaining": self.graphql_points,
+                "resetAt": "2026-10-17T15:00:00Z",
+            }
+        return result
 
     def _graphql_ProjectsForPr(self, owner: str, name: str, number: int) -> Dict:
         r = self.get_repo(owner, name)
@@ -549,6 +561,121 @@ class FakeGitHub(faker.Faker):
             }
         }
 
+    def _graphql_PrSnapshot(self, owner: str, name: str, number: int) -> Dict:
+        return {"data": {"repository": {"pullRequest": self._graphql_pr_fields(owner, name, number)}}}
+
+    def _graphql_PrSnapshots(self, owner: str, name: str, **numbers) -> Dict:
+        prs = {
+            var.replace("number", "pr"): self._graphql_pr_fields(owner, name, number)
+            for var, number in numbers.items()
+        }
+        return {"data": {"repository": prs}}
+
+    def _graphql_pr_fields(self, owner: str, name: str, number: int) -> Dict:
+        """The PR_FIELDS of a pull request."""
+        r = self.get_repo(owner, name)
+        pr = r.get_pull_request(number)
+        commits = []
+        if pr.commits:
+            status = self.cla_statuses.get(pr.commits[-1])
+            contexts = []
+            if status is not None:
+                contexts.append({
+                    "context": status["context"],
+                    "state": status["state"].upper(),
+                    "description": status.get("description"),
+                    "targetUrl": status.get("target_url"),
+                })
+            commits.append({"commit": {"oid": pr.commits[-1], "status": {"contexts": contexts}}})
+        projects = self._graphql_ProjectsForPr(owner, name, number)["data"]["repository"]["pullRequest"]
+        return {
+            "title": pr.title,
+            "isDraft": pr.draft,
+            "merged": pr.merged,
+            "additions": pr.additions,
+            "deletions": pr.deletions,
+            "labels": {"nodes": [{"name": label} for label in sorted(pr.labels)]},
+            "projectItems": projects["projectItems"],
+            "commits": {"nodes": commits},
+            "comments": self._graphql_comments(pr, 0),
+        }
+
+    def _graphql_PrComments(self, owner: str, name: str, number: int, cursor: str) -> Dict:
+        pr = self.get_repo(owner, name).get_pull_request(number)
+        return {"data": {"repository": {"pullRequest": {"comments": self._graphql_comments(pr, int(cursor))}}}}
+
+    def _graphql_comments(self, pr: PullRequest, start: int) -> Dict:
+        """A page of comments, as GraphQL returns them.  Cursors are indexes."""
+        comments = pr.list_comments()
+        page = comments[start:start + 100]
+        end = start + len(page)
+        return {
+            "totalCount": len(comments),
+            "pageInfo": {"hasNextPage": end < len(comments), "endCursor": str(end)},
+            "nodes": [
+                {"databaseId": com.id, "body": com.body, "author": {"login": com.user.login}}
+                for com in page
+            ],
+        }
+
+    # GitHub search returns at most this many results.
+    search_result_limit = 1000
+
+    def _graphql_OrgPullRequests(self, query: str, cursor: Optional[str] = None) -> Dict:
+        terms = query.split()
+        assert "is:pr" in terms
+        assert "sort:created-asc" in terms
+        org = None
+        created_min = created_max = ""
+        for term in terms:
+            if term.startswith("org:"):
+                org = term[4:]
+            elif term.startswith("created:>="):
+                created_min = term[10:]
+            elif term.startswith("created:<="):
+                created_max = term[10:]
+        open_only = "is:open" in terms
+        prs = []
+        for repo in self.repos.values():
+            if repo.owner != org:
+                continue
+            for pr in repo.list_pull_requests("open" if open_only else "all"):
+                created = pr.created_at.strftime("%Y-%m-%dT%H:%M:%SZ")
+                if created < created_min:
+                    continue
+                if created_max and created[:len(created_max)] > created_max:
+                    continue
+                prs.append((created, pr))
+        prs.sort(key=lambda cpr: cpr[0])
+        start = int(cursor or 0)
+        end = min(start + 100, len(prs), self.search_result_limit)
+        nodes = [
+            {
+                "number": pr.number,
+                "state": "MERGED" if pr.merged else pr.state.upper(),
+                "createdAt": created,
+                "author": {"login": pr.user.login},
+                "repository": {
+                    "name": pr.repo.repo,
+                    "nameWithOwner": pr.repo.full_name,
+                    "owner": {"login": pr.repo.owner},
+                },
+            }
+            for created, pr in prs[start:end]
+        ]
+        return {
+            "data": {
+                "search": {
+                    "issueCount": len(prs),
+                    "pageInfo": {
+                        "hasNextPage": end < min(len(prs), self.search_result_limit),
+                        "endCursor": str(end),
+                    },
+                    "nodes": nodes,
+                }
+            }
+        }
+
     def _graphql_OrgProjectId(self, owner: str, number: int) -> Dict:
         proj_id = f"PROJECT:{owner}.{number}"
         self.project_nodes[proj_id] = (owner, number)
@@ -563,7 +690,13 @@ class FakeGitHub(faker.Faker):
             }
         }
 
-    def _graphql_AddProjectItem(self, projectId: str, prNodeId: str) -> Dict:
-        self.project_items[projectId].add(prNodeId)
-        self.project_items[prNodeId].add(projectId)
-        return {"data": "saul goodman"}
+    def _graphql_AddProjectItems(self, **kwargs) -> Dict:
+        data = {}
+        for i in itertools.count():
+            if f"projectId{i}" not in kwargs:
+                break
+            project_id, pr_node_id = kwargs[f"projectId{i}"], kwargs[f"prNodeId{i}"]
+            self.project_items[project_id].add(pr_node_id)
+            self.project_items[pr_node_id].add(project_id)
+            data[f"add{i}"] = {"item": {"id": f"ITEM:{project_id}:{pr_node_id}"}}
+        return {"data": data}
@@ -285,6 +285,11 @@ class FakeJira(faker.Faker):
         # We only handle certain specific queries.
         if bd_ids := re.findall(r'"Blended Project ID" ~ "(.*?)"', jql):
             issues = [iss for iss in self.issues.values() if iss.blended_project_id in bd_ids]
+        elif match := re.fullmatch(r"key in \((.*)\)", jql):
+            # Missing keys are errors unless validateQuery=warn.
+            assert request.qs["validateQuery"] == ["warn"]
+            found = (self.find_issue(key) for key in match[1].split(", "))
+            issues = [iss for iss in found if iss is not None]
         else:
             # We don't understand this query.
             _context.status_code = 500
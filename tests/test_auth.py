@@ -1,6 +1,7 @@
 import base64
+import os
 
-from openedx_webhooks.auth import get_github_session, get_jira_session
+from openedx_webhooks.auth import get_github_session, get_jira_session, sessions
 from openedx_webhooks.settings import TestSettings
 
 
@@ -20,3 +21,29 @@ def test_get_jira_session(fake_jira):
     basic_auth = base64.b64encode(user_token.encode()).decode()
     assert headers["Authorization"] == f"Basic {basic_auth}"
     assert response.url == f"{TestSettings.JIRA_SERVER}/rest/api/2/field"
+
+
+def test_sessions_are_reused():
+    session = get_github_session()
+    assert get_github_session() is session
+
+
+def test_sessions_depend_on_settings(mocker):
+    session = get_jira_session()
+    mocker.patch("openedx_webhooks.settings.JIRA_SERVER", "https://other.atlassian.net")
+    other_session = get_jira_session()
+    assert other_session is not session
+    assert other_session.base_url == "https://other.atlassian.net"
+
+
+def test_sessions_are_not_shared_after_fork(mocker):
+    session = get_github_session()
+    mocker.patch("os.getpid", return_value=os.getpid() + 1)
+    assert get_github_session() is not session
+
+
+def test_sessions_use_pool_settings(mocker):
+    mocker.patch("openedx_webhooks.settings.HTTP_POOL_MAXSIZE", 17)
+    sessions.reset()
+    adapter = get_github_session().get_adapter("https://api.github.com/user")
+    assert adapter._pool_maxsize == 17
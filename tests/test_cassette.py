@@ -0,0 +1,130 @@
+"""Tests of cassette.py"""
+
+import gzip
+import json
+import os
+
+import pytest
+import requests_mock
+
+from openedx_webhooks import auth
+from openedx_webhooks.auth import get_github_session, get_jira_session
+from openedx_webhooks.cassette import CassetteMiss, get_cassette, save_recording
+
+
+@pytest.fixture
+def cassette_path(tmp_path, mocker):
+    path = str(tmp_path / "cassette.json.gz")
+    mocker.patch("openedx_webhooks.settings.HTTP_CASSETTE_PATH", path)
+    mocker.patch("openedx_webhooks.cassette._cassette", None)
+    mocker.patch("openedx_webhooks.cassette._forked", False)
+    # Cassettes are saved at exit, but the tests save them explicitly.
+    mocker.patch("openedx_webhooks.cassette.atexit.register")
+    return path
+
+
+@pytest.fixture
+def sleeps(mocker):
+    return mocker.patch("openedx_webhooks.cassette.cassette_sleep")
+
+
+def use_mode(mocker, mode):
+    mocker.patch("openedx_webhooks.settings.HTTP_CASSETTE_MODE", mode)
+    auth.sessions.reset()
+
+
+def record_traffic(mocker):
+    """Record some traffic, using requests_mock as the real network."""
+    network = requests_mock.Adapter()
+    network.register_uri("GET", "https://api.github.com/user", [
+        {"json": {"login": "first"}},
+        {"json": {"login": "second"}},
+    ])
+    network.register_uri("GET", "https://api.github.com/repos/an-org/a-repo/pulls/1", json={"number": 1})
+    network.register_uri("POST", "https://test.atlassian.net/rest/api/2/issue", status_code=201, json={"key": "OSPR-1"})
+    mocker.patch("openedx_webhooks.auth.HTTPAdapter", lambda **kwargs: network)
+    use_mode(mocker, "record")
+    assert get_github_session().get("/user").json() == {"login": "first"}
+    assert get_github_session().get("/user").json() == {"login": "second"}
+    get_github_session().get("/repos/an-org/a-repo/pulls/1")
+    get_jira_session().post("/rest/api/2/issue", json={"summary": "Hello"})
+    get_cassette().save()
+    return network
+
+
+def test_record_and_replay(cassette_path, mocker, sleeps):
+    network = record_traffic(mocker)
+    assert network.call_count == 4
+
+    with gzip.open(cassette_path, "rt") as f:
+        data = json.load(f)
+    assert len(data["interactions"]) == 4
+    assert "github_pat_FooBarBaz" not in json.dumps(data)
+
+    mocker.patch("openedx_webhooks.cassette._cassette", None)
+    use_mode(mocker, "replay")
+    assert get_github_session().get("/user").json() == {"login": "first"}
+    assert get_github_session().get("/user").json() == {"login": "second"}
+    # Once a request's responses run out, the last one repeats.
+    assert get_github_session().get("/user").json() == {"login": "second"}
+    resp = get_jira_session().post("/rest/api/2/issue", json={"summary": "Hello"})
+    assert resp.status_code == 201
+    assert resp.json() == {"key": "OSPR-1"}
+    assert network.call_count == 4
+    assert sleeps.call_count == 4
+
+    # A different body is a different request.
+    with pytest.raises(CassetteMiss):
+        get_jira_session().post("/rest/api/2/issue", json={"summary": "Goodbye"})
+
+
+def test_replay_latency_scale(cassette_path, mocker, sleeps):
+    record_traffic(mocker)
+    mocker.patch("openedx_webhooks.cassette._cassette", None)
+    mocker.patch("openedx_webhooks.settings.HTTP_CASSETTE_LATENCY_SCALE", 0)
+    use_mode(mocker, "replay")
+    get_github_session().get("/repos/an-org/a-repo/pulls/1")
+    assert sleeps.call_count == 0
+
+
+def test_replayed_responses_can_be_streamed(cassette_path, mocker, sleeps):
+    record_traffic(mocker)
+    mocker.patch("openedx_webhooks.cassette._cassette", None)
+    use_mode(mocker, "replay")
+    resp = get_github_session().get("/repos/an-org/a-repo/pulls/1", stream=True)
+    assert b"".join(resp.iter_content(3)) == b'{"number": 1}'
+
+
+def test_bad_mode(mocker):
+    use_mode(mocker, "rewind")
+    with pytest.raises(ValueError):
+        get_github_session()
+
+
+def test_recording_is_saved_after_tasks(cassette_path, mocker):
+    network = requests_mock.Adapter()
+    network.register_uri("GET", "https://api.github.com/user", json={"login": "first"})
+    mocker.patch("openedx_webhooks.auth.HTTPAdapter", lambda **kwargs: network)
+    use_mode(mocker, "record")
+    get_github_session().get("/user")
+    assert not os.path.exists(cassette_path)
+    save_recording()
+    with gzip.open(cassette_path, "rt") as f:
+        assert len(json.load(f)["interactions"]) == 1
+
+
+def test_forked_processes_record_their_own_files(cassette_path, mocker):
+    use_mode(mocker, "record")
+    parent = get_cassette()
+    assert parent.path == cassette_path
+    # What a Celery pool process sees after being forked.
+    mocker.patch("openedx_webhooks.cassette._forked", True)
+    child = get_cassette()
+    assert child is not parent
+    assert child.path == cassette_path.replace("cassette.json.gz", f"cassette-{os.getpid()}.json.gz")
+
+    # The child doesn't write its copy of the parent's cassette when it exits.
+    parent.interactions.append({"request": ["GET", "https://example.com", ""]})
+    parent.pid += 1
+    parent.save_at_exit()
+    assert not os.path.exists(cassette_path)
@@ -0,0 +1,371 @@
+"""Tests of data_files.py"""
+
+import json
+import pickle
+import re
+import threading
+
+import pytest
+import redis
+
+from openedx_webhooks.data_files import (
+    CHANGES_CHANNEL, FORGET_CHANNEL, DataFiles, DerivedData, FileDataStore, TimedCache, get_data_store,
+)
+
+HEAD_URL = "https://api.github.com/repos/an-org/data/commits/HEAD"
+# The file is read from the HEAD, or from a particular commit.
+FILE_URL = re.compile(r"https://raw.githubusercontent.com/an-org/data/\w+/things.yaml")
+
+
+@pytest.fixture
+def data_repo(requests_mocker):
+    """A data repo whose HEAD sha and file text can be changed."""
+    class DataRepo:
+        sha = "sha1"
+        text = "one: 1\n"
+
+    requests_mocker.get(HEAD_URL, text=lambda req, ctx: DataRepo.sha)
+    requests_mocker.get(FILE_URL, text=lambda req, ctx: DataRepo.text)
+    return DataRepo
+
+
+def file_reads(requests_mocker):
+    return sum(1 for req in requests_mocker.request_history if FILE_URL.fullmatch(req.url))
+
+
+def test_unchanged_sha_means_no_refetch(data_repo, requests_mocker):
+    files = DataFiles("an-org/data")
+    assert files.read("things.yaml") == "one: 1\n"
+    assert files.refresh() is False
+    assert files.refresh() is False
+    # Once to read it, and once when we first learned the sha.
+    assert file_reads(requests_mocker) == 2
+
+
+def test_changed_file_is_swapped_in(data_repo, requests_mocker):
+    files = DataFiles("an-org/data")
+    calls = []
+    def count_lines():
+        calls.append(1)
+        return len(files.read("things.yaml").splitlines())
+    derived = DerivedData(files, ("things.yaml",), count_lines)
+    files.derived.append(derived)
+
+    assert derived() == 1
+    assert derived() == 1
+    files.refresh()
+    assert len(calls) == 1
+
+    data_repo.sha = "sha2"
+    data_repo.text = "one: 1\ntwo: 2\n"
+    version = files.version
+    assert files.refresh() is True
+    assert files.version == version + 1
+    # The new value was computed by the refresh, not by the reader.
+    assert len(calls) == 2
+    assert derived() == 2
+    assert len(calls) == 2
+
+
+def test_new_sha_same_content_is_not_parsed(data_repo, requests_mocker):
+    files = DataFiles("an-org/data")
+    files.read("things.yaml")
+    files.refresh()
+    version = files.version
+    data_repo.sha = "sha2"
+    assert files.refresh() is False
+    assert files.version == version
+    assert files.head_sha == "sha2"
+
+
+def test_no_sha_falls_back_to_reading_files(data_repo, requests_mocker):
+    requests_mocker.get(HEAD_URL, status_code=500)
+    files = DataFiles("an-org/data")
+    files.read("things.yaml")
+    data_repo.text = "one: 1\ntwo: 2\n"
+    assert files.refresh() is True
+    assert files.read("things.yaml") == "one: 1\ntwo: 2\n"
+    assert file_reads(requests_mocker) == 2
+
+
+def test_refresher_thread(data_repo, mocker):
+    mocker.patch("openedx_webhooks.settings.DATA_FILE_REFRESH_SECONDS", 60)
+    waits = []
+    def fake_wait(self, seconds):
+        waits.append(seconds)
+        if len(waits) > 2:
+            raise SystemExit()
+        if len(waits) == 2:
+            self.changed_locally("sha2")
+    mocker.patch.object(DataFiles, "wait_for_announcement", fake_wait)
+    refreshed = []
+    mocker.patch.object(DataFiles, "refresh", lambda self, sha: refreshed.append(sha))
+    started = mocker.patch("threading.Thread.start")
+
+    files = DataFiles("an-org/data")
+    files.read("things.yaml")
+    files.read("things.yaml")
+    assert started.call_count == 1
+
+    with pytest.raises(SystemExit):
+        files.refresh_forever(60)
+    assert waits == [60, 60, 60]
+    # The second refresh was for an announced commit.
+    assert refreshed == [None, "sha2"]
+
+
+def test_announced_commit_is_read(data_repo, requests_mocker):
+    files = DataFiles("an-org/data")
+    files.read("things.yaml")
+    data_repo.text = "one: 1\ntwo: 2\n"
+    files.announce_change("abc123")
+    assert files.announced.is_set()
+    assert files.refresh(files.announced_sha) is True
+    assert files.read("things.yaml") == "one: 1\ntwo: 2\n"
+    assert requests_mocker.request_history[-1].url == (
+        "https://raw.githubusercontent.com/an-org/data/abc123/things.yaml"
+    )
+    # Announcing it again changes nothing.
+    assert files.refresh("abc123") is False
+    assert file_reads(requests_mocker) == 2
+
+
+@pytest.fixture
+def file_store(tmp_path, mocker):
+    mocker.patch("openedx_webhooks.settings.DATA_FILE_SHARED_CACHE", "file")
+    mocker.patch("openedx_webhooks.settings.DATA_FILE_CACHE_DIR", str(tmp_path))
+    mocker.patch("openedx_webhooks.settings.DATA_FILE_REFRESH_SECONDS", 60)
+    get_data_store.cache_clear()
+    # The tests here don't need the refresher threads.
+    mocker.patch.object(DataFiles, "start_refresher")
+    return get_data_store()
+
+
+def process_data(calls):
+    """What one of our processes has: the files, and a value parsed from them."""
+    files = DataFiles("an-org/data")
+    def count_lines():
+        calls.append(1)
+        return len(files.read("things.yaml").splitlines())
+    derived = DerivedData(files, ("things.yaml",), count_lines)
+    files.derived.append(derived)
+    return files, derived
+
+
+def test_no_file_store_without_a_directory(mocker):
+    mocker.patch("openedx_webhooks.settings.DATA_FILE_SHARED_CACHE", "file")
+    mocker.patch("openedx_webhooks.settings.DATA_FILE_CACHE_DIR", "")
+    get_data_store.cache_clear()
+    assert get_data_store() is None
+
+
+def test_processes_share_data_files(data_repo, requests_mocker, file_store):
+    assert isinstance(file_store, FileDataStore)
+    calls = []
+    _, derived1 = process_data(calls)
+    _, derived2 = process_data(calls)
+    assert derived1() == 1
+    assert derived2() == 1
+    # Downloaded only once, but each process parses it.
+    assert file_reads(requests_mocker) == 1
+    assert len(calls) == 2
+    # Only the text is shared, as JSON.
+    assert json.loads(file_store.get("file:an-org/data:things.yaml"))["text"] == "one: 1\n"
+    assert len(list(file_store.directory.iterdir())) == 1
+
+
+def test_one_process_checks_for_changes(data_repo, requests_mocker, file_store):
+    calls = []
+    files1, derived1 = process_data(calls)
+    files2, derived2 = process_data(calls)
+    derived1()
+    derived2()
+
+    data_repo.sha = "sha2"
+    data_repo.text = "one: 1\ntwo: 2\n"
+    assert files1.refresh() is True
+    assert files2.refresh() is True
+    assert derived1() == 2
+    assert derived2() == 2
+    # Only the first process asked GitHub.
+    assert len([req for req in requests_mocker.request_history if req.url == HEAD_URL]) == 1
+    assert file_reads(requests_mocker) == 2
+    assert len(calls) == 4
+
+    # Nothing new to find until the check has been made again.
+    assert files1.refresh() is False
+    assert files2.refresh() is False
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, mocker):
+    path = tmp_path / "snapshot.json"
+    mocker.patch("openedx_webhooks.settings.DATA_FILE_SNAPSHOT", str(path))
+    mocker.patch("openedx_webhooks.settings.DATA_FILE_REFRESH_SECONDS", 60)
+    mocker.patch.object(DataFiles, "start_refresher")
+    return path
+
+
+def test_restart_uses_snapshot(data_repo, requests_mocker, snapshot_path):
+    calls = []
+    files, derived = process_data(calls)
+    files.warm()
+    assert derived() == 1
+    assert snapshot_path.exists()
+    assert not files.stale
+
+    # The snapshot has only the texts.
+    assert json.loads(snapshot_path.read_text()) == {
+        "repo": "an-org/data", "texts": {"things.yaml": "one: 1\n"},
+    }
+
+    # A restarted process gets the data from the snapshot, and parses it.
+    files, derived = process_data(calls)
+    assert derived() == 1
+    assert file_reads(requests_mocker) == 1
+    assert len(calls) == 2
+    # It will check for changes right away.
+    assert files.stale
+
+    data_repo.sha = "sha2"
+    data_repo.text = "one: 1\ntwo: 2\n"
+    assert files.refresh() is True
+    assert derived() == 2
+    assert len(calls) == 3
+
+    # The snapshot now has the new data.
+    files, derived = process_data(calls)
+    assert derived() == 2
+    assert file_reads(requests_mocker) == 2
+
+
+def test_bad_snapshot_is_ignored(data_repo, requests_mocker, snapshot_path):
+    snapshot_path.write_bytes(pickle.dumps({"repo": "an-org/data", "texts": {"things.yaml": "evil: 1\n"}}))
+    calls = []
+    _, derived = process_data(calls)
+    assert derived() == 1
+    assert file_reads(requests_mocker) == 1
+
+
+def test_no_refresher_while_warming(data_repo, mocker):
+    mocker.patch("openedx_webhooks.settings.DATA_FILE_REFRESH_SECONDS", 60)
+    started = mocker.patch("threading.Thread.start")
+    files, derived = process_data([])
+    files.warm()
+    assert started.call_count == 0
+    derived()
+    files.read("things.yaml")
+    assert started.call_count == 1
+
+
+def test_no_refresher_while_warming_with_a_snapshot(data_repo, tmp_path, mocker):
+    mocker.patch("openedx_webhooks.settings.DATA_FILE_SNAPSHOT", str(tmp_path / "snapshot.json"))
+    mocker.patch("openedx_webhooks.settings.DATA_FILE_REFRESH_SECONDS", 60)
+    started = mocker.patch("threading.Thread.start")
+    files, _ = process_data([])
+    files.warm()
+    assert (tmp_path / "snapshot.json").exists()
+    assert started.call_count == 0
+
+
+def test_one_process_reads_announced_commit(data_repo, requests_mocker, file_store, mocker):
+    sleep = mocker.patch("openedx_webhooks.data_files.refresh_sleep")
+    calls = []
+    files1, derived1 = process_data(calls)
+    files2, derived2 = process_data(calls)
+    derived1()
+    derived2()
+
+    data_repo.text = "one: 1\ntwo: 2\n"
+    assert files1.refresh("sha2") is True
+    assert files2.refresh("sha2") is True
+    assert derived2() == 2
+    # The second process used what the first one read.
+    assert file_reads(requests_mocker) == 2
+    assert len(calls) == 4
+    assert sleep.call_count == 0
+
+
+def test_announced_commit_not_published(data_repo, requests_mocker, file_store, mocker):
+    sleep = mocker.patch("openedx_webhooks.data_files.refresh_sleep")
+    files, derived = process_data([])
+    derived()
+    # Another process said it would read the commit, but never did.
+    file_store.claim("reading:an-org/data:sha2", 60)
+    data_repo.text = "one: 1\ntwo: 2\n"
+    assert files.refresh("sha2") is True
+    assert derived() == 2
+    assert sleep.call_count == 30
+
+
+class StopListening(Exception):
+    """Raised to end listen_for_announcements."""
+
+
+def fake_pubsub(mocker, messages):
+    """
+    A shared Redis whose subscribers get `messages`, (channel, data) pairs,
+    and then lose the connection.
+    """
+    def listen():
+        for channel, data in messages:
+            yield {"channel": channel.encode(), "data": data}
+        raise redis.ConnectionError("Gone")
+    redis_client = mocker.Mock()
+    redis_client.pubsub.return_value.listen = listen
+    mocker.patch("openedx_webhooks.data_files.get_redis", return_value=redis_client)
+    # The listener waits before reconnecting: stop it there instead.
+    mocker.patch("openedx_webhooks.data_files.refresh_sleep", side_effect=StopListening())
+    return redis_client
+
+
+def test_forgetting_is_heard_by_all_processes(mocker):
+    mocker.patch("openedx_webhooks.settings.CATALOG_INFO_TTL", 60)
+    cache = TimedCache("things", "CATALOG_INFO_TTL")
+    cache.set("a-repo", {"thing": 1})
+    cache.set("another-repo", {"thing": 2})
+    # Another process forgets a value, and a commit is announced.
+    redis_client = fake_pubsub(mocker, [
+        (FORGET_CHANNEL, b"things a-repo"),
+        # A message we can't understand doesn't stop the listener.
+        (CHANGES_CHANNEL, b"\xff\xfe"),
+        (CHANGES_CHANNEL, b"an-org/data sha2"),
+    ])
+    files = DataFiles("an-org/data")
+    with pytest.raises(StopListening):
+        files.listen_for_announcements()
+    redis_client.pubsub.return_value.subscribe.assert_called_with(CHANGES_CHANNEL, FORGET_CHANNEL)
+    assert cache.get("a-repo") is None
+    assert cache.get("another-repo") == {"thing": 2}
+    assert files.announced_sha == "sha2"
+
+    cache.forget("another-repo")
+    redis_client.publish.assert_called_with(FORGET_CHANNEL, "things another-repo")
+    assert cache.get("another-repo") is None
+
+
+def test_listener_runs_without_regular_refreshes(data_repo, mocker):
+    # With DATA_FILE_REFRESH_SECONDS=0, announcements are still heard, and
+    # announced commits are read.
+    mocker.patch("openedx_webhooks.data_files.get_redis", return_value=mocker.Mock())
+    started = mocker.patch("threading.Thread.start")
+    threads = mocker.spy(threading, "Thread")
+    files = DataFiles("an-org/data")
+    files.read("things.yaml")
+    assert started.call_count == 2
+    assert {c.kwargs["name"] for c in threads.call_args_list} == {"data-file-refresher", "data-file-listener"}
+
+    waits = []
+    def fake_wait(self, timeout):
+        waits.append(timeout)
+        if len(waits) == 1:
+            self.changed_locally("sha2")
+        elif len(waits) == 3:
+            raise StopListening()
+    mocker.patch.object(DataFiles, "wait_for_announcement", fake_wait)
+    refreshed = mocker.patch.object(DataFiles, "refresh")
+    with pytest.raises(StopListening):
+        files.refresh_forever(None)
+    # No timed checks: only the announced commit was read.
+    assert waits == [None, None, None]
+    refreshed.assert_called_once_with("sha2")
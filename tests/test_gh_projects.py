@@ -1,7 +1,11 @@
 """Tests for gh_projects.py"""
 
+import pytest
+
 from openedx_webhooks.gh_projects import (
+    MAX_ITEMS_PER_MUTATION,
     add_pull_request_to_project,
+    project_item_batch,
     pull_request_projects,
 )
 from openedx_webhooks.lib.github.models import PrId
@@ -26,3 +30,62 @@ def test_adding_pr_to_project(fake_github):
     assert projects == {("myorg", 23), ("anotherorg", 27)}
     assert pr.is_in_project(("myorg", 23))
     assert pr.is_in_project(("anotherorg", 27))
+
+
+def test_project_ids_are_cached(fake_github):
+    repo = fake_github.make_repo("an-org", "a-repo")
+    pr1 = repo.make_pull_request(user="FakeUser")
+    pr2 = repo.make_pull_request(user="FakeUser")
+    add_pull_request_to_project(PrId.from_pr_dict(pr1.as_json()), pr1.node_id, ("myorg", 23))
+    add_pull_request_to_project(PrId.from_pr_dict(pr2.as_json()), pr2.node_id, ("myorg", 23))
+    assert pr1.is_in_project(("myorg", 23))
+    assert pr2.is_in_project(("myorg", 23))
+    assert fake_github.requests_made() == [
+        ("/graphql", "query"),      # OrgProjectId
+        ("/graphql", "mutation"),
+        ("/graphql", "mutation"),
+    ]
+
+
+def test_batched_additions(fake_github):
+    repo = fake_github.make_repo("an-org", "a-repo")
+    prs = [repo.make_pull_request(user="FakeUser") for _ in range(MAX_ITEMS_PER_MUTATION + 5)]
+    with project_item_batch():
+        for pr in prs:
+            prid = PrId.from_pr_dict(pr.as_json())
+            with project_item_batch():
+                add_pull_request_to_project(prid, pr.node_id, ("myorg", 23))
+                add_pull_request_to_project(prid, pr.node_id, ("anotherorg", 27))
+        assert fake_github.requests_made(method="mutation") == []
+        assert not prs[0].is_in_project(("myorg", 23))
+
+    for pr in prs:
+        assert pr.is_in_project(("myorg", 23))
+        assert pr.is_in_project(("anotherorg", 27))
+    # Two project id queries, and enough mutations for all the additions.
+    assert fake_github.requests_made("/graphql") == [("/graphql", "query")] * 2 + [("/graphql", "mutation")] * 3
+
+
+def test_failed_additions_are_raised(fake_github, mocker):
+    repo = fake_github.make_repo("an-org", "a-repo")
+    pr = repo.make_pull_request(user="FakeUser")
+    prid = PrId.from_pr_dict(pr.as_json())
+    mocker.patch("openedx_webhooks.gh_projects.graphql_query", side_effect=[
+        {"organization": {"projectV2": {"id": "P1"}}},
+        Exception("Boom"),
+    ])
+    with pytest.raises(Exception, match="Boom"):
+        with project_item_batch() as items:
+            add_pull_request_to_project(prid, pr.node_id, ("myorg", 23))
+            assert items == [("P1", pr.node_id)]
+
+
+def test_additions_are_made_when_the_block_fails(fake_github):
+    repo = fake_github.make_repo("an-org", "a-repo")
+    pr = repo.make_pull_request(user="FakeUser")
+    prid = PrId.from_pr_dict(pr.as_json())
+    with pytest.raises(ValueError):
+        with project_item_batch():
+            add_pull_request_to_project(prid, pr.node_id, ("myorg", 23))
+            raise ValueError("Something else went wrong")
+    assert pr.is_in_project(("myorg", 23))
@@ -0,0 +1,181 @@
+"""Tests of the GitHub webhook views in github_views.py"""
+
+import hmac
+import json
+from hashlib import sha1
+
+import pytest
+from flask import current_app
+
+from openedx_webhooks.github_views import sniff_action
+from openedx_webhooks.info import get_catalog_info
+from openedx_webhooks.metrics import webhook_duplicates
+
+pytestmark = pytest.mark.usefixtures("fake_repo_data")
+
+SECRET = "the-webhook-secret"
+
+
+@pytest.fixture
+def post_event():
+    """Provide a function to post a signed webhook event to the hook receiver."""
+    current_app.config["GITHUB_WEBHOOKS_SECRET"] = SECRET
+    client = current_app.test_client()
+
+    def _post(event, event_type, delivery_id=None):
+        payload = event if isinstance(event, bytes) else json.dumps(event).encode()
+        signature = "sha1=" + hmac.new(SECRET.encode(), msg=payload, digestmod=sha1).hexdigest()
+        headers = {"X-Hub-Signature": signature, "X-GitHub-Event": event_type}
+        if delivery_id:
+            headers["X-GitHub-Delivery"] = delivery_id
+        return client.post(
+            "/github/hook-receiver",
+            base_url="https://openedx-webhooks.herokuapp.com",
+            data=payload,
+            content_type="application/json",
+            headers=headers,
+        )
+    return _post
+
+
+def push_event(repo, ref, *changed_files):
+    return {
+        "ref": ref,
+        "repository": {"full_name": repo, "default_branch": "master"},
+        "commits": [{"id": "abc123", "added": [], "modified": list(changed_files), "removed": []}],
+        "after": "abc123",
+        "head_commit": {"id": "abc123"},
+        "sender": {"login": "someone"},
+    }
+
+
+def catalog_reads(requests_mocker, repo):
+    url = f"https://raw.githubusercontent.com/{repo}/HEAD/catalog-info.yaml"
+    return sum(1 for req in requests_mocker.request_history if req.url == url)
+
+
+@pytest.mark.parametrize("ref, changed, forgotten", [
+    ("refs/heads/master", ["catalog-info.yaml"], True),
+    ("refs/heads/master", ["README.rst"], False),
+    ("refs/heads/master", ["docs/catalog-info.yaml"], False),
+    ("refs/heads/feature", ["catalog-info.yaml"], False),
+])
+def test_push_forgets_catalog_info(post_event, requests_mocker, ref, changed, forgotten):
+    repo = "openedx/credentials"
+    get_catalog_info(repo)
+    resp = post_event(push_event(repo, ref, *changed), "push")
+    assert resp.status_code == 200
+    get_catalog_info(repo)
+    assert catalog_reads(requests_mocker, repo) == (2 if forgotten else 1)
+
+
+@pytest.mark.parametrize("num_commits, forgotten", [(20, False), (2047, False), (2048, True)])
+def test_long_pushes_forget_catalog_info(post_event, requests_mocker, num_commits, forgotten):
+    # A push listing as many commits as a webhook can hold might have had
+    # more, and we can't tell what they changed.
+    repo = "openedx/credentials"
+    get_catalog_info(repo)
+    event = push_event(repo, "refs/heads/master", "README.rst")
+    event["commits"] *= num_commits
+    post_event(event, "push")
+    get_catalog_info(repo)
+    assert catalog_reads(requests_mocker, repo) == (2 if forgotten else 1)
+
+
+def test_push_to_data_repo_is_announced(post_event, mocker):
+    announce = mocker.patch("openedx_webhooks.data_files.data_files.announce_change")
+    event = push_event("openedx/openedx-webhooks-data", "refs/heads/master", "people.yaml")
+    event["after"] = "1234abcd"
+    resp = post_event(event, "push")
+    assert resp.status_code == 200
+    announce.assert_called_once_with("1234abcd")
+
+    post_event(push_event("openedx/edx-platform", "refs/heads/master", "people.yaml"), "push")
+    assert announce.call_count == 1
+
+
+@pytest.mark.parametrize("event_type", ["check_run", "status", "pull_request_review", "workflow_job"])
+def test_ignored_event_types_are_not_parsed(post_event, mocker, event_type):
+    get_json = mocker.patch("flask.Request.get_json")
+    resp = post_event(b'{"action": "completed", "not even": json', event_type)
+    assert resp.status_code == 202
+    assert get_json.call_count == 0
+
+
+@pytest.mark.parametrize("event_type", [
+    "commit_comment", "discussion_comment", "issue_comment", "pull_request_review_comment",
+])
+def test_comment_events_are_handled(post_event, fake_github, event_type):
+    event = {
+        "action": "created",
+        "comment": {"body": "Hello"},
+        "repository": {"full_name": "an-org/a-repo"},
+        "sender": {"login": "someone"},
+    }
+    resp = post_event(event, event_type)
+    assert resp.status_code == 202
+    assert resp.text == "No thanks"
+
+
+def test_ignored_pr_actions_are_not_parsed(post_event, mocker):
+    get_json = mocker.patch("flask.Request.get_json")
+    resp = post_event(b'{"action":"labeled","number":17, "and the rest": ...', "pull_request")
+    assert resp.status_code == 200
+    assert resp.text == "Nothing for me to do"
+    assert get_json.call_count == 0
+
+
+def pr_opened_event():
+    return {
+        "action": "opened",
+        "number": 17,
+        "pull_request": {"number": 17},
+        "repository": {"full_name": "an-org/a-repo"},
+        "sender": {"login": "someone"},
+    }
+
+
+@pytest.fixture
+def delay(mocker):
+    delay = mocker.patch("openedx_webhooks.github_views.pull_request_changed_task.delay")
+    delay.return_value.id = "the-task-id"
+    return delay
+
+
+def test_pr_actions_are_handled(post_event, delay):
+    resp = post_event(pr_opened_event(), "pull_request")
+    assert resp.status_code == 202
+    assert delay.call_count == 1
+    assert delay.call_args[0][0]["hook_action"] == "opened"
+
+
+@pytest.mark.parametrize("payload, action", [
+    (b'{"action":"opened","number":1}', "opened"),
+    (b'{\n  "action": "ready_for_review",\n  "number": 1\n}', "ready_for_review"),
+    (b'{"number":1,"action":"opened"}', None),
+    (b'{"zen": "Keep it logically awesome."}', None),
+])
+def test_sniff_action(payload, action):
+    assert sniff_action(payload) == action
+
+
+def test_redeliveries_are_dropped(post_event, delay):
+    webhook_duplicates.reset()
+    resp = post_event(pr_opened_event(), "pull_request", delivery_id="delivery-1")
+    assert resp.status_code == 202
+    resp = post_event(pr_opened_event(), "pull_request", delivery_id="delivery-1")
+    assert resp.status_code == 200
+    assert resp.text == "Already received"
+    resp = post_event(pr_opened_event(), "pull_request", delivery_id="delivery-2")
+    assert resp.status_code == 202
+    assert delay.call_count == 2
+    assert webhook_duplicates.get(("pull_request",)) == 1
+
+
+def test_failed_delivery_can_be_redelivered(post_event, delay):
+    delay.side_effect = [Exception("No broker!"), delay.return_value]
+    with pytest.raises(Exception, match="No broker!"):
+        post_event(pr_opened_event(), "pull_request", delivery_id="delivery-1")
+    resp = post_event(pr_opened_event(), "pull_request", delivery_id="delivery-1")
+    assert resp.status_code == 202
+    assert delay.call_count == 2
@@ -0,0 +1,113 @@
+"""Tests of http_cache.py"""
+
+from openedx_webhooks.auth import get_github_session
+from openedx_webhooks.http_cache import (
+    CachedResponse, ConditionalRequestCache, MemoryCacheBackend, RedisCacheBackend,
+)
+
+
+def etag_responses(requests_mocker, url, body, etag='"abc123"'):
+    """Respond to `url` with an ETag, and with a 304 if it's sent back to us."""
+    def _callback(request, context):
+        if request.headers.get("If-None-Match") == etag:
+            context.status_code = 304
+            context.headers["X-RateLimit-Remaining"] = "4000"
+            return None
+        context.headers["ETag"] = etag
+        context.headers["X-RateLimit-Remaining"] = "4001"
+        return body
+    requests_mocker.get(url, json=_callback)
+
+
+def test_revalidated_response_comes_from_cache(requests_mocker):
+    url = "https://api.github.com/repos/an-org/a-repo/labels"
+    etag_responses(requests_mocker, url, [{"name": "bug"}])
+    session = get_github_session()
+
+    resp = session.get("/repos/an-org/a-repo/labels")
+    assert resp.status_code == 200
+    assert resp.json() == [{"name": "bug"}]
+    assert "If-None-Match" not in requests_mocker.request_history[0].headers
+
+    resp = session.get("/repos/an-org/a-repo/labels")
+    assert requests_mocker.request_history[1].headers["If-None-Match"] == '"abc123"'
+    assert resp.status_code == 200
+    assert resp.json() == [{"name": "bug"}]
+    assert resp.from_conditional_cache
+    # The headers from the 304 win.
+    assert resp.headers["X-RateLimit-Remaining"] == "4000"
+
+    assert session.http_cache.stats() == {"hits": 1, "misses": 1, "stores": 1}
+
+
+def test_changed_response_replaces_cache(requests_mocker):
+    url = "https://api.github.com/repos/an-org/a-repo/labels"
+    session = get_github_session()
+    etag_responses(requests_mocker, url, [{"name": "bug"}], etag='"one"')
+    session.get(url)
+    etag_responses(requests_mocker, url, [{"name": "feature"}], etag='"two"')
+    resp = session.get(url)
+    assert resp.json() == [{"name": "feature"}]
+    resp = session.get(url)
+    assert resp.json() == [{"name": "feature"}]
+    assert session.http_cache.stats() == {"hits": 1, "misses": 2, "stores": 2}
+
+
+def test_responses_without_validators_are_not_cached(requests_mocker):
+    requests_mocker.get("https://api.github.com/user", json={"login": "me"})
+    session = get_github_session()
+    session.get("/user")
+    session.get("/user")
+    assert "If-None-Match" not in requests_mocker.request_history[1].headers
+    assert session.http_cache.stats() == {"hits": 0, "misses": 2, "stores": 0}
+
+
+def test_post_requests_are_not_cached(requests_mocker):
+    url = "https://api.github.com/repos/an-org/a-repo/labels"
+    requests_mocker.post(url, json={}, headers={"ETag": '"xyz"'})
+    session = get_github_session()
+    session.post(url, json={"name": "bug"})
+    session.post(url, json={"name": "bug"})
+    assert "If-None-Match" not in requests_mocker.request_history[1].headers
+    assert session.http_cache.stats() == {"hits": 0, "misses": 0, "stores": 0}
+
+
+def test_memory_cache_is_bounded(requests_mocker):
+    session = get_github_session()
+    session.http_cache = ConditionalRequestCache(MemoryCacheBackend(max_bytes=2000))
+    for num in range(10):
+        url = f"https://api.github.com/repos/an-org/a-repo/issues/{num}"
+        requests_mocker.get(url, text="x" * 500, headers={"ETag": f'"{num}"'})
+        session.get(url)
+    entries = session.http_cache.backend.entries
+    assert entries.currsize <= 2000
+    assert len(entries) < 10
+
+
+class DictRedis:
+    """Enough of a Redis client for RedisCacheBackend."""
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):     # pylint: disable=unused-argument
+        self.data[key] = value
+
+
+def test_redis_entries_are_json():
+    redis_client = DictRedis()
+    backend = RedisCacheBackend(redis_client, ttl=60)
+    entry = CachedResponse(
+        etag='"abc"', last_modified=None, status_code=200, reason="OK",
+        headers={"Content-Type": "application/octet-stream"}, content=b"\x00\xffbinary", encoding=None,
+    )
+    backend.set("key", entry)
+    stored = redis_client.data[RedisCacheBackend.PREFIX + "key"]
+    assert stored.startswith(b"{")
+    assert backend.get("key") == entry
+
+    # Anything else in Redis is a miss, never unpickled.
+    redis_client.data[RedisCacheBackend.PREFIX + "key"] = b"\x80\x04not json"
+    assert backend.get("key") is None
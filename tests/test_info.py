@@ -10,6 +10,7 @@ from openedx_webhooks.info import (
     is_committer_pull_request, is_internal_pull_request, is_draft_pull_request,
     pull_request_has_cla,
     get_blended_project_id,
+    forget_catalog_info, get_bot_username, get_catalog_info, get_labels_file, warm_caches,
 )
 
 
@@ -211,3 +212,30 @@ def test_check_people_missing_yaml_fields():
     assert people[user].get('commiter') is None
     assert people[user].get('comments') is None
     assert people[user].get('before') is None
+
+
+def test_warm_caches(fake_github, fake_jira, requests_mocker):
+    warm_caches()
+    requests_mocker.reset_mock()
+    get_people_file()
+    get_labels_file()
+    assert get_bot_username() == "webhook-bot"
+    assert requests_mocker.request_history == []
+
+
+def test_catalog_info_is_cached(requests_mocker, mocker):
+    assert get_catalog_info("openedx/credentials")["metadata"]["name"]
+    # Missing files are cached too.
+    assert get_catalog_info("openedx/no-catalog") == {}
+    get_catalog_info("openedx/credentials")
+    get_catalog_info("openedx/no-catalog")
+    assert len(requests_mocker.request_history) == 2
+
+    forget_catalog_info("openedx/credentials")
+    get_catalog_info("openedx/credentials")
+    assert len(requests_mocker.request_history) == 3
+
+    # After the TTL, the file is read again.
+    mocker.patch("openedx_webhooks.settings.CATALOG_INFO_TTL", 0)
+    get_catalog_info("openedx/no-catalog")
+    assert len(requests_mocker.request_history) == 4
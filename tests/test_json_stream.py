@@ -0,0 +1,79 @@
+"""Tests of json_stream.py"""
+
+import gzip
+import json
+
+import pytest
+import requests
+
+from openedx_webhooks.json_stream import JsonStream
+
+
+def chunked(text, size):
+    """Split `text` into bytes chunks of `size`."""
+    data = text.encode("utf-8")
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+DOCS = [
+    [],
+    [1, 22, 333, -4.5e6, True, False, None, "x"],
+    [{"title": "Fix the thing", "labels": [{"name": "bug"}], "body": None}] * 5,
+    [{"name": "héllo ☃ \U0001F600", "esc": 'a"b\\c,]}'}],
+]
+
+
+@pytest.mark.parametrize("doc", DOCS)
+@pytest.mark.parametrize("size", [1, 2, 7, 1000])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_array_items(doc, size, indent):
+    text = json.dumps(doc, indent=indent, ensure_ascii=False)
+    assert list(JsonStream(chunked(text, size)).array_items()) == doc
+
+
+@pytest.mark.parametrize("size", [1, 5, 1000])
+def test_object_items(size):
+    doc = {"expand": "names", "startAt": 0, "issues": [{"key": "OSPR-1"}, {"key": "OSPR-2"}], "total": 2}
+    stream = JsonStream(chunked(json.dumps(doc), size))
+    assert list(stream.object_items("issues")) == doc["issues"]
+    assert stream.fields == {"expand": "names", "startAt": 0, "total": 2}
+
+
+def test_object_items_missing_array():
+    stream = JsonStream(chunked('{"total": 0}', 3))
+    assert not list(stream.object_items("issues"))
+    assert stream.fields == {"total": 0}
+
+
+def test_items_are_produced_before_the_end():
+    def chunks():
+        yield b'[{"a": 1}, '
+        yield b'{"a": 2}, '
+        raise AssertionError("read too far")
+    items = JsonStream(chunks()).array_items()
+    assert next(items) == {"a": 1}
+
+
+@pytest.mark.parametrize("text", [
+    '[1, 2',
+    '[1, 2}',
+    '{"a": 1]',
+    '[1] [2]',
+    '[{"a": }]',
+    '',
+])
+def test_bad_json(text):
+    with pytest.raises(ValueError):
+        stream = JsonStream(chunked(text, 2))
+        list(stream.object_items("a") if text.startswith("{") else stream.array_items())
+
+
+def test_gzipped_response(requests_mocker):
+    doc = [{"number": n} for n in range(1000)]
+    requests_mocker.get(
+        "https://api.github.com/things",
+        content=gzip.compress(json.dumps(doc).encode()),
+        headers={"Content-Encoding": "gzip"},
+    )
+    resp = requests.get("https://api.github.com/things", stream=True)
+    assert list(JsonStream.from_response(resp).array_items()) == doc
@@ -0,0 +1,120 @@
+"""Tests of metrics.py"""
+
+import re
+import socket
+
+import pytest
+
+from openedx_webhooks import metrics
+from openedx_webhooks.auth import get_github_session, get_jira_session
+from openedx_webhooks.metrics import (
+    Counter, Histogram, Registry, endpoint_template, push_metrics, push_metrics_if_due,
+    task_metrics,
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.registry.reset()
+    yield
+    metrics.registry.reset()
+
+
+@pytest.mark.parametrize("url, template", [
+    ("https://api.github.com/repos/openedx/edx-platform/issues/123/comments", "/repos/{repo}/issues/{n}/comments"),
+    ("https://api.github.com/repos/openedx/edx-platform/pulls?state=open", "/repos/{repo}/pulls"),
+    ("https://api.github.com/repos/openedx/edx-platform/issues/12/labels/open-source-contribution",
+        "/repos/{repo}/issues/{n}/labels/{label}"),
+    ("https://api.github.com/repos/openedx/edx-platform/commits/a1b2c3/status", "/repos/{repo}/commits/{ref}/status"),
+    ("https://api.github.com/repos/openedx/edx-platform/contents/docs/a/b.rst", "/repos/{repo}/contents/{path}"),
+    ("https://api.github.com/orgs/openedx/repos", "/orgs/{name}/repos"),
+    ("https://api.github.com/users/nedbat", "/users/{name}"),
+    ("https://api.github.com/graphql", "/graphql"),
+    ("https://api.github.com/user", "/user"),
+    ("https://test.atlassian.net/rest/api/2/issue/OSPR-1234/transitions", "/rest/api/2/issue/{issue}/transitions"),
+    ("https://test.atlassian.net/rest/api/2/search?jql=foo", "/rest/api/2/search"),
+    ("https://raw.githubusercontent.com/openedx/openedx-webhooks-data/HEAD/people.yaml", "/{repo}/{ref}/people.yaml"),
+])
+def test_endpoint_template(url, template):
+    assert endpoint_template(url) == template
+
+
+def test_rendering():
+    registry = Registry()
+    counter = registry.register(Counter("things_total", "Things.", ["kind"]))
+    histogram = registry.register(Histogram("wait_seconds", "Waits.", ["kind"], buckets=[1, 5]))
+    counter.inc(("big",), 2)
+    counter.inc(('a "quoted"\nkind',))
+    histogram.observe(("big",), 0.5)
+    histogram.observe(("big",), 3)
+    histogram.observe(("big",), 1)
+    registry.register_collector(lambda: [("extra_total", "counter", "Extra.", [({"x": "y"}, 1.5)])])
+    assert registry.render() == (
+        "# HELP things_total Things.\n"
+        "# TYPE things_total counter\n"
+        'things_total{kind="a \\"quoted\\"\\nkind"} 1\n'
+        'things_total{kind="big"} 2\n'
+        "# HELP wait_seconds Waits.\n"
+        "# TYPE wait_seconds histogram\n"
+        'wait_seconds_bucket{kind="big",le="1"} 2\n'
+        'wait_seconds_bucket{kind="big",le="5"} 3\n'
+        'wait_seconds_bucket{kind="big",le="+Inf"} 3\n'
+        'wait_seconds_sum{kind="big"} 4.5\n'
+        'wait_seconds_count{kind="big"} 3\n'
+        "# HELP extra_total Extra.\n"
+        "# TYPE extra_total counter\n"
+        'extra_total{x="y"} 1.5\n'
+    )
+
+
+def test_session_requests_are_recorded(requests_mocker):
+    requests_mocker.get("https://api.github.com/repos/an-org/a-repo/pulls/17", text="x" * 100)
+    requests_mocker.post("https://test.atlassian.net/rest/api/2/issue/OSPR-17/transitions", status_code=204)
+    with task_metrics("openedx_webhooks.tasks.github.pull_request_changed_task"):
+        get_github_session().get("/repos/an-org/a-repo/pulls/17")
+        get_github_session().get("/repos/an-org/a-repo/pulls/17")
+    get_jira_session().post("/rest/api/2/issue/OSPR-17/transitions", json={})
+
+    labels = ("github", "GET", "/repos/{repo}/pulls/{n}", "openedx_webhooks.tasks.github.pull_request_changed_task")
+    assert metrics.http_requests.get(labels + ("200",)) == 2
+    assert metrics.http_duration.count(labels) == 2
+    assert metrics.http_bytes.get(labels) == 200
+    jira_labels = ("jira", "POST", "/rest/api/2/issue/{issue}/transitions", "none")
+    assert metrics.http_requests.get(jira_labels + ("204",)) == 1
+
+    text = metrics.registry.render()
+    assert 'openedx_webhooks_http_requests_total{service="github",method="GET",endpoint="/repos/{repo}/pulls/{n}"' in text
+    assert 'openedx_webhooks_http_cache_total{service="github",result="misses"} 2' in text
+
+
+def test_push_metrics(requests_mocker, mocker):
+    mocker.patch("openedx_webhooks.settings.METRICS_PUSHGATEWAY_URL", "https://push.example.com/")
+    mocker.patch("openedx_webhooks.metrics._last_push", 0)
+    requests_mocker.put(re.compile(r"https://push.example.com/metrics/job/openedx-webhooks-worker/instance/.*"))
+    push_metrics_if_due()
+    push_metrics_if_due()
+    puts = [r for r in requests_mocker.request_history if r.method == "PUT"]
+    assert len(puts) == 1
+    assert puts[0].url.endswith(f"/instance/{socket.gethostname()}-main")
+    assert b"# TYPE openedx_webhooks_http_requests_total counter" in puts[0].body
+
+
+def test_pool_processes_push_by_index(requests_mocker, mocker):
+    # A process replacing a recycled one pushes to the same group.
+    mocker.patch("openedx_webhooks.settings.METRICS_PUSHGATEWAY_URL", "https://push.example.com")
+    requests_mocker.put(re.compile(r"https://push.example.com/metrics/job/openedx-webhooks-worker/instance/.*"))
+    mocker.patch("openedx_webhooks.metrics.current_process").return_value.index = 3
+    push_metrics()
+    # The replacement has a different pid, but the same index.
+    mocker.patch("os.getpid", return_value=99999)
+    push_metrics()
+    assert len(requests_mocker.request_history) == 2
+    urls = {r.url for r in requests_mocker.request_history}
+    assert urls == {
+        f"https://push.example.com/metrics/job/openedx-webhooks-worker/instance/{socket.gethostname()}-3"
+    }
+
+
+def test_no_pushgateway_no_push(requests_mocker):
+    push_metrics_if_due()
+    assert requests_mocker.call_count == 0
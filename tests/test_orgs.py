@@ -0,0 +1,33 @@
+"""Tests of orgs.py"""
+
+import pytest
+
+from openedx_webhooks.info import get_orgs_file, get_orgs_index
+from openedx_webhooks.orgs import OrgsIndex
+
+pytestmark = pytest.mark.usefixtures("fake_repo_data")
+
+
+def test_index_is_built_once():
+    assert get_orgs_index() is get_orgs_index()
+    assert get_orgs_index().orgs is get_orgs_file()
+
+
+def test_aliases():
+    index = get_orgs_index()
+    assert index.org("2U/edX") is index.org("edX")
+    assert index.is_internal("2U/edX", "edx")
+    assert index.is_internal("edX", "openedx")
+    assert not index.is_internal("edX", "someone-else")
+    assert not index.is_internal("OpenCraft", "openedx")
+    assert not index.is_internal("Nobody We Know", "openedx")
+
+
+def test_internal_everywhere():
+    index = OrgsIndex({
+        "Old": {"internal": True},
+        "New": {"internal-ghorgs": ["openedx"]},
+    })
+    assert index.is_internal("Old", "anywhere")
+    assert index.is_internal("New", "openedx")
+    assert not index.is_internal("New", "anywhere")
@@ -0,0 +1,60 @@
+"""Tests of people.py"""
+
+import datetime
+
+import pytest
+
+from openedx_webhooks.info import get_people_file, get_people_index, get_person_certain_time
+from openedx_webhooks.people import CommitRights, PersonHistory
+
+pytestmark = pytest.mark.usefixtures("fake_repo_data")
+
+
+def test_history_matches_layering():
+    # The compiled history agrees with get_person_certain_time, on and
+    # around every "before" date.
+    people = get_people_file()
+    for person in people.values():
+        history = PersonHistory(person)
+        dates = {datetime.date(2010, 1, 1), datetime.date(2030, 1, 1)}
+        for before_date in person.get("before", {}):
+            dates.update(before_date + datetime.timedelta(days=d) for d in (-1, 0, 1))
+        for date in dates:
+            expected = get_person_certain_time(person, datetime.datetime.combine(date, datetime.time(12)))
+            state = history.at(date)
+            assert state.agreement == expected.get("agreement", "none")
+            assert state.institution == expected.get("institution")
+            assert (state.committer is not None) == isinstance(expected.get("committer"), dict)
+
+
+def test_history_without_before():
+    history = PersonHistory({"agreement": "individual"})
+    assert history.dates == []
+    assert history.at(datetime.date(2020, 1, 1)).agreement == "individual"
+
+
+def test_index_is_built_once():
+    index = get_people_index()
+    assert get_people_index() is index
+    assert index.people is get_people_file()
+    assert index.person_at("not-a-person", datetime.date(2020, 1, 1)) is None
+    assert index.person_at("jarv", datetime.date(2014, 1, 1)).institution == "edX"
+
+
+@pytest.mark.parametrize("repo, branch, allowed", [
+    ("openedx/anything", "master", True),
+    ("another/edx-platform", "master", True),
+    ("another/other", "open-release/birch.1", True),
+    ("another/other", "open-release/", True),
+    ("another/other", "release", True),
+    ("another/other", "release-candidate", False),
+    ("another/other", "master", False),
+    ("openedxx/other", "master", False),
+])
+def test_commit_rights(repo, branch, allowed):
+    rights = CommitRights({
+        "orgs": ["openedx"],
+        "repos": ["another/edx-platform"],
+        "branches": ["open-release/*", "release"],
+    })
+    assert rights.allows(repo, branch) == allowed
@@ -0,0 +1,83 @@
+"""Tests of pr_snapshot.py"""
+
+from openedx_webhooks.cla_check import CLA_CONTEXT, CLA_STATUS_GOOD, set_cla_status_on_pr
+from openedx_webhooks.gh_projects import add_pull_request_to_project
+from openedx_webhooks.lib.github.models import PrId
+from openedx_webhooks.pr_snapshot import get_pr_snapshot, get_pr_snapshots
+from openedx_webhooks.tasks.pr_tracking import current_support_state
+
+
+def test_snapshot(fake_github):
+    pr = fake_github.make_pull_request(user="FakeUser", title="Fix the thing", draft=True)
+    pr.set_labels({"open-source-contribution", "needs triage"})
+    pr.add_comment(user="FakeUser", body="Please review!")
+    bot_comment = pr.add_comment(user="webhook-bot", body="Thanks for the pull request")
+    prid = PrId.from_pr_dict(pr.as_json())
+    add_pull_request_to_project(prid, pr.node_id, ("myorg", 23))
+    set_cla_status_on_pr(prid.full_name, prid.number, CLA_STATUS_GOOD)
+
+    snapshot = get_pr_snapshot(prid)
+    assert snapshot.title == "Fix the thing"
+    assert snapshot.is_draft()
+    assert snapshot.labels == {"open-source-contribution", "needs triage"}
+    assert snapshot.projects == {("myorg", 23)}
+    assert snapshot.cla_status() == CLA_STATUS_GOOD
+    assert set(snapshot.statuses) == {CLA_CONTEXT}
+    assert [c["body"] for c in snapshot.comments] == ["Please review!", "Thanks for the pull request"]
+    assert snapshot.bot_comments() == [
+        {"id": bot_comment.id, "body": "Thanks for the pull request", "user": {"login": "webhook-bot"}},
+    ]
+
+
+def test_snapshot_of_bare_pr(fake_github):
+    pr = fake_github.make_pull_request(user="FakeUser")
+    snapshot = get_pr_snapshot(PrId.from_pr_dict(pr.as_json()))
+    assert not snapshot.is_draft()
+    assert snapshot.labels == set()
+    assert snapshot.projects == set()
+    assert snapshot.cla_status() is None
+    assert snapshot.comments == []
+
+
+def test_many_comments(fake_github):
+    pr = fake_github.make_pull_request(user="FakeUser")
+    for i in range(250):
+        pr.add_comment(user="FakeUser", body=f"Comment {i}")
+
+    snapshot = get_pr_snapshot(PrId.from_pr_dict(pr.as_json()))
+    assert [c["body"] for c in snapshot.comments] == [f"Comment {i}" for i in range(250)]
+    assert len(fake_github.requests_made("/graphql")) == 3
+
+
+def test_current_support_state_round_trips(fake_github):
+    pr = fake_github.make_pull_request(user="FakeUser")
+    pr.add_comment(user="webhook-bot", body="See https://other.atlassian.net/browse/OSPR-1234 for details")
+    fake_github.reset_mock()
+
+    current = current_support_state(pr.as_json())
+    assert current.jira_mentioned_id == "OSPR-1234"
+    assert not current.on_our_jira
+    # One query for the pull request, and one to learn who the bot is.
+    assert fake_github.requests_made() == [("/graphql", "query"), ("/user", "GET")]
+
+
+def test_snapshots(fake_github, mocker):
+    mocker.patch("openedx_webhooks.pr_snapshot.SNAPSHOT_BATCH_SIZE", 3)
+    repo = fake_github.make_repo("an-org", "a-repo")
+    prs = [repo.make_pull_request(user="FakeUser", title=f"PR {i}", additions=i) for i in range(7)]
+    prs[3].draft = True
+    prs[3].merged = True
+    for i in range(120):
+        prs[5].add_comment(user="FakeUser", body=f"Comment {i}")
+    fake_github.reset_mock()
+
+    snapshots = get_pr_snapshots("an-org/a-repo", [pr.number for pr in prs])
+    # Three batches, and one more for the rest of the comments on one PR.
+    assert len(fake_github.requests_made("/graphql")) == 4
+    for pr in prs:
+        assert snapshots[pr.number] == get_pr_snapshot(PrId.from_pr_dict(pr.as_json()))
+    assert snapshots[prs[3].number].is_draft()
+    assert len(snapshots[prs[5].number].comments) == 120
+
+    listed = prs[3].as_json(brief=True)
+    assert snapshots[prs[3].number].complete_pull_request(listed) == prs[3].as_json()
@@ -0,0 +1,153 @@
+"""Tests of rate_limit.py"""
+
+import logging
+
+import pytest
+import redis
+from freezegun import freeze_time
+
+from openedx_webhooks.auth import get_github_session
+from openedx_webhooks.rate_limit import (
+    LIVE, LOW, RateLimitGovernor, RateLimitState, RedisRateLimitStore, current_priority,
+    rate_limit_priority, resource_for_url,
+)
+from openedx_webhooks.utils import log_rate_limit
+
+# 2023-05-25 12:00:00 UTC
+NOW = 1685016000
+
+
+def rate_headers(remaining, reset=NOW + 1800, limit=5000, resource="core"):
+    return {
+        "X-RateLimit-Limit": str(limit),
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Used": str(limit - remaining),
+        "X-RateLimit-Reset": str(reset),
+        "X-RateLimit-Resource": resource,
+    }
+
+
+class _response:
+    """Just enough of a response for the governor to observe."""
+    def __init__(self, headers):
+        self.headers = headers
+
+
+@pytest.fixture
+def governor():
+    """A fresh governor, used by the GitHub session."""
+    the_governor = RateLimitGovernor()
+    get_github_session().rate_limit_governor = the_governor
+    return the_governor
+
+
+@pytest.fixture
+def sleeps(mocker):
+    """Record the throttling sleeps instead of sleeping."""
+    return mocker.patch("openedx_webhooks.rate_limit.throttle_sleep")
+
+
+def test_responses_are_observed(requests_mocker, governor):
+    requests_mocker.get("https://api.github.com/user", json={}, headers=rate_headers(4321))
+    requests_mocker.post("https://api.github.com/graphql", json={}, headers=rate_headers(123, resource="graphql"))
+    get_github_session().get("/user")
+    get_github_session().post("/graphql", json={})
+    assert governor.state("core") == RateLimitState("core", 5000, 4321, 679, NOW + 1800)
+    assert governor.state("graphql").remaining == 123
+
+
+def test_out_of_order_responses(governor):
+    governor.observe(_response(rate_headers(100)))
+    governor.observe(_response(rate_headers(150)))
+    assert governor.state().remaining == 100
+    # A new reset period supersedes the old one.
+    governor.observe(_response(rate_headers(4999, reset=NOW + 5400)))
+    assert governor.state().remaining == 4999
+
+
+def test_missing_headers_are_ignored(governor):
+    governor.observe(_response({"Content-Type": "text/plain"}))
+    assert governor.state() is None
+
+
+@freeze_time("2023-05-25 12:00:00")
+@pytest.mark.parametrize("remaining, live_delay, low_delay", [
+    (4000, 0, 0),
+    # The reserve is 1000, pacing starts below 2000.
+    (1800, 0, 1801 / 800),
+    (1000, 0, 1801),
+    (10, 0, 1801),
+    (0, 1801, 1801),
+])
+def test_delays(governor, remaining, live_delay, low_delay):
+    governor.observe(_response(rate_headers(remaining)))
+    assert governor.delay_needed("core", LIVE) == pytest.approx(live_delay)
+    assert governor.delay_needed("core", LOW) == pytest.approx(low_delay)
+
+
+@freeze_time("2023-05-25 12:00:00")
+def test_no_delay_after_reset(governor):
+    governor.observe(_response(rate_headers(0, reset=NOW - 10)))
+    assert governor.delay_needed("core", LOW) == 0
+
+
+@freeze_time("2023-05-25 12:00:00")
+def test_low_priority_requests_pause(requests_mocker, governor, sleeps):
+    requests_mocker.get("https://api.github.com/user", json={}, headers=rate_headers(500))
+    get_github_session().get("/user")
+    assert sleeps.call_count == 0
+    get_github_session().get("/user")
+    assert sleeps.call_count == 0
+    with rate_limit_priority(LOW):
+        get_github_session().get("/user")
+    sleeps.assert_called_once_with(pytest.approx(1801))
+
+
+def test_redis_store_is_made_once(governor, mocker):
+    redis_client = mocker.Mock()
+    mocker.patch("openedx_webhooks.rate_limit.get_redis", return_value=redis_client)
+    store = governor.store
+    assert isinstance(store, RedisRateLimitStore)
+    assert governor.store is store
+    assert redis_client.register_script.call_count == 1
+
+
+def test_redis_errors_let_requests_through(requests_mocker, governor, sleeps, mocker, caplog):
+    redis_client = mocker.Mock()
+    redis_client.hgetall.side_effect = redis.ConnectionError("Gone")
+    redis_client.register_script.return_value.side_effect = redis.ConnectionError("Gone")
+    mocker.patch("openedx_webhooks.rate_limit.get_redis", return_value=redis_client)
+    requests_mocker.get("https://api.github.com/user", json={"login": "me"}, headers=rate_headers(10))
+    with rate_limit_priority(LOW):
+        assert get_github_session().get("/user").json() == {"login": "me"}
+    assert governor.state("core") is None
+    assert sleeps.call_count == 0
+    assert "Couldn't record the GitHub rate limit: Gone" in caplog.text
+
+
+def test_priority_context():
+    assert current_priority() == LIVE
+    with rate_limit_priority(LOW):
+        assert current_priority() == LOW
+    assert current_priority() == LIVE
+
+
+@pytest.mark.parametrize("url, resource", [
+    ("https://api.github.com/repos/openedx/edx-platform/pulls", "core"),
+    ("https://api.github.com/graphql", "graphql"),
+    ("https://api.github.com/search/issues?q=foo", "search"),
+    ("https://raw.githubusercontent.com/openedx/openedx-webhooks-data/HEAD/people.yaml", None),
+])
+def test_resource_for_url(url, resource):
+    assert resource_for_url(url) == resource
+
+
+def test_log_rate_limit_makes_no_request(requests_mocker, mocker, governor, caplog):
+    mocker.patch("openedx_webhooks.utils.rate_limit_governor", governor)
+    requests_mocker.get("https://api.github.com/user", json={}, headers=rate_headers(4321))
+    get_github_session().get("/user")
+    mocker_calls = requests_mocker.call_count
+    with caplog.at_level(logging.INFO):
+        log_rate_limit()
+    assert requests_mocker.call_count == mocker_calls
+    assert "Rate limit: 5000, used 679, remaining 4321." in caplog.text
@@ -7,9 +7,11 @@ import pytest
 
 from openedx_webhooks.info import get_bot_username
 from openedx_webhooks.lib.github.models import PrId
+from openedx_webhooks.pr_search import org_pull_requests
 from openedx_webhooks.tasks.github import (
     pull_request_changed,
     rescan_organization,
+    rescan_pull_requests,
     rescan_repository,
 )
 from openedx_webhooks.bot_comments import github_community_pr_comment
@@ -159,6 +161,69 @@ def test_rescan_repository_date_limits(rescannable_repo, pull_request_changed_fn
     assert prnums == nums
 
 
+def test_rescan_repository_requests(fake_github, fake_jira, pull_request_changed_fn):
+    # Rescanning fetches the state of pull requests in batches, not one by one.
+    repo = fake_github.make_repo("an-org", "a-repo")
+    for num in range(1, 46):
+        repo.make_pull_request(user="tusbar", number=num * 2, created_at=datetime(2019, 2, 1))
+    ret = rescan_repository(repo.full_name, allpr=True)
+    assert len(ret["changed"]) == 45
+
+    fake_github.reset_mock()
+    fake_jira.reset_mock()
+    ret = rescan_repository(repo.full_name, allpr=True)
+    assert "changed" not in ret
+    assert fake_github.requests_made(r"/pulls/\d+$") == []
+    assert fake_github.requests_made(r"/graphql") == [("/graphql", "query")] * 3
+    # Three searches for the Jira issues, and no other Jira requests.
+    assert len(fake_jira.requests_made(r"/search$", "GET")) == 3
+    assert len(fake_jira.requests_made()) == 3
+
+    # The pull requests are complete, as if they had been fetched one by one.
+    prs = [c.args[0] for c in pull_request_changed_fn.call_args_list[-45:]]
+    assert prs[0] == repo.get_pull_request(2).as_json()
+
+
+def test_rescan_processes_batches_as_listed(fake_github, fake_jira, pull_request_changed_fn, mocker):
+    # Pull requests are rescanned a batch at a time as they are listed, not
+    # after the whole listing has been read.
+    mocker.patch("openedx_webhooks.tasks.github.SNAPSHOT_BATCH_SIZE", 2)
+    repo = fake_github.make_repo("an-org", "a-repo")
+    for num in range(1, 6):
+        repo.make_pull_request(user="tusbar", number=num * 2, created_at=datetime(2019, 2, 1))
+
+    listed = []
+    def listing():
+        for pr in repo.pull_requests.values():
+            listed.append(pr.number)
+            yield pr.as_json(brief=True)
+
+    seen = []
+    def changed(pull_request, **kwargs):
+        seen.append(len(listed))
+        return None, False
+    pull_request_changed_fn.side_effect = changed
+    rescan_pull_requests(repo.full_name, listing())
+    assert seen == [2, 2, 4, 4, 5]
+
+
+def test_rescan_project_failures(rescannable_repo, mocker):
+    # Additions to projects are made after each batch, and if they fail, the
+    # failure is reported for the pull requests that needed them.
+    mocker.patch("openedx_webhooks.tasks.github.SNAPSHOT_BATCH_SIZE", 2)
+    add = mocker.patch(
+        "openedx_webhooks.gh_projects.add_project_items",
+        side_effect=[Exception("GitHub is down"), None],
+    )
+    ret = rescan_repository(rescannable_repo.full_name, allpr=True)
+    assert add.call_count == 2
+    failed = {num for num, result in ret["changed"].items() if "GitHub is down" in result}
+    assert len(failed) == 2
+    node_ids = {rescannable_repo.get_pull_request(num).node_id for num in failed}
+    assert {node_id for _, node_id in add.call_args_list[0].args[0]} == node_ids
+    assert set(ret["changed"]) == {102, 106, 108, 110}
+
+
 def test_rescan_blended(fake_github, fake_jira):
     # At one point, we weren't treating epic links right when rescanning, and
     # kept updating the jira issue.
@@ -223,19 +288,53 @@ def rescannable_org(fake_github, fake_jira):
     (True, "2019-06-01", "", [108, 110]),
     (True, "2019-06-01", "2019-06-30", [108]),
 ])
-def test_rescan_organization(rescannable_org, pull_request_changed_fn, allpr, earliest, latest, nums):
-    rescan_organization("org1", allpr=allpr, earliest=earliest, latest=latest)
+@pytest.mark.parametrize("search", [
+    pytest.param(False, id="search:no"),
+    pytest.param(True, id="search:yes"),
+])
+def test_rescan_organization(rescannable_org, pull_request_changed_fn, allpr, earliest, latest, nums, search):
+    rescan_organization("org1", allpr=allpr, earliest=earliest, latest=latest, search=search)
     prs = [PrId.from_pr_dict(c.args[0]) for c in pull_request_changed_fn.call_args_list]
     assert all(prid.org == "org1" for prid in prs)
     assert prs == [PrId(f"org1/{r}", num) for r in ["rep1", "rep2"] for num in nums]
 
 
+def test_rescan_organization_by_search_requests(rescannable_org, fake_github):
+    fake_github.make_repo("org1", "idle1")
+    fake_github.make_repo("org1", "idle2")
+    ret = rescan_organization("org1", allpr=True)
+    assert set(ret) == {"org1/rep1", "org1/rep2"}
+    assert set(ret["org1/rep1"]["changed"]) == {102, 106, 108, 110}
+    # No repos or pull requests were listed.
+    assert fake_github.requests_made(r"/repos$|/pulls$|/pulls\?") == []
+    assert fake_github.requests_made(r"/orgs/") == []
+
+
+def test_org_search_past_result_limit(fake_github, mocker):
+    mocker.patch.object(fake_github, "search_result_limit", 5)
+    repo = fake_github.make_repo("org1", "rep1")
+    for num in range(1, 13):
+        repo.make_pull_request(user="tusbar", number=num, created_at=datetime(2019, 1, num))
+    # Two created at the same moment as the last one returned by a search.
+    repo.make_pull_request(user="tusbar", number=20, created_at=datetime(2019, 1, 5))
+    prs = list(org_pull_requests("org1", allpr=True, earliest="2018-01-01"))
+    assert sorted(pr["number"] for pr in prs) == [*range(1, 13), 20]
+    assert prs[0] == {
+        "number": 1,
+        "url": "https://api.github.com/repos/org1/rep1/pulls/1",
+        "state": "open",
+        "created_at": "2019-01-01T00:00:00Z",
+        "user": {"login": "tusbar"},
+        "base": {"repo": {"name": "rep1", "full_name": "org1/rep1", "owner": {"login": "org1"}}},
+    }
+
+
 def test_rescan_failure(mocker, rescannable_repo):
-    def flaky_pull_request_changed(pr, actions):
+    def flaky_pull_request_changed(pr, actions, **kwargs):
         if pr["number"] == 108:
             return 1/0 # BOOM
         else:
-            return pull_request_changed(pr, actions)
+            return pull_request_changed(pr, actions, **kwargs)
 
     mocker.patch("openedx_webhooks.tasks.github.pull_request_changed", flaky_pull_request_changed)
     ret = rescan_repository(rescannable_repo.full_name, allpr=True)
@@ -0,0 +1,142 @@
+"""Tests of retry.py"""
+
+import pytest
+import requests
+
+from openedx_webhooks.auth import get_github_session
+from openedx_webhooks.retry import (
+    GITHUB_REPLICATION_LAG, RetryPolicy, retry_budget, retry_stats, with_retries,
+)
+from openedx_webhooks.utils import jira_get, jira_paginated_get, retry_get
+
+
+@pytest.fixture
+def sleeps(mocker):
+    """Record the retry sleeps instead of sleeping."""
+    return mocker.patch("openedx_webhooks.retry.retry_sleep")
+
+
+@pytest.fixture(autouse=True)
+def reset_stats():
+    retry_stats.reset()
+    yield
+    retry_stats.reset()
+
+
+def flaky(outcomes):
+    """Make an attempt function that produces `outcomes` in turn."""
+    outcomes = iter(outcomes)
+    def _attempt():
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return _attempt
+
+
+POLICY = RetryPolicy(
+    name="test",
+    max_attempts=4,
+    base_delay=1,
+    max_delay=3,
+    classify=lambda result: "bad" if result == "bad" else None,
+)
+
+
+def test_retries_until_final(sleeps):
+    assert with_retries(POLICY, flaky(["bad", "bad", "good"])) == "good"
+    assert sleeps.call_count == 2
+    assert retry_stats.stats()["retries"] == {"test.bad": 2}
+
+
+def test_gives_up_after_max_attempts(sleeps):
+    assert with_retries(POLICY, flaky(["bad"] * 5)) == "bad"
+    assert sleeps.call_count == 3
+    assert retry_stats.stats()["given_up"] == {"test": 1}
+
+
+def test_backoff_is_exponential_with_jitter(sleeps, mocker):
+    mocker.patch("openedx_webhooks.retry.random.uniform", lambda lo, hi: hi)
+    with_retries(POLICY, flaky(["bad"] * 4))
+    assert [call.args[0] for call in sleeps.call_args_list] == [1, 2, 3]
+
+
+def test_exceptions(sleeps):
+    # Connection problems are retried.
+    attempt = flaky([requests.ConnectionError(), requests.Timeout(), "good"])
+    assert with_retries(POLICY, attempt) == "good"
+    # Other exceptions are final.
+    with pytest.raises(KeyError):
+        with_retries(POLICY, flaky([KeyError(), "good"]))
+    # A retryable exception on the last attempt is raised.
+    with pytest.raises(requests.ConnectionError):
+        with_retries(POLICY, flaky([requests.ConnectionError()] * 4))
+
+
+def test_budget_limits_retries(sleeps, mocker):
+    mocker.patch("openedx_webhooks.retry.random.uniform", lambda lo, hi: hi)
+    with retry_budget(4) as budget:
+        assert with_retries(POLICY, flaky(["bad"] * 4)) == "bad"
+        # 1 and 2 fit in the budget, 3 doesn't.
+        assert sleeps.call_count == 2
+        assert budget.remaining == 1
+        with_retries(POLICY, flaky(["bad", "good"]))
+        assert sleeps.call_count == 3
+    assert retry_stats.stats()["given_up"] == {"test": 1}
+
+
+def test_retry_get(requests_mocker, sleeps):
+    url = "https://api.github.com/repos/an-org/a-repo/pulls/1"
+    requests_mocker.get(url, [
+        {"status_code": 404},
+        {"status_code": 502},
+        {"json": {"number": 1}},
+    ])
+    resp = retry_get(get_github_session(), url)
+    assert resp.json() == {"number": 1}
+    assert retry_stats.stats()["retries"] == {
+        "github_replication_lag.404": 1,
+        "github_replication_lag.502": 1,
+    }
+
+
+def test_retry_get_final_error(requests_mocker, sleeps):
+    url = "https://api.github.com/repos/an-org/a-repo/pulls/1"
+    requests_mocker.get(url, status_code=401)
+    resp = retry_get(get_github_session(), url)
+    assert resp.status_code == 401
+    assert requests_mocker.call_count == 1
+
+
+def test_retry_get_real_404(requests_mocker, sleeps):
+    url = "https://api.github.com/repos/an-org/a-repo/pulls/1"
+    requests_mocker.get(url, status_code=404)
+    resp = retry_get(get_github_session(), url)
+    assert resp.status_code == 404
+    assert requests_mocker.call_count == GITHUB_REPLICATION_LAG.max_attempts
+
+
+def test_jira_get_retries_empty_responses(requests_mocker, sleeps):
+    url = "https://test.atlassian.net/rest/api/2/issue/OSPR-1"
+    requests_mocker.get(url, [{"text": ""}, {"text": ""}, {"json": {"key": "OSPR-1"}}])
+    assert jira_get("/rest/api/2/issue/OSPR-1").json() == {"key": "OSPR-1"}
+    assert retry_stats.stats()["retries"] == {"jira_empty_response.empty": 2}
+
+
+def test_jira_paginated_get_retries_bad_json(requests_mocker, sleeps):
+    url = "https://test.atlassian.net/rest/api/2/search"
+    requests_mocker.get(url, [
+        {"text": "<html>oops</html>"},
+        {"json": {"issues": [{"key": "OSPR-1"}], "total": 1}},
+    ])
+    issues = list(jira_paginated_get(url, obj_name="issues"))
+    assert issues == [{"key": "OSPR-1"}]
+    assert retry_stats.stats()["retries"] == {"jira_bad_json.bad json": 1}
+
+
+def test_jira_paginated_get_gives_up_on_bad_json(requests_mocker, sleeps):
+    url = "https://test.atlassian.net/rest/api/2/search"
+    requests_mocker.get(url, text="<html>oops</html>")
+    with pytest.raises(ValueError):
+        list(jira_paginated_get(url, obj_name="issues", retries=2))
+    assert requests_mocker.call_count == 2
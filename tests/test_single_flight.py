@@ -0,0 +1,93 @@
+"""Tests of single_flight.py"""
+
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from openedx_webhooks.auth import get_github_session
+from openedx_webhooks.single_flight import SingleFlight, request_key
+
+
+def wait_for(condition, timeout=5):
+    """Wait until `condition()` is true."""
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end, "Timed out"
+        time.sleep(.01)
+
+
+def blocked_get(requests_mocker, url, **response):
+    """Mock `url` so that requests to it wait until the returned event is set."""
+    release = threading.Event()
+    def _callback(request, context):
+        release.wait(5)
+        return response.get("json", {})
+    requests_mocker.get(url, json=_callback, status_code=response.get("status_code", 200))
+    return release
+
+
+def test_concurrent_gets_are_shared(requests_mocker):
+    url = "https://api.github.com/user"
+    release = blocked_get(requests_mocker, url, json={"login": "webhook-bot"})
+    session = get_github_session()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+        futures = [executor.submit(session.get, "/user") for _ in range(5)]
+        wait_for(lambda: session.single_flight.stats()["shared"] == 4)
+        release.set()
+        responses = [f.result() for f in futures]
+    assert requests_mocker.call_count == 1
+    assert all(resp.json() == {"login": "webhook-bot"} for resp in responses)
+    # Each caller has its own response object.
+    assert len({id(resp) for resp in responses}) == 5
+    responses[1].headers["X-Mine"] = "yes"
+    assert "X-Mine" not in responses[2].headers
+    assert session.single_flight.stats() == {"made": 1, "shared": 4}
+
+
+def test_sequential_gets_are_not_shared(requests_mocker):
+    requests_mocker.get("https://api.github.com/user", json={})
+    session = get_github_session()
+    session.get("/user")
+    session.get("/user")
+    assert requests_mocker.call_count == 2
+
+
+def test_errors_are_shared():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def _failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("Nope")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, "key", _failing)
+        started.wait(5)
+        follower = executor.submit(flight.do, "key", _failing)
+        wait_for(lambda: flight.stats()["shared"] == 1)
+        release.set()
+        with pytest.raises(ValueError):
+            leader.result()
+        with pytest.raises(ValueError):
+            follower.result()
+
+
+@pytest.mark.parametrize("method, kwargs, shared", [
+    ("GET", {}, True),
+    ("GET", {"params": {"page": 2}, "headers": {"Accept": "text/plain"}}, True),
+    ("POST", {}, False),
+    ("GET", {"stream": True}, False),
+    ("GET", {"auth": ("me", "secret")}, False),
+])
+def test_request_key(method, kwargs, shared):
+    assert (request_key(method, "https://api.github.com/user", kwargs) is not None) == shared
+
+
+def test_request_key_distinguishes_headers():
+    url = "https://api.github.com/user"
+    assert request_key("GET", url, {"headers": {"Accept": "a"}}) != request_key("GET", url, {"headers": {"Accept": "b"}})
+    assert request_key("GET", url, {"params": {"page": 1}}) != request_key("GET", url, {"params": {"page": 2}})
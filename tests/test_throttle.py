@@ -0,0 +1,134 @@
+"""Tests of throttle.py"""
+
+import pytest
+import redis
+from freezegun import freeze_time
+
+from openedx_webhooks.auth import get_github_session, get_jira_session
+from openedx_webhooks.throttle import (
+    RedisBuckets, Throttle, ThrottleRate, back_off_seconds, endpoint_class,
+)
+
+
+@pytest.fixture
+def throttles(mocker):
+    """Fresh throttles, enabled, used by the sessions."""
+    mocker.patch("openedx_webhooks.settings.THROTTLE_ENABLED", True)
+    mocker.patch("openedx_webhooks.settings.THROTTLE_RATES", {
+        "github.read": "2:3:2",
+        "github.write": "1:1:1",
+        "github.graphql": "1:2:1",
+        "jira.read": "1:1:1",
+        "jira.write": "1:1:1",
+    })
+    the_throttles = {"github": Throttle("github"), "jira": Throttle("jira")}
+    get_github_session().throttle = the_throttles["github"]
+    get_jira_session().throttle = the_throttles["jira"]
+    return the_throttles
+
+
+@pytest.fixture
+def sleeps(mocker):
+    """Record the throttling sleeps instead of sleeping."""
+    return mocker.patch("openedx_webhooks.throttle.throttle_sleep")
+
+
+class _response:
+    """Just enough of a response for back_off_seconds."""
+    def __init__(self, status_code, headers=None, content=b""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+
+
+def test_rate_parsing():
+    assert ThrottleRate.parse("1.5:10:5") == ThrottleRate(1.5, 10.0, 5)
+
+
+@pytest.mark.parametrize("service, method, url, cls", [
+    ("github", "GET", "https://api.github.com/repos/openedx/edx-platform/pulls", "read"),
+    ("github", "POST", "https://api.github.com/repos/openedx/edx-platform/issues/1/comments", "write"),
+    ("github", "POST", "https://api.github.com/graphql", "graphql"),
+    ("jira", "PUT", "https://test.atlassian.net/rest/api/2/issue/OSPR-1", "write"),
+    ("jira", "GET", "https://test.atlassian.net/rest/api/2/issue/OSPR-1", "read"),
+])
+def test_endpoint_class(service, method, url, cls):
+    assert endpoint_class(service, method, url) == cls
+
+
+@freeze_time("2023-05-25 12:00:00")
+def test_bursts_then_paces(requests_mocker, throttles, sleeps):
+    requests_mocker.get("https://api.github.com/user", json={})
+    for _ in range(5):
+        get_github_session().get("/user")
+    # Three requests use the burst, then the bucket goes into debt.
+    assert [call.args[0] for call in sleeps.call_args_list] == [pytest.approx(0.5), pytest.approx(1.0)]
+    state = throttles["github"].state()["github.read"]
+    assert state["throttled_count"] == 2
+    assert state["throttled_seconds"] == pytest.approx(1.5)
+    assert state["in_flight"] == 0
+    # Writes have their own bucket.
+    requests_mocker.post("https://api.github.com/user", json={})
+    get_github_session().post("/user")
+    assert sleeps.call_count == 2
+
+
+@freeze_time("2023-05-25 12:00:00")
+def test_retry_after_blocks_the_endpoint_class(requests_mocker, throttles, sleeps):
+    requests_mocker.post(
+        "https://test.atlassian.net/rest/api/2/issue",
+        status_code=429,
+        headers={"Retry-After": "30"},
+    )
+    requests_mocker.get("https://test.atlassian.net/rest/api/2/issue/OSPR-1", json={})
+    requests_mocker.put("https://test.atlassian.net/rest/api/2/issue/OSPR-1", json={})
+    get_jira_session().post("/rest/api/2/issue", json={})
+    assert throttles["jira"].state()["jira.write"]["blocked_for"] == pytest.approx(30)
+    # Reads aren't blocked.
+    get_jira_session().get("/rest/api/2/issue/OSPR-1")
+    assert sleeps.call_count == 0
+    get_jira_session().put("/rest/api/2/issue/OSPR-1", json={})
+    sleeps.assert_called_once_with(pytest.approx(30))
+
+
+def test_disabled_throttle_does_nothing(requests_mocker, throttles, sleeps, mocker):
+    mocker.patch("openedx_webhooks.settings.THROTTLE_ENABLED", False)
+    requests_mocker.get("https://api.github.com/user", json={})
+    for _ in range(10):
+        get_github_session().get("/user")
+    assert sleeps.call_count == 0
+    assert throttles["github"].state()["github.read"]["throttled_count"] == 0
+
+
+def test_redis_buckets_are_made_once(throttles, mocker):
+    redis_client = mocker.Mock()
+    mocker.patch("openedx_webhooks.throttle.get_redis", return_value=redis_client)
+    buckets = throttles["github"].buckets
+    assert isinstance(buckets, RedisBuckets)
+    assert throttles["github"].buckets is buckets
+    assert redis_client.register_script.call_count == 3
+
+
+def test_redis_errors_skip_throttling(requests_mocker, throttles, sleeps, mocker, caplog):
+    redis_client = mocker.Mock()
+    redis_client.register_script.return_value.side_effect = redis.ConnectionError("Gone")
+    mocker.patch("openedx_webhooks.throttle.get_redis", return_value=redis_client)
+    requests_mocker.get("https://api.github.com/user", json={"login": "me"})
+    requests_mocker.post("https://api.github.com/user", status_code=429, headers={"Retry-After": "30"})
+    assert get_github_session().get("/user").json() == {"login": "me"}
+    get_github_session().post("/user")
+    assert sleeps.call_count == 0
+    assert "Couldn't throttle github.read requests: Gone" in caplog.text
+    assert "Couldn't record the back-off for github.write requests: Gone" in caplog.text
+
+
+@pytest.mark.parametrize("status_code, headers, content, seconds", [
+    (200, {"Retry-After": "10"}, b"", None),
+    (429, {"Retry-After": "10"}, b"", 10),
+    (429, {}, b"", 60),
+    (403, {"Retry-After": "5"}, b"", 5),
+    (403, {}, b'{"message": "You have exceeded a secondary rate limit."}', 60),
+    (403, {}, b'{"message": "Resource not accessible by integration"}', None),
+])
+def test_back_off_seconds(status_code, headers, content, seconds):
+    assert back_off_seconds(_response(status_code, headers, content)) == seconds
@@ -1,10 +1,16 @@
 """Tests of code in utils.py"""
 
 import re
+import time
 
 import pytest
 
-from openedx_webhooks.utils import graphql_query, text_summary
+from openedx_webhooks import metrics
+from openedx_webhooks.metrics import task_metrics
+from openedx_webhooks.utils import (
+    GRAPHQL_RATE_LIMIT, get_jira_issues, graphql_query, graphql_query_name, jira_paginated_get, paginated_get,
+    text_summary,
+)
 
 
 @pytest.mark.parametrize("args, summary", [
@@ -27,12 +33,67 @@ def test_good_graphql_query(requests_mocker):
     )
     data = graphql_query("query Something {}")
     assert requests_mocker.request_history[0].json() == {
-        "query": "query Something {}",
+        "query": "query Something {" + GRAPHQL_RATE_LIMIT + "}",
         "variables": {},
     }
     assert data == {"name": "Something", "id": 123}
 
 
+def test_graphql_query_cost(requests_mocker):
+    requests_mocker.post(
+        "https://api.github.com/graphql",
+        json={"data": {
+            "name": "Something",
+            "rateLimit": {"cost": 3, "remaining": 4990, "resetAt": "2026-10-17T15:00:00Z"},
+        }},
+    )
+    metrics.registry.reset()
+    with task_metrics("rescan"):
+        data = graphql_query("query Something {}")
+        graphql_query("query Something {}")
+    assert data == {"name": "Something"}
+    assert metrics.graphql_queries.get(("Something", "rescan")) == 2
+    assert metrics.graphql_cost.get(("Something", "rescan")) == 6
+    assert metrics.graphql_remaining.get(()) == 4990
+    assert metrics.graphql_reset.get(()) == 1792249200
+
+
+def test_graphql_mutation_has_no_cost(requests_mocker):
+    requests_mocker.post("https://api.github.com/graphql", json={"data": {"done": True}})
+    metrics.registry.reset()
+    data = graphql_query("mutation DoIt {}")
+    assert requests_mocker.request_history[0].json()["query"] == "mutation DoIt {}"
+    assert data == {"done": True}
+    assert metrics.graphql_queries.get(("DoIt", "none")) == 1
+    assert metrics.graphql_cost.get(("DoIt", "none")) == 0
+
+
+def test_graphql_rate_limit_goes_in_the_operation(requests_mocker):
+    requests_mocker.post("https://api.github.com/graphql", json={"data": {"viewer": {"login": "me"}}})
+    query = """\
+query Viewer($note: String = "not a } brace") {
+  viewer { ...Who }  # a comment with a } too
+}
+fragment Who on User { login }
+"""
+    graphql_query(query)
+    sent = requests_mocker.request_history[0].json()["query"]
+    assert sent == query.replace(
+        "  # a comment with a } too\n}",
+        "  # a comment with a } too\n" + GRAPHQL_RATE_LIMIT + "}",
+    )
+    assert sent.endswith("fragment Who on User { login }\n")
+
+
+@pytest.mark.parametrize("query, name", [
+    ("query ProjectsForPr (\n  $owner: String!\n) {}", "ProjectsForPr"),
+    ("  mutation AddProjectItem($projectId: ID!) {}", "AddProjectItem"),
+    ("{ viewer { login } }", "anonymous"),
+])
+def test_graphql_query_name(query, name):
+    assert graphql_query_name(query) == name
+
+
 def test_bad_graphql_query(requests_mocker):
     requests_mocker.post(
         "https://api.github.com/graphql",
@@ -40,3 +101,99 @@ def test_bad_graphql_query(requests_mocker):
     )
     with pytest.raises(Exception, match=re.escape("GraphQL error: {'errors': ['You blew it']}")):
         graphql_query("query Something {}", variables={"a":1, "b": 2})
+
+
+def paged_listing(requests_mocker, num_items, per_page=10, last_link=True):
+    """Mock a GitHub-style paginated listing of `num_items` numbers."""
+    url = "https://api.github.com/repos/an-org/a-repo/pulls"
+    last_page = (num_items + per_page - 1) // per_page
+
+    def _callback(request, context):
+        page = int(request.qs.get("page", ["1"])[0])
+        links = []
+        if page < last_page:
+            links.append(f'<{url}?per_page={per_page}&page={page + 1}>; rel="next"')
+            if last_link:
+                links.append(f'<{url}?per_page={per_page}&page={last_page}>; rel="last"')
+        if links:
+            context.headers["Link"] = ", ".join(links)
+        start = (page - 1) * per_page
+        return list(range(start, min(start + per_page, num_items)))
+
+    requests_mocker.get(url, json=_callback)
+    return url
+
+
+@pytest.mark.parametrize("stream", [False, True])
+@pytest.mark.parametrize("concurrency", [1, 4])
+@pytest.mark.parametrize("last_link", [True, False])
+def test_paginated_get(requests_mocker, concurrency, last_link, stream):
+    url = paged_listing(requests_mocker, num_items=95, last_link=last_link)
+    pages_seen = []
+    def callback(resp):
+        pages_seen.append(resp.url)
+    items = list(paginated_get(url, per_page=10, callback=callback, concurrency=concurrency, stream=stream))
+    assert items == list(range(95))
+    assert len(pages_seen) == 10
+    assert pages_seen[0].endswith("per_page=10")
+    assert all(seen.endswith(f"page={n}") for n, seen in enumerate(pages_seen[1:], start=2))
+    assert requests_mocker.call_count == 10
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_paginated_get_limit(requests_mocker, concurrency):
+    url = paged_listing(requests_mocker, num_items=95)
+    items = list(paginated_get(url, per_page=10, limit=25, concurrency=concurrency))
+    assert items == list(range(30))
+    assert requests_mocker.call_count == 3
+
+
+def test_paginated_get_concurrent_abandoned(requests_mocker):
+    url = paged_listing(requests_mocker, num_items=1000)
+    items = paginated_get(url, per_page=10, concurrency=3)
+    assert [next(items) for _ in range(15)] == list(range(15))
+    items.close()
+    # Only a bounded window of pages was fetched ahead.
+    calls = requests_mocker.call_count
+    assert calls <= 2 + 3
+    # Nothing is still running after the listing is closed.
+    time.sleep(0.05)
+    assert requests_mocker.call_count == calls
+
+
+def test_paginated_get_stream_keeps_headers(requests_mocker):
+    url = paged_listing(requests_mocker, num_items=5)
+    items = list(paginated_get(url, stream=True, headers={"Accept": "application/vnd.github+json"}))
+    assert items == list(range(5))
+    ours = [req for req in requests_mocker.request_history if req.url.startswith(url)]
+    assert ours
+    for req in ours:
+        assert req.headers["Accept"] == "application/vnd.github+json"
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_jira_paginated_get(requests_mocker, stream):
+    url = "https://test.atlassian.net/rest/api/2/search"
+    def _callback(request, context):
+        start = int(request.qs["startAt"][0])
+        return {"startAt": start, "total": 7, "issues": [{"key": f"OSPR-{n}"} for n in range(start, min(start + 3, 7))]}
+    requests_mocker.get(url, json=_callback)
+    issues = list(jira_paginated_get(url, obj_name="issues", stream=stream))
+    assert [iss["key"] for iss in issues] == [f"OSPR-{n}" for n in range(7)]
+    assert requests_mocker.call_count == 3
+
+
+def test_get_jira_issues(fake_jira):
+    issues = [fake_jira.make_issue(summary=f"Issue {i}") for i in range(3)]
+    old_key = issues[2].key
+    moved = fake_jira.move_issue(issues[2], "BLENDED")
+    keys = [issues[0].key, "OSPR-99999", issues[1].key, old_key, issues[0].key]
+    found = get_jira_issues(keys)
+    assert list(found) == [issues[0].key, "OSPR-99999", issues[1].key, old_key]
+    assert found[issues[0].key]["fields"]["summary"] == "Issue 0"
+    assert found[issues[1].key]["fields"]["summary"] == "Issue 1"
+    assert found["OSPR-99999"] is None
+    assert found[old_key]["key"] == moved.key
+    # One search, then the moved and missing issues one at a time.
+    assert len(fake_jira.requests_made(r"/search$")) == 1
+    assert len(fake_jira.requests_made(r"/issue/")) == 2